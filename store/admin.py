@@ -1,9 +1,19 @@
+from decimal import Decimal
+
 from django.contrib import admin
+from django.db import transaction
 from django.db.models.query import QuerySet
 from django.http import HttpRequest
-from django.db.models import Count
+from django.db.models import Count, DecimalField, F, OuterRef, Subquery, Sum
+from django.urls import reverse
+from django.utils.html import format_html
+from django.utils.http import urlencode
 
-from store.models import Product, Customer, Collection, Order
+from store.changelist import KeysetChangeList
+from store.changes import record_bulk_product_changes
+from store.counting import ApproximateCountPaginator
+from store.discounts import scaled_price
+from store.models import Product, Customer, Collection, Discount, Order, OrderItem
 
 # Register your models here.
 
@@ -32,19 +42,70 @@ from store.models import Product, Customer, Collection, Order
 # admin.site.register(Order, OrderAdmin)
 
 
+# Changelists of big tables:
+# - the page count comes from a cached/estimated count (store.counting)
+#   and the unfiltered "N total" COUNT(*) is skipped
+# - "next ›" pages by keyset instead of OFFSET (store.changelist)
+# templates/admin/store/pagination.html shows "about N" and the links.
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+
+# Below this many units a product shows as 'Low' in the admin
+LOW_STOCK = 60
+
+
+class StockStatusFilter(admin.SimpleListFilter):
+    """Out / Low / OK on the available stock (ProductQuerySet), filtered
+    in SQL rather than on the annotated label."""
+    title = 'stock status'
+    parameter_name = 'stock'
+
+    def lookups(self, request, model_admin):
+        return [('out', 'Out of stock'), ('low', 'Low'), ('ok', 'OK')]
+
+    def queryset(self, request, queryset):
+        status = {'out': Product.STOCK_OUT, 'low': Product.STOCK_LOW,
+                  'ok': Product.STOCK_IN}.get(self.value())
+        if status is None:
+            return queryset
+        return queryset.stock_status(status, low=LOW_STOCK)
+
+
 # using decorator syntax
 @admin.register(Customer)
-class CustomerAdmin(admin.ModelAdmin):
+class CustomerAdmin(LargeTableAdmin):
     list_display = ('id', 'first_name', 'last_name',
-                    'email', 'phone', 'membership')
+                    'email', 'phone', 'membership', 'orders')
     list_editable = ['phone']
     list_per_page = 5
+    # Served by the (membership, last_name, first_name) index
+    list_filter = ['membership']
+
+    # Link to the order changelist filtered by this customer
+    # (/admin/store/order/?customer__id=5), which is served by the
+    # (customer_id, placed_at DESC) index instead of loading every order
+    # on the customer page
+    @admin.display(description='Orders')
+    def orders(self, customer):
+        url = (
+            reverse('admin:store_order_changelist')
+            + '?'
+            + urlencode({'customer__id': str(customer.id)})
+        )
+        return format_html('<a href="{}">Order history</a>', url)
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(LargeTableAdmin):
     list_display = ('id', 'title', 'price', 'inventory',
                     'inventory_status', 'collection')
+    list_filter = [StockStatusFilter]
+    actions = ['lower_price_10', 'raise_price_10', 'restock_100', 'mark_out_of_stock']
 
     list_select_related = ['collection']
 #   Without list_select_related:
@@ -62,16 +123,54 @@ class ProductAdmin(admin.ModelAdmin):
 #   - ManyToManyField (use list_prefetch_related instead)
 #   - Reverse ForeignKey relationships (use prefetch_related)
 
+    def get_queryset(self, request: HttpRequest) -> QuerySet:
+        # The status is computed by the database for the page's rows,
+        # not in Python per product
+        return super().get_queryset(request).with_stock_status(low=LOW_STOCK)
+
+    # Sorting uses the inventory column (indexed); the label is on the
+    # available stock, so pending ledger entries can put a product out
+    # of order until they are compacted
     @admin.display(ordering='inventory')
     def inventory_status(self, product):
-        if product.inventory < 60:
-            return 'Low'
-        return 'OK'
+        return {Product.STOCK_OUT: 'Out', Product.STOCK_LOW: 'Low'}.get(
+            product.stock_status, 'OK')
+
+    # Bulk actions: ONE UPDATE for all selected products (also with
+    # "select all N"), instead of loading and saving them one by one
+    def update_products(self, request, queryset, message, **changes):
+        with transaction.atomic():
+            # Log before updating: the update may change what the
+            # changelist filter (e.g. ?stock=out) matches
+            record_bulk_product_changes(queryset)
+            count = queryset.update(**changes)
+        self.message_user(request, message.format(count=count))
+
+    @admin.action(description='Lower price by 10%%')
+    def lower_price_10(self, request, queryset):
+        self.update_products(request, queryset, '{count} prices lowered by 10%.',
+                             price=scaled_price(Decimal('-10')))
+
+    @admin.action(description='Raise price by 10%%')
+    def raise_price_10(self, request, queryset):
+        self.update_products(request, queryset, '{count} prices raised by 10%.',
+                             price=scaled_price(Decimal('10')))
+
+    @admin.action(description='Add 100 units to inventory')
+    def restock_100(self, request, queryset):
+        self.update_products(request, queryset, '{count} products restocked.',
+                             inventory=F('inventory') + 100)
+
+    @admin.action(description='Mark as out of stock')
+    def mark_out_of_stock(self, request, queryset):
+        self.update_products(request, queryset, '{count} products marked out of stock.',
+                             inventory=0)
 
 
 @admin.register(Collection)
 class CollectionAdmin(admin.ModelAdmin):
     list_display = ('id', 'title', 'featured_product', 'product_count')
+    list_select_related = ['featured_product']
     search_fields = ['title']  # Adding search functionality by title
     # list_editable = ['featured_product']
 
@@ -105,6 +204,41 @@ class CollectionAdmin(admin.ModelAdmin):
 #       count = collection.products_count  # ✅ No extra query!
 
 
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    # raw_id_fields: an id input instead of a <select> with every product
+    raw_id_fields = ['product']
+    extra = 0
+
+
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
-    list_display = ('id', 'placed_at', 'customer')
+class OrderAdmin(LargeTableAdmin):
+    list_display = ('id', 'placed_at', 'customer', 'total')
+    list_select_related = ['customer']
+    inlines = [OrderItemInline]
+    # Newest first, same order as the customer order history endpoint
+    # (served by the (placed_at DESC, id DESC) index)
+    ordering = ['-placed_at']
+
+    def get_queryset(self, request: HttpRequest) -> QuerySet:
+        # Correlated subquery: only computed for the rows of the page
+        items_total = OrderItem.objects.filter(order=OuterRef('pk')) \
+            .values('order').annotate(total=Sum(F('quantity') * F('unit_price'))) \
+            .values('total')
+        return super().get_queryset(request).annotate(
+            items_total=Subquery(items_total, output_field=DecimalField()))
+
+    @admin.display(description='Total')
+    def total(self, order):
+        return order.items_total or 0
+
+
+@admin.register(Discount)
+class DiscountAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'value', 'product', 'collection',
+                    'starts_at', 'ends_at', 'status', 'product_count')
+    list_filter = ['status', 'kind']
+    list_select_related = ['product', 'collection']
+    raw_id_fields = ['product']
+    # Status and counts are managed by store.discounts (apply/end/sweeper)
+    readonly_fields = ['status', 'product_count', 'applied_at', 'ended_at']
@@ -0,0 +1,265 @@
+import heapq
+import re
+import sys
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+from django.db.models import Count, Sum
+
+from store.caching import catalog_version
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+# Prefixes this short match too many tokens to scan per keystroke, so their
+# best products are precomputed
+SHORT_PREFIX = 2
+# Never look at more index entries than this for one query
+SCAN_LIMIT = 5000
+# Most results one search returns (the API's ?limit= maximum)
+MAX_LIMIT = 50
+# How often (seconds) to check whether another process changed the catalog
+REFRESH_SECONDS = 60
+
+
+def normalize(text: str) -> list[str]:
+    """'Café Crème-Brûlée' -> ['cafe', 'creme', 'brulee']"""
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return TOKEN_RE.findall(text)
+
+
+class PrefixIndex:
+    """
+    In-memory autocomplete index over Product.title.
+
+    `_entries` is a sorted list of (token, product_id). All tokens starting
+    with a prefix form one contiguous slice, found with two binary searches
+    (bisect), so a lookup is O(log n) plus the size of the slice - no SQL,
+    no LIKE '%...%' scan. For 1-2 character prefixes, which match a big part
+    of the catalog, the most popular products are precomputed.
+
+    Popularity = units ordered + times added to a cart, computed when the
+    index is built. The index is built lazily on first use. Products saved
+    or deleted in this process are updated in place once their transaction
+    commits (signals -> add_product/remove_product). Changes made by other
+    processes are only seen through the catalog version (store.caching):
+    at most every REFRESH_SECONDS, the index is rebuilt if it has changed,
+    so they can take that long to show up.
+    """
+
+    def __init__(self, short_top=MAX_LIMIT):
+        self.short_top = short_top
+        self._lock = threading.RLock()
+        self._built = False
+        self._entries = []
+        self._products = {}  # id -> (title, popularity, tokens)
+        self._short = defaultdict(list)  # 'he' -> [(-popularity, id), ...]
+        self._build_seconds = 0.0
+        self._version = None  # catalog version the index was built from
+        self._refresh_at = 0.0
+
+    # ----------------------------------------------------------------
+    # Building and updating
+    # ----------------------------------------------------------------
+
+    def ensure_built(self) -> None:
+        if not self._built:
+            with self._lock:
+                if not self._built:
+                    self.build()
+        elif time.monotonic() >= self._refresh_at:
+            with self._lock:
+                if time.monotonic() < self._refresh_at:
+                    return  # another thread is checking
+                self._refresh_at = time.monotonic() + REFRESH_SECONDS
+            # Rebuilt outside the lock: searches keep using the old index
+            if catalog_version() != self._version:
+                self.build()
+
+    def build(self) -> None:
+        from store.models import CartItem, OrderItem, Product
+        from store.sharding import cart_shards
+
+        started = time.monotonic()
+        # Read first: a change made while building triggers another build
+        version = catalog_version()
+        popularity = defaultdict(int)
+        ordered = (OrderItem.objects.order_by().values('product_id')
+                   .annotate(total=Sum('quantity')).values_list('product_id', 'total'))
+        rows = list(ordered)
+        for alias in cart_shards():  # cart lines may be on several databases
+            rows += (CartItem.objects.using(alias).order_by().values('product_id')
+                     .annotate(total=Count('id')).values_list('product_id', 'total'))
+        for product_id, total in rows:
+            popularity[product_id] += total or 0
+
+        products = {}
+        entries = []
+        for product_id, title in Product.objects.values_list('id', 'title').iterator():
+            tokens = tuple(dict.fromkeys(normalize(title)))
+            products[product_id] = (title, popularity[product_id], tokens)
+            entries.extend((token, product_id) for token in tokens)
+        entries.sort()
+
+        with self._lock:
+            self._products = products
+            self._entries = entries
+            self._short = defaultdict(list)
+            for product_id in products:
+                self._add_short(product_id)
+            self._built = True
+            self._build_seconds = time.monotonic() - started
+            self._version = version
+            self._refresh_at = time.monotonic() + REFRESH_SECONDS
+
+    def add_product(self, product_id, title) -> None:
+        """Add or update one product (post_save). No-op until built."""
+        if not self._built:
+            return
+        with self._lock:
+            popularity = 0
+            shrunk = set()
+            if product_id in self._products:
+                popularity = self._products[product_id][1]
+                shrunk = self._remove(product_id)
+            tokens = tuple(dict.fromkeys(normalize(title)))
+            self._products[product_id] = (title, popularity, tokens)
+            for token in tokens:
+                insort(self._entries, (token, product_id))
+            self._add_short(product_id)
+            # Lists the product is back in are full again
+            self._refill_short(shrunk - self._short_prefixes(tokens))
+
+    def remove_product(self, product_id) -> None:
+        if not self._built:
+            return
+        with self._lock:
+            if product_id in self._products:
+                shrunk = self._remove(product_id)
+                del self._products[product_id]
+                self._refill_short(shrunk)
+
+    def _remove(self, product_id) -> set:
+        """Take the product out of the index. Returns the short prefixes
+        whose full top list lost it (see _refill_short)."""
+        _, _, tokens = self._products[product_id]
+        for token in tokens:
+            position = bisect_left(self._entries, (token, product_id))
+            if position < len(self._entries) and self._entries[position] == (token, product_id):
+                del self._entries[position]
+        shrunk = set()
+        for prefix in self._short_prefixes(tokens):
+            best = self._short[prefix]
+            remaining = [item for item in best if item[1] != product_id]
+            if len(remaining) < len(best) and len(best) == self.short_top:
+                shrunk.add(prefix)
+            self._short[prefix] = remaining
+        return shrunk
+
+    def _refill_short(self, prefixes) -> None:
+        """
+        Recompute the top list of `prefixes` from `_entries`. A full list
+        that lost a product may be missing the next best one, which is
+        only known to the long index; this reads the prefix's slice, so it
+        is only done for lists that were full.
+        """
+        for prefix in prefixes:
+            start = bisect_left(self._entries, (prefix,))
+            end = bisect_left(self._entries, (prefix + '\uffff',))
+            product_ids = {product_id for _, product_id in self._entries[start:end]}
+            self._short[prefix] = heapq.nsmallest(
+                self.short_top,
+                ((-self._products[product_id][1], product_id) for product_id in product_ids))
+
+    def _add_short(self, product_id) -> None:
+        _, popularity, tokens = self._products[product_id]
+        for prefix in self._short_prefixes(tokens):
+            best = self._short[prefix]
+            insort(best, (-popularity, product_id))
+            del best[self.short_top:]
+
+    def _short_prefixes(self, tokens) -> set:
+        return {token[:length] for token in tokens
+                for length in range(1, SHORT_PREFIX + 1) if len(token) >= length}
+
+    # ----------------------------------------------------------------
+    # Searching
+    # ----------------------------------------------------------------
+
+    def search(self, query: str, limit: int = 10) -> list[dict]:
+        """
+        Products whose title has a token starting with every query token,
+        most popular first: 'wire hea' finds 'Wireless Headphones'.
+        """
+        tokens = normalize(query)
+        if not tokens:
+            return []
+        self.ensure_built()
+        with self._lock:
+            if len(tokens) == 1 and len(tokens[0]) <= SHORT_PREFIX:
+                matches = [product_id for _, product_id in self._short.get(tokens[0], [])]
+            else:
+                matches = self._candidates(tokens)
+            best = heapq.nsmallest(
+                limit, matches,
+                key=lambda product_id: (-self._products[product_id][1],
+                                        self._products[product_id][0]))
+            return [{'id': product_id, 'title': self._products[product_id][0]}
+                    for product_id in best]
+
+    def _candidates(self, tokens) -> set:
+        """
+        Ids of products matching every query token. Each token's slice of
+        `_entries` becomes a set and the sets are intersected, smallest
+        first. A slice longer than SCAN_LIMIT (a very common prefix) is not
+        turned into a set: the few products left are checked directly. If
+        even the smallest slice is that long, only its first SCAN_LIMIT
+        entries are considered - the user will type another letter anyway.
+        """
+        ranges = []
+        for token in set(tokens):
+            start = bisect_left(self._entries, (token,))
+            end = bisect_left(self._entries, (token + '\uffff',))
+            ranges.append((end - start, start, token))
+        ranges.sort()
+        size, start, _ = ranges[0]
+        matches = {product_id for _, product_id in
+                   self._entries[start:start + min(size, SCAN_LIMIT)]}
+        for size, start, token in ranges[1:]:
+            if not matches:
+                break
+            if size <= SCAN_LIMIT:
+                matches &= {product_id for _, product_id in self._entries[start:start + size]}
+            else:
+                matches = {product_id for product_id in matches
+                           if any(word.startswith(token) for word in self._products[product_id][2])}
+        return matches
+
+    # ----------------------------------------------------------------
+    # Reporting
+    # ----------------------------------------------------------------
+
+    def stats(self) -> dict:
+        """Size of the index, including an estimate of its memory use."""
+        self.ensure_built()
+        with self._lock:
+            size = sys.getsizeof(self._entries) + sys.getsizeof(self._products)
+            size += sum(sys.getsizeof(entry) for entry in self._entries)
+            for title, popularity, tokens in self._products.values():
+                size += sys.getsizeof(title) + sys.getsizeof(tokens)
+                size += sum(sys.getsizeof(token) for token in tokens)
+            size += sys.getsizeof(self._short)
+            size += sum(sys.getsizeof(best) + sum(sys.getsizeof(item) for item in best)
+                        for best in self._short.values())
+            return {
+                'products': len(self._products),
+                'tokens': len(self._entries),
+                'memory_bytes': size,
+                'build_seconds': round(self._build_seconds, 3),
+            }
+
+
+title_index = PrefixIndex()
@@ -0,0 +1,73 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+
+from store.caching import catalog_version
+from store.models import Product
+
+# Settings (all optional):
+# STORE_AVAILABILITY = {
+#     'TIMEOUT': 5,        # seconds an inventory number is served from the cache
+#     'MAX_IDS': 5000,     # ids per request
+# }
+DEFAULTS = {
+    'TIMEOUT': 5,
+    'MAX_IDS': 5000,
+}
+
+def availability_setting(name):
+    return getattr(settings, 'STORE_AVAILABILITY', {}).get(name, DEFAULTS[name])
+
+
+def stock_status(inventory: int) -> str:
+    """Same rules as ProductQuerySet.with_stock_status(), for one number
+    of available units."""
+    if inventory <= 0:
+        return Product.STOCK_OUT
+    if inventory < Product.LOW_STOCK:
+        return Product.STOCK_LOW
+    return Product.STOCK_IN
+
+
+def inventories(ids) -> dict:
+    """
+    {id: available units} for the existing products among `ids`:
+    inventory plus pending ledger entries, the number store.stock checks.
+
+    The answer for the whole set of ids is cached (one cache read for a
+    page asked for again). Below that every id has its own cache key, so
+    pages asking for overlapping ids share entries; only the ids not
+    cached are read, with ONE query:
+
+        SELECT id, inventory + (pending ledger sum) FROM store_product
+        WHERE id IN (...)
+
+    Keys include the catalog version: a saved product, a discount or a
+    stock movement (record_bulk_product_changes) drops every entry, and
+    TIMEOUT bounds anything else, e.g. pending ledger entries. Unknown ids
+    are cached too (as None), so asking for them again costs nothing.
+    """
+    version = catalog_version()
+    signature = hashlib.md5(','.join(map(str, sorted(ids))).encode()).hexdigest()
+    set_key = f'store:availability:{version}:set:{signature}'
+    result = cache.get(set_key)
+    if result is not None:
+        return result
+
+    keys = {product_id: f'store:availability:{version}:{product_id}' for product_id in ids}
+    cached = cache.get_many(keys.values())
+    found = {product_id: cached[key] for product_id, key in keys.items() if key in cached}
+
+    missing = [product_id for product_id in keys if product_id not in found]
+    if missing:
+        rows = dict(Product.objects.filter(id__in=missing).order_by()
+                    .with_available().values_list('id', 'available'))
+        loaded = {product_id: rows.get(product_id) for product_id in missing}
+        cache.set_many({keys[product_id]: inventory for product_id, inventory in loaded.items()},
+                       availability_setting('TIMEOUT'))
+        found.update(loaded)
+    result = {product_id: inventory for product_id, inventory in found.items()
+              if inventory is not None}
+    cache.set(set_key, result, availability_setting('TIMEOUT'))
+    return result
@@ -0,0 +1,97 @@
+from django.db import connections, router
+
+
+def added_value(table, value, maximum=None) -> str:
+    """`table.value + excluded.value`, capped at `maximum` if given. A
+    CASE rather than MIN()/LEAST(), which are spelled differently on
+    SQLite and PostgreSQL."""
+    total = f'{table}.{value} + excluded.{value}'
+    if maximum is None:
+        return total
+    maximum = int(maximum)
+    return f'CASE WHEN {total} > {maximum} THEN {maximum} ELSE {total} END'
+
+
+def insert_select(model, columns, queryset, add_on_conflict=None, maximum=None) -> int:
+    """
+    INSERT INTO <model table> (...) SELECT ... FROM (<queryset>) in one
+    statement, without loading any rows into Python.
+
+    `columns` maps target field names to names in `queryset`, which must be
+    a .values(...) queryset of plain field names and annotations (use
+    annotate(x=Value(...)) for constants):
+
+        insert_select(PriceChange, [('product', 'id'), ('old_price', 'price')],
+                      Product.objects.filter(...).values('id', 'price'))
+
+    With add_on_conflict=(key_fields, value_field) it is an upsert: rows
+    that hit the unique key add their value to the existing row instead,
+
+        ... ON CONFLICT (a, b) DO UPDATE SET n = t.n + excluded.n
+
+    and `maximum` caps the sum (not the inserted values themselves).
+
+    Returns the number of inserted (or updated) rows.
+    """
+    db = queryset.db
+    connection = connections[db]
+    quote = connection.ops.quote_name
+    # Ordering doesn't matter for an INSERT and would only cost a sort
+    sql, params = queryset.order_by().query.get_compiler(db).as_sql()
+
+    table = quote(model._meta.db_table)
+    target = ', '.join(quote(model._meta.get_field(name).column) for name, _ in columns)
+    source = ', '.join(f'source.{quote(name)}' for _, name in columns)
+    upsert = ''
+    if add_on_conflict:
+        key_fields, value_field = add_on_conflict
+        keys = ', '.join(quote(model._meta.get_field(name).column) for name in key_fields)
+        value = quote(model._meta.get_field(value_field).column)
+        # "WHERE 1 = 1": SQLite would otherwise read ON as a join condition
+        upsert = (f' WHERE 1 = 1 ON CONFLICT ({keys}) '
+                  f'DO UPDATE SET {value} = {added_value(table, value, maximum)}')
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({target}) '
+            f'SELECT {source} FROM ({sql}) source{upsert}',
+            params,
+        )
+        return cursor.rowcount
+
+
+def upsert_add(model, key_fields, value_field, rows, using=None, maximum=None) -> None:
+    """
+    Add to a counter column, inserting missing rows, in one statement per
+    batch:
+
+        INSERT INTO t (a, b, n) VALUES (...), (...)
+        ON CONFLICT (a, b) DO UPDATE SET n = t.n + excluded.n
+
+    `rows` are tuples of key values followed by the amount to add, and
+    `key_fields` must be covered by a unique constraint. ON CONFLICT works
+    on SQLite (3.24+) and PostgreSQL. `using` picks the database (default:
+    the router's choice for the model). `maximum` caps the sum.
+    """
+    rows = list(rows)
+    if not rows:
+        return
+    connection = connections[using or router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    keys = [quote(model._meta.get_field(name).column) for name in key_fields]
+    value = quote(model._meta.get_field(value_field).column)
+    columns = keys + [value]
+    placeholders = '(' + ', '.join(['%s'] * len(columns)) + ')'
+
+    # Stay below SQLite's limit on the number of query parameters
+    batch_size = max(1, 900 // len(columns))
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            cursor.execute(
+                f'INSERT INTO {table} ({", ".join(columns)}) '
+                f'VALUES {", ".join([placeholders] * len(batch))} '
+                f'ON CONFLICT ({", ".join(keys)}) '
+                f'DO UPDATE SET {value} = {added_value(table, value, maximum)}',
+                [item for row in batch for item in row],
+            )
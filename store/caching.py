@@ -0,0 +1,198 @@
+import hashlib
+import math
+import random
+import threading
+import time
+
+from django.core.cache import cache
+
+# Every cached catalog response includes this number in its key (or checks
+# it on read). Saving or deleting a Product/Collection bumps it, which
+# invalidates all of them at once without having to find the keys.
+CATALOG_VERSION_KEY = 'store:catalog-version'
+
+
+def catalog_version() -> int:
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, 1, timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY, 1)
+    return version
+
+
+def bump_catalog_version() -> None:
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        # Key missing (first write or cache flushed)
+        cache.set(CATALOG_VERSION_KEY, 1, timeout=None)
+
+
+def query_signature(params, exclude=()) -> str:
+    """
+    Normalize query parameters into a short, stable cache key part.
+
+    ?price__gt=10&collection_id=1 and ?collection_id=1&price__gt=10 give
+    the same signature. Values of a repeated parameter keep their order
+    (?ordering=a&ordering=b is not ?ordering=b&ordering=a). Parameters in
+    `exclude` (e.g. page) are ignored.
+    """
+    items = sorted(
+        ((key, value)
+         for key in params.keys() if key not in exclude
+         for value in params.getlist(key)),
+        key=lambda item: item[0],
+    )
+    raw = '&'.join(f'{key}={value}' for key, value in items)
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def request_cache_key(prefix: str, request) -> str:
+    """Cache key for a GET response: host (absolute next/previous links)
+    plus the normalized query string."""
+    signature = query_signature(request.query_params, exclude=['format'])
+    return f'store:{prefix}:{request.get_host()}:{signature}'
+
+
+# ================================================================================
+# Stampede protection for expensive catalog responses
+# ================================================================================
+
+class _Flight:
+    """One in-progress computation that other threads can wait for."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class CoalescingCache:
+    """
+    get_or_compute() for expensive, cacheable results (e.g. list pages).
+
+    Three things keep expirations and edits from turning into DB spikes:
+
+    1. Single flight: per key, only one thread computes. Other threads that
+       miss at the same time wait for that result instead of running the
+       same query again.
+    2. Stale while revalidate: entries are kept for `stale_ttl` seconds
+       after they expire (or after the catalog version changes). While one
+       thread recomputes, the others are served the stale value right away.
+    3. Probabilistic early refresh ("XFetch"): a request may recompute a
+       still-valid entry shortly before it expires. The chance grows as
+       expiry gets closer and with how long the value took to compute, so
+       one request usually refreshes it before everyone misses together.
+
+    Only threads of the same process are coalesced; each process computes
+    at most once per key and expiry.
+    """
+
+    def __init__(self, ttl=60, stale_ttl=600, beta=1.0, wait_timeout=10,
+                 max_metric_keys=1000):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.beta = beta
+        self.wait_timeout = wait_timeout
+        self.max_metric_keys = max_metric_keys
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def get_or_compute(self, key, compute, version=None):
+        """
+        Return the cached value for `key`, computing it with `compute()`
+        when needed. Entries whose `version` differs from the given one
+        (e.g. catalog_version()) are treated as expired but may be served
+        stale while a fresh value is computed.
+        """
+        entry = cache.get(key)
+        now = time.time()
+
+        if entry is not None and entry['version'] == version:
+            # XFetch: -log(random) is >= 0 and rarely large, so the entry is
+            # refreshed early only when it's about to expire anyway
+            gap = -entry['delta'] * self.beta * math.log(1.0 - random.random())
+            if now + gap < entry['expires_at']:
+                self._count(key, 'hits')
+                return entry['value']
+            flight, leader = self._join(key)
+            if not leader:
+                # Someone else is already refreshing it
+                self._count(key, 'hits')
+                return entry['value']
+            self._count(key, 'early_refreshes')
+            return self._lead(key, flight, compute, version)
+
+        flight, leader = self._join(key)
+        if leader:
+            self._count(key, 'misses')
+            return self._lead(key, flight, compute, version)
+
+        if entry is not None:
+            self._count(key, 'stale_served')
+            return entry['value']
+
+        # Nothing to serve: wait for the thread that is computing
+        started = time.monotonic()
+        finished = flight.done.wait(self.wait_timeout)
+        self._count(key, 'coalesced_waits')
+        self._count(key, 'wait_seconds', time.monotonic() - started)
+        if not finished or flight.error is not None:
+            # Too slow or it failed: compute it ourselves
+            self._count(key, 'misses')
+            return compute()
+        return flight.value
+
+    def metrics(self) -> dict:
+        """Per-key counters: hits, misses, early_refreshes, stale_served,
+        coalesced_waits and wait_seconds."""
+        with self._lock:
+            return {key: dict(counters) for key, counters in self._metrics.items()}
+
+    def reset_metrics(self):
+        with self._lock:
+            self._metrics.clear()
+
+    def _join(self, key):
+        """Return (flight, True) if this thread should compute the value."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = self._flights[key] = _Flight()
+            return flight, True
+
+    def _lead(self, key, flight, compute, version):
+        try:
+            started = time.monotonic()
+            value = compute()
+            delta = time.monotonic() - started
+            cache.set(key, {
+                'value': value,
+                'version': version,
+                'delta': delta,
+                'expires_at': time.time() + self.ttl,
+            }, self.ttl + self.stale_ttl)
+            flight.value = value
+            return value
+        except Exception as error:
+            flight.error = error
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def _count(self, key, name, amount=1):
+        with self._lock:
+            counters = self._metrics.get(key)
+            if counters is None:
+                # Don't let unique query strings grow this without limit
+                if len(self._metrics) >= self.max_metric_keys:
+                    key = '<other>'
+                counters = self._metrics.setdefault(key, {})
+            counters[name] = counters.get(name, 0) + amount
+
+
+catalog_cache = CoalescingCache()
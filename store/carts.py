@@ -0,0 +1,218 @@
+from decimal import Decimal
+
+from django.db import connections, transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, UUIDField, Value
+from django.utils import timezone
+
+from store.bulk import insert_select, upsert_add
+from store.models import Cart, CartItem, Customer, Product
+from store.sharding import cart_shards
+
+
+class CartError(Exception):
+    """The batch can't be applied; nothing was written."""
+
+
+def fold_operations(operations) -> dict:
+    """
+    One final change per product for the whole batch, in request order:
+
+        [{'product': 1, 'op': 'set', 'quantity': 2},
+         {'product': 1, 'op': 'increment', 'quantity': 3},
+         {'product': 2, 'op': 'increment', 'quantity': 1},
+         {'product': 3, 'op': 'remove'}]
+        -> {1: ('set', 5), 2: ('increment', 1), 3: ('set', 0)}
+
+    'set' is absolute; 'increment' is relative to what the cart already
+    has, unless a 'set' for the product came earlier in the batch.
+    """
+    changes = {}
+    for operation in operations:
+        product_id, op = operation['product'], operation['op']
+        if op == 'remove':
+            changes[product_id] = ('set', 0)
+        elif op == 'set':
+            changes[product_id] = ('set', operation['quantity'])
+        else:
+            kind, quantity = changes.get(product_id, ('increment', 0))
+            changes[product_id] = (kind, quantity + operation['quantity'])
+    return changes
+
+
+def apply_cart_operations(cart: Cart, operations) -> dict:
+    """
+    Apply a batch of set/increment/remove operations to a cart in ONE
+    transaction, all or nothing, with a fixed number of queries however
+    many products the batch has:
+
+    1. SELECT id FROM store_product WHERE id IN (...)   - validate products
+    2. SELECT ... FROM store_cart WHERE id = ... FOR UPDATE
+                                            - one batch per cart at a time
+    3. SELECT product_id, quantity ... WHERE product_id IN (increments)
+    4. INSERT ... ON CONFLICT (cart_id, product_id) DO UPDATE
+       SET quantity = excluded.quantity     - bulk_create(update_conflicts)
+    5. DELETE ... WHERE product_id IN (...) - lines that end at 0
+    6. UPDATE store_cart SET updated_at = ...
+
+    Returns {'updated': n, 'removed': n}. A line that would end above
+    CartItem.MAX_QUANTITY (e.g. after many increments) fails the batch.
+    """
+    changes = fold_operations(operations)
+    product_ids = sorted(changes)
+    found = set(Product.objects.filter(id__in=product_ids).values_list('id', flat=True))
+    missing = [product_id for product_id in product_ids if product_id not in found]
+    if missing:
+        raise CartError(f'Unknown products: {missing}')
+
+    shard = cart._state.db  # carts may be sharded (store.sharding)
+    with transaction.atomic(using=shard):
+        list(Cart.objects.using(shard).select_for_update().filter(pk=cart.pk).values_list('pk'))
+        lines = CartItem.objects.using(shard).filter(cart=cart)
+        increments = [product_id for product_id in product_ids
+                      if changes[product_id][0] == 'increment']
+        current = dict(lines.filter(product_id__in=increments)
+                       .values_list('product_id', 'quantity')) if increments else {}
+
+        final = {}
+        for product_id in product_ids:
+            kind, quantity = changes[product_id]
+            final[product_id] = max(quantity + (current.get(product_id, 0)
+                                                if kind == 'increment' else 0), 0)
+        too_many = [product_id for product_id in product_ids
+                    if final[product_id] > CartItem.MAX_QUANTITY]
+        if too_many:
+            raise CartError(f'More than {CartItem.MAX_QUANTITY} units of products: {too_many}')
+        keep = [product_id for product_id in product_ids if final[product_id]]
+        remove = [product_id for product_id in product_ids if not final[product_id]]
+
+        lines.bulk_create(
+            [CartItem(cart=cart, product_id=product_id, quantity=final[product_id])
+             for product_id in keep],
+            update_conflicts=True,
+            unique_fields=['cart', 'product'],
+            update_fields=['quantity'],
+        )
+        if remove:
+            lines.filter(product_id__in=remove).delete()
+        Cart.objects.using(shard).filter(pk=cart.pk).update(updated_at=timezone.now())
+    return {'updated': len(keep), 'removed': len(remove)}
+
+
+def cart_lines(cart: Cart) -> tuple[list, Decimal]:
+    """
+    (lines, total) of a cart, line totals computed by the database:
+
+        SELECT id, product_id, quantity, quantity * product.price ...
+
+    When the cart is on its own shard (store.sharding) the products are in
+    another database and can't be joined: prices are then read with one
+    IN query and multiplied here.
+    """
+    shard = cart._state.db
+    lines = CartItem.objects.using(shard).filter(cart=cart).order_by('id')
+    if shard == Product.objects.db:
+        rows = list(lines.annotate(line_total=ExpressionWrapper(
+            F('quantity') * F('product__price'),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        )).values_list('id', 'product_id', 'quantity', 'line_total'))
+    else:
+        items = list(lines.values_list('id', 'product_id', 'quantity'))
+        prices = dict(Product.objects.filter(id__in=[row[1] for row in items])
+                      .values_list('id', 'price'))
+        rows = [(*row, row[2] * prices.get(row[1], Decimal(0))) for row in items]
+    result = [
+        {'id': item_id, 'product': product_id, 'quantity': quantity,
+         'total_price': line_total}
+        for item_id, product_id, quantity, line_total in rows
+    ]
+    return result, sum((line['total_price'] for line in result), Decimal(0))
+
+
+# ================================================================================
+# Customer carts and merging at login
+# ================================================================================
+
+def customer_cart(customer: Customer, exclude=None):
+    """The customer's most recently updated cart (other than `exclude`), or
+    None. One query per cart shard (store.sharding)."""
+    carts = [
+        cart
+        for alias in cart_shards()
+        for cart in Cart.objects.using(alias).filter(customer_id=customer.pk)
+        .exclude(pk=exclude).order_by('-updated_at')[:1]
+    ]
+    return max(carts, key=lambda cart: cart.updated_at, default=None)
+
+
+def claim_cart(cart: Cart, customer: Customer) -> None:
+    if cart.customer_id not in (None, customer.pk):
+        raise CartError('The cart belongs to another customer.')
+    Cart.objects.using(cart._state.db).filter(pk=cart.pk).update(
+        customer=customer, updated_at=timezone.now())
+    cart.customer = customer
+
+
+def merge_carts(source: Cart, target: Cart) -> int:
+    """
+    Move every line of `source` into `target` and delete `source`;
+    quantities of products in both carts are added up, up to
+    CartItem.MAX_QUANTITY. Returns the number of lines moved.
+
+    With both carts in one database this is a fixed 4 queries whatever the
+    size of the carts, in one transaction:
+
+        INSERT INTO store_cartitem (cart_id, product_id, quantity)
+        SELECT :target, product_id, quantity FROM store_cartitem
+        WHERE cart_id = :source
+        ON CONFLICT (cart_id, product_id)
+        DO UPDATE SET quantity = CASE WHEN <sum> > :max THEN :max ELSE <sum> END;
+        DELETE FROM store_cartitem WHERE cart_id IN (:source);
+        DELETE FROM store_cart WHERE id IN (:source);
+        UPDATE store_cart SET updated_at = ... WHERE id = :target;
+
+    Carts on different shards: the source lines are read with one query
+    and upserted into the target's database the same way (upsert_add),
+    then the source is deleted.
+    """
+    if source.pk == target.pk:
+        raise CartError("A cart can't be merged into itself.")
+    source_db, target_db = source._state.db, target._state.db
+    source_lines = CartItem.objects.using(source_db).filter(cart_id=source.pk)
+    with transaction.atomic(using=target_db):
+        if source_db == target_db:
+            moved = insert_select(CartItem, [
+                ('cart', 'merge_cart'),
+                ('product', 'product_id'),
+                ('quantity', 'quantity'),
+            ], source_lines.annotate(
+                merge_cart=Value(target.pk, output_field=UUIDField()),
+            ).values('merge_cart', 'product_id', 'quantity'),
+                add_on_conflict=(['cart', 'product'], 'quantity'),
+                maximum=CartItem.MAX_QUANTITY)
+            source.delete()
+        else:
+            cart_id = Cart._meta.pk.get_db_prep_value(target.pk, connections[target_db])
+            rows = [(cart_id, product_id, quantity) for product_id, quantity
+                    in source_lines.values_list('product_id', 'quantity')]
+            upsert_add(CartItem, ['cart', 'product'], 'quantity', rows, using=target_db,
+                       maximum=CartItem.MAX_QUANTITY)
+            moved = len(rows)
+        Cart.objects.using(target_db).filter(pk=target.pk).update(updated_at=timezone.now())
+    if source_db != target_db:
+        source.delete()  # after the target committed: lines are never lost
+    return moved
+
+
+def merge_guest_cart(cart: Cart, customer: Customer, target=None) -> Cart:
+    """
+    At login: if the customer already has a cart (`target`, from
+    customer_cart()), the guest cart is merged into it (merge_carts) and
+    that cart is returned; otherwise the guest cart becomes the customer's.
+    """
+    if target is None:
+        claim_cart(cart, customer)
+        return cart
+    if cart.customer_id not in (None, customer.pk):
+        raise CartError('The cart belongs to another customer.')
+    merge_carts(cart, target)
+    return target
@@ -0,0 +1,358 @@
+import time
+import uuid
+import zlib
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+
+from store.models import Cart, CartItem, Product
+from store.sharding import group_by_shard, shard_for
+
+# Settings (all optional):
+# STORE_CART_STORE = {
+#     'ENABLED': False,         # serve/modify carts through the store in the API
+#     'CACHE': 'default',       # cache alias; must not evict keys on its own
+#     'TIMEOUT': 7 * 24 * 3600, # how long a flushed (clean) cart stays cached
+#     'LOCK_TIMEOUT': 5,        # seconds a per-cart lock is held at most
+#     'DIRTY_SHARDS': 16,       # keys the set of unflushed carts is split over
+# }
+DEFAULTS = {
+    'ENABLED': False,
+    'CACHE': 'default',
+    'TIMEOUT': 7 * 24 * 3600,
+    'LOCK_TIMEOUT': 5,
+    'DIRTY_SHARDS': 16,
+}
+
+
+def cart_store_setting(name):
+    return getattr(settings, 'STORE_CART_STORE', {}).get(name, DEFAULTS[name])
+
+
+def cart_key(cart_id):
+    """'7D4A...' or UUID('7d4a...') -> '7d4a...'; None if not a cart id."""
+    try:
+        return str(uuid.UUID(str(cart_id)))
+    except ValueError:
+        return None
+
+
+class CartBusy(Exception):
+    """The cart's lock couldn't be taken in time."""
+
+
+class CartStore:
+    """
+    Write-behind storage for carts: item changes go to the cache, and are
+    written to Cart/CartItem later, many carts per transaction (flush()),
+    by the flush_carts command or at checkout.
+
+    A cart in the cache:
+
+        {'items': {product_id: quantity}, 'version': 7, 'flushed': 5,
+         'customer_id': ..., 'created_at': ..., 'updated_at': ...}
+
+    `version` goes up on every change; `flushed` is the version last
+    written to the DB. version > flushed means the cart is dirty.
+
+    Crash safety:
+    - A change is only acknowledged once it is in the shared cache, so a
+      web worker crashing loses nothing.
+    - A cart is added to the dirty set BEFORE its first unflushed change
+      is stored, so a crash in between can't leave a dirty cart that no
+      flush will find (at worst a clean cart gets flushed for nothing).
+    - Dirty carts are stored without expiry; only clean ones expire.
+    - A flush writes the whole cart (replace, not increment) and marks it
+      flushed only after the commit, so a flush interrupted at any point is
+      simply repeated by the next one.
+    - Per-cart locks keep changes and flushes of one cart in order.
+    What is lost if the CACHE itself is lost: changes since the last flush.
+    Use a cache that persists and doesn't evict (e.g. Redis with
+    noeviction) and flush often enough for that window to be acceptable.
+    """
+
+    def __init__(self, prefix='store:cart'):
+        self.prefix = prefix
+
+    @property
+    def cache(self):
+        return caches[cart_store_setting('CACHE')]
+
+    # ----------------------------------------------------------------
+    # Reading and changing carts
+    # ----------------------------------------------------------------
+
+    def get(self, cart_id):
+        """The cart's entry, loaded from the DB on a cache miss; None if
+        the cart doesn't exist."""
+        cart_id = cart_key(cart_id)
+        if cart_id is None:
+            return None
+        entry = self.cache.get(self._key(cart_id))
+        if entry is not None:
+            return entry
+        shard = shard_for(cart_id)
+        cart = (Cart.objects.using(shard).filter(pk=cart_id)
+                .values('customer_id', 'created_at', 'updated_at').first())
+        if cart is None:
+            return None
+        entry = {
+            'items': dict(CartItem.objects.using(shard).filter(cart_id=cart_id)
+                          .values_list('product_id', 'quantity')),
+            'version': 0,
+            'flushed': 0,
+            **cart,
+        }
+        # add(): don't overwrite an entry another worker stored meanwhile
+        self.cache.add(self._key(cart_id), entry, cart_store_setting('TIMEOUT'))
+        return self.cache.get(self._key(cart_id)) or entry
+
+    def add(self, cart_id, product_id, quantity):
+        """Add `quantity` units of a product (negative removes units), up
+        to CartItem.MAX_QUANTITY."""
+        return self._change(cart_id, product_id, lambda current: current + quantity)
+
+    def set_quantity(self, cart_id, product_id, quantity):
+        """Set the quantity of a product; 0 removes it from the cart."""
+        return self._change(cart_id, product_id, lambda current: quantity)
+
+    def _change(self, cart_id, product_id, new_quantity):
+        cart_id = cart_key(cart_id)
+        if cart_id is None:
+            return None
+        with self.lock(cart_id):
+            entry = self.get(cart_id)
+            if entry is None:
+                return None
+            quantity = min(max(new_quantity(entry['items'].get(product_id, 0)), 0),
+                           CartItem.MAX_QUANTITY)
+            if quantity:
+                entry['items'][product_id] = quantity
+            else:
+                entry['items'].pop(product_id, None)
+            entry['updated_at'] = timezone.now()
+            self._store_change(cart_id, entry)
+            return entry
+
+    def _store_change(self, cart_id, entry):
+        """Store a changed entry (lock held)."""
+        if entry['version'] == entry['flushed']:
+            self._mark_dirty(cart_id)  # before the change is stored
+        entry['version'] += 1
+        self.cache.set(self._key(cart_id), entry, None)  # dirty: no expiry
+
+    def _prune(self, cart_id, product_ids):
+        """
+        Drop the lines of deleted products from the cached cart. Stored as
+        a change, so the next flush deletes their rows too. Skipped if the
+        cart is busy: the next read tries again.
+        """
+        try:
+            with self.lock(cart_id, wait=0):
+                entry = self.cache.get(self._key(cart_id))
+                if entry is None or not product_ids & entry['items'].keys():
+                    return
+                for product_id in product_ids:
+                    entry['items'].pop(product_id, None)
+                self._store_change(cart_id, entry)
+        except CartBusy:
+            pass
+
+    def discard(self, cart_id):
+        """Forget the cached cart (e.g. the cart was deleted)."""
+        self.cache.delete(self._key(cart_key(cart_id)))
+
+    @contextmanager
+    def write_through(self, cart_id):
+        """
+        For code that writes CartItems directly: flush pending changes
+        first, then drop the cached copy so it is reloaded from the DB.
+        """
+        cart_id = cart_key(cart_id)
+        with self.lock(cart_id):
+            entry = self.cache.get(self._key(cart_id))
+            if entry is not None and entry['version'] > entry['flushed']:
+                products = self._existing_products(entry['items'])
+                with transaction.atomic(using=shard_for(cart_id)):
+                    self._write_cart(cart_id, {product_id: quantity for product_id, quantity
+                                               in entry['items'].items() if product_id in products})
+            yield
+            self.discard(cart_id)
+        self._mark_clean([cart_id])
+
+    def as_cart(self, cart_id, entry) -> Cart:
+        """
+        An unsaved Cart with its items, ready for CartSerializer. Lines of
+        products deleted since they were added are left out (and pruned
+        from the cached cart).
+        """
+        cart_id = cart_key(cart_id)
+        products = self._existing_products(entry['items'])
+        if products != entry['items'].keys():
+            self._prune(cart_id, entry['items'].keys() - products)
+        cart = Cart(id=cart_id, customer_id=entry.get('customer_id'),
+                    created_at=entry['created_at'], updated_at=entry['updated_at'])
+        cart._prefetched_objects_cache = {'items': [
+            CartItem(cart_id=cart_id, product_id=product_id, quantity=quantity)
+            for product_id, quantity in sorted(entry['items'].items())
+            if product_id in products
+        ]}
+        return cart
+
+    # ----------------------------------------------------------------
+    # Flushing
+    # ----------------------------------------------------------------
+
+    def dirty_cart_ids(self) -> set:
+        ids = set()
+        for shard in range(cart_store_setting('DIRTY_SHARDS')):
+            ids |= self.cache.get(self._dirty_key(shard)) or set()
+        return ids
+
+    def flush(self, cart_ids=None, batch_size=100) -> dict:
+        """
+        Write dirty carts (all of them, or `cart_ids`) to the DB,
+        `batch_size` carts per transaction. Carts being changed right now
+        (lock busy) are left dirty for the next flush.
+        """
+        if cart_ids is None:
+            cart_ids = self.dirty_cart_ids()
+        cart_ids = sorted({key for key in map(cart_key, cart_ids) if key is not None})
+        flushed = skipped = 0
+        for start in range(0, len(cart_ids), batch_size):
+            done, busy = self._flush_batch(cart_ids[start:start + batch_size])
+            flushed += done
+            skipped += busy
+        return {'carts': flushed, 'busy': skipped}
+
+    def _flush_batch(self, cart_ids):
+        tokens = {}
+        try:
+            # Sorted ids, and no waiting: two flushes can't deadlock
+            for cart_id in cart_ids:
+                token = self._acquire(cart_id, wait=0)
+                if token is not None:
+                    tokens[cart_id] = token
+            entries = {cart_id: self.cache.get(self._key(cart_id)) for cart_id in tokens}
+            dirty = {cart_id: entry for cart_id, entry in entries.items()
+                     if entry is not None and entry['version'] > entry['flushed']}
+            # Lines of products deleted since they were added are dropped,
+            # not written (they would be orphan rows; CartItem.product has
+            # no database constraint since carts can be sharded)
+            products = self._existing_products(
+                {product_id for entry in dirty.values() for product_id in entry['items']})
+            for entry in dirty.values():
+                entry['items'] = {product_id: quantity for product_id, quantity
+                                  in entry['items'].items() if product_id in products}
+            existing = set()
+            # One transaction per shard (store.sharding) for the batch
+            for shard, ids in group_by_shard(dirty).items():
+                found = {str(pk) for pk in Cart.objects.using(shard)
+                         .filter(pk__in=ids).values_list('pk', flat=True)}
+                with transaction.atomic(using=shard):
+                    for cart_id in sorted(found):
+                        self._write_cart(cart_id, dirty[cart_id]['items'])
+                        Cart.objects.using(shard).filter(pk=cart_id).update(
+                            updated_at=dirty[cart_id]['updated_at'])
+                existing |= found
+
+            # Committed: now the cached entries can say so
+            for cart_id, entry in dirty.items():
+                if cart_id in existing:
+                    entry['flushed'] = entry['version']
+                    self.cache.set(self._key(cart_id), entry, cart_store_setting('TIMEOUT'))
+                else:
+                    self.discard(cart_id)  # cart was deleted
+            self._mark_clean(list(tokens))
+            return len(existing), len(cart_ids) - len(tokens)
+        finally:
+            for cart_id, token in tokens.items():
+                self._release(cart_id, token)
+
+    def _existing_products(self, product_ids) -> set:
+        """The ids among `product_ids` that are still products: one IN
+        query per 500 ids (below SQLite's bound-parameter limit)."""
+        product_ids = sorted(product_ids)
+        found = set()
+        for start in range(0, len(product_ids), 500):
+            found.update(Product.objects.filter(id__in=product_ids[start:start + 500])
+                         .values_list('id', flat=True))
+        return found
+
+    def _write_cart(self, cart_id, items):
+        """Replace the cart's rows with `items`: one DELETE + one upsert."""
+        items_on_shard = CartItem.objects.using(shard_for(cart_id))
+        items_on_shard.filter(cart_id=cart_id).exclude(product_id__in=list(items)).delete()
+        items_on_shard.bulk_create(
+            [CartItem(cart_id=cart_id, product_id=product_id, quantity=quantity)
+             for product_id, quantity in items.items()],
+            update_conflicts=True,
+            unique_fields=['cart', 'product'],
+            update_fields=['quantity'],
+        )
+
+    # ----------------------------------------------------------------
+    # Dirty set and locks
+    # ----------------------------------------------------------------
+
+    def _mark_dirty(self, cart_id):
+        shard = self._shard(cart_id)
+        with self.lock(f'dirty:{shard}'):
+            ids = self.cache.get(self._dirty_key(shard)) or set()
+            ids.add(cart_id)
+            self.cache.set(self._dirty_key(shard), ids, None)
+
+    def _mark_clean(self, cart_ids):
+        by_shard = {}
+        for cart_id in cart_ids:
+            by_shard.setdefault(self._shard(cart_id), []).append(cart_id)
+        for shard, ids in by_shard.items():
+            with self.lock(f'dirty:{shard}'):
+                dirty = self.cache.get(self._dirty_key(shard)) or set()
+                for cart_id in ids:
+                    # Only if no change came in after the flush read the cart
+                    entry = self.cache.get(self._key(cart_id))
+                    if entry is None or entry['version'] == entry['flushed']:
+                        dirty.discard(cart_id)
+                self.cache.set(self._dirty_key(shard), dirty, None)
+
+    @contextmanager
+    def lock(self, name, wait=None):
+        token = self._acquire(name, wait=cart_store_setting('LOCK_TIMEOUT') if wait is None else wait)
+        if token is None:
+            raise CartBusy(f'Cart {name} is busy.')
+        try:
+            yield
+        finally:
+            self._release(name, token)
+
+    def _acquire(self, name, wait):
+        key = f'{self.prefix}:lock:{name}'
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + wait
+        while True:
+            if self.cache.add(key, token, cart_store_setting('LOCK_TIMEOUT')):
+                return token
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(0.002)
+
+    def _release(self, name, token):
+        key = f'{self.prefix}:lock:{name}'
+        if self.cache.get(key) == token:
+            self.cache.delete(key)
+
+    def _shard(self, cart_id) -> int:
+        return zlib.crc32(str(cart_id).encode()) % cart_store_setting('DIRTY_SHARDS')
+
+    def _key(self, cart_id) -> str:
+        return f'{self.prefix}:{cart_id}'
+
+    def _dirty_key(self, shard) -> str:
+        return f'{self.prefix}:dirty:{shard}'
+
+
+cart_store = CartStore()
@@ -0,0 +1,134 @@
+import base64
+import json
+from functools import reduce
+from operator import or_
+
+from django.contrib.admin.views.main import ChangeList
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+
+CURSOR_VAR = 'after'
+
+
+class KeysetChangeList(ChangeList):
+    """
+    Admin changelist with a "next ›" link that pages by keyset instead of
+    OFFSET.
+
+    ?p=5000 makes the database read and throw away 5000 pages of rows.
+    ?after=<cursor> remembers the ordering values of the last row shown,
+    and the next page starts right after it:
+
+        ORDER BY placed_at DESC, id DESC
+        WHERE placed_at < :last_placed_at
+           OR (placed_at = :last_placed_at AND id < :last_id)
+
+    so every page costs the same as the first. Page-number links are
+    still there for the first pages; the cursor only works while the
+    ordering is made of plain fields (e.g. not while sorting by an
+    annotated column), otherwise the changelist falls back to ?p=.
+    """
+    keyset = False
+
+    def __init__(self, request, *args, **kwargs):
+        self.cursor = request.GET.get(CURSOR_VAR)
+        super().__init__(request, *args, **kwargs)
+        # Not a filter: keep it out of sort/filter links
+        self.params.pop(CURSOR_VAR, None)
+        self.filter_params.pop(CURSOR_VAR, None)
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def get_results(self, request):
+        super().get_results(request)
+        fields = self.keyset_fields()
+        values = self.decode_cursor(fields)
+        if values is None:
+            return
+        # Replaces the OFFSET page; the paginator's slice was never run
+        self.keyset = True
+        self.multi_page = True
+        self.result_list = self.queryset.filter(
+            keyset_q(fields, values))[:self.list_per_page]
+
+    # ----------------------------------------------------------------
+    # Cursor
+    # ----------------------------------------------------------------
+
+    def keyset_fields(self):
+        """[(field, descending), ...] for the current ordering, or None if
+        it can't be paged by keyset."""
+        fields = []
+        for name in self.queryset.query.order_by:
+            if not isinstance(name, str) or '__' in name.lstrip('-'):
+                return None
+            descending = name.startswith('-')
+            name = name.lstrip('-')
+            try:
+                field = (self.lookup_opts.pk if name == 'pk'
+                         else self.lookup_opts.get_field(name))
+            except FieldDoesNotExist:
+                return None
+            if not field.concrete or field.null:
+                return None
+            if field not in [f for f, _ in fields]:  # ordering may repeat a field
+                fields.append((field, descending))
+        # Only a total order (ending in a unique field) has a unique "after"
+        if not fields or not fields[-1][0].unique:
+            return None
+        return fields
+
+    def decode_cursor(self, fields):
+        if not self.cursor or not fields:
+            return None
+        try:
+            data = json.loads(base64.urlsafe_b64decode(self.cursor.encode()))
+            names = [field.attname for field, _ in fields]
+            if data['fields'] != names:
+                return None  # ordering changed since the link was made
+            return [field.to_python(value)
+                    for (field, _), value in zip(fields, data['values'])]
+        except (ValueError, KeyError, TypeError, ValidationError):
+            return None
+
+    def encode_cursor(self, fields, obj) -> str:
+        data = {
+            'fields': [field.attname for field, _ in fields],
+            'values': [field.value_to_string(obj) for field, _ in fields],
+        }
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+
+    @property
+    def next_page_url(self):
+        """Link to the page after this one, or None on the last page."""
+        if not self.multi_page or (self.show_all and self.can_show_all):
+            return None
+        fields = self.keyset_fields()
+        if fields is None:
+            return None
+        # Evaluates (and caches) the page the template is about to render
+        rows = list(self.result_list)
+        if len(rows) < self.list_per_page:
+            return None
+        return self.get_query_string({CURSOR_VAR: self.encode_cursor(fields, rows[-1])})
+
+    @property
+    def first_page_url(self):
+        return self.get_query_string(remove=[CURSOR_VAR])
+
+
+def keyset_q(fields, values) -> Q:
+    """
+    Rows after `values` in the given ordering:
+    (a > x) OR (a = x AND b > y) OR (a = x AND b = y AND c > z) ...
+    with < instead of > for descending fields.
+    """
+    clauses = []
+    for index, (field, descending) in enumerate(fields):
+        lookups = {f.attname: value for (f, _), value in zip(fields[:index], values)}
+        lookups[f"{field.attname}__{'lt' if descending else 'gt'}"] = values[index]
+        clauses.append(Q(**lookups))
+    return reduce(or_, clauses)
@@ -0,0 +1,102 @@
+from django.db import transaction
+from django.db.models import CharField, DateTimeField, Exists, OuterRef, Value
+from django.utils import timezone
+
+from store.bulk import insert_select
+from store.caching import bump_catalog_version
+from store.lookups import product_lookup
+
+from store.models import ChangeLogEntry, Collection, Product, Review
+
+# Models whose changes are written to the change feed
+TRACKED_MODELS = [Product, Collection, Review]
+
+
+def entity_name(model) -> str:
+    # 'product', 'collection', 'review' - what clients see in the feed
+    return model._meta.model_name
+
+
+def record_change(instance, action: str) -> ChangeLogEntry:
+    """Append a single change for a model instance (used by the signals)."""
+    return ChangeLogEntry.objects.create(
+        entity=entity_name(type(instance)),
+        object_id=instance.pk,
+        action=action,
+    )
+
+
+def record_bulk_changes(queryset, action: str = ChangeLogEntry.ACTION_UPSERT) -> int:
+    """
+    Append one entry per row of `queryset` with a single INSERT ... SELECT.
+
+    QuerySet.update() doesn't send post_save, so bulk writers (discounts,
+    admin actions, stock updates) call this to keep the feed complete.
+    """
+    rows = queryset.annotate(
+        log_entity=Value(entity_name(queryset.model), output_field=CharField()),
+        log_action=Value(action, output_field=CharField()),
+        log_changed_at=Value(timezone.now(), output_field=DateTimeField()),
+    )
+    pk_name = queryset.model._meta.pk.name
+    rows = rows.values(pk_name, 'log_entity', 'log_action', 'log_changed_at')
+    return insert_select(ChangeLogEntry, [
+        ('object_id', pk_name),
+        ('entity', 'log_entity'),
+        ('action', 'log_action'),
+        ('changed_at', 'log_changed_at'),
+    ], rows)
+
+
+def record_bulk_product_changes(products) -> int:
+    """
+    What the Product post_save signals would do, for rows changed with
+    QuerySet.update(): log them for the change feed and, once committed,
+    drop cached products and catalog pages. Call it inside the same
+    transaction as the update, with a queryset that selects the changed
+    rows (before the update if the update changes what it matches).
+    """
+    count = record_bulk_changes(products)
+    transaction.on_commit(product_lookup.invalidate_all)
+    transaction.on_commit(bump_catalog_version)
+    return count
+
+
+def compact_changes(batch_size: int = 10_000) -> int:
+    """
+    Delete entries that are superseded by a newer entry for the same object.
+
+    This is always safe for clients: whatever cursor they hold, the newest
+    entry for each object is kept, so they still see that it changed.
+    Work is done in seq ranges of `batch_size` so a single DELETE never
+    locks the whole table.
+    """
+    deleted = 0
+    last = ChangeLogEntry.objects.order_by('-seq').values_list('seq', flat=True).first()
+    if last is None:
+        return 0
+
+    newer = ChangeLogEntry.objects.filter(
+        entity=OuterRef('entity'),
+        object_id=OuterRef('object_id'),
+        seq__gt=OuterRef('seq'),
+    )
+    for start in range(0, last, batch_size):
+        count, _ = ChangeLogEntry.objects.filter(
+            seq__gt=start, seq__lte=start + batch_size
+        ).filter(Exists(newer)).delete()
+        deleted += count
+    return deleted
+
+
+def prune_deletes(before) -> int:
+    """
+    Drop delete markers (tombstones) older than `before`.
+
+    Clients that fall further behind than the retention window will miss
+    those deletes and should re-read /store/products/ once.
+    """
+    count, _ = ChangeLogEntry.objects.filter(
+        action=ChangeLogEntry.ACTION_DELETE, changed_at__lt=before
+    ).delete()
+    return count
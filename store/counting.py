@@ -0,0 +1,97 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+# Settings (all optional):
+# STORE_APPROXIMATE_COUNTS = {
+#     'ENABLED': True,
+#     'TIMEOUT': 60,          # seconds an exact count is reused
+#     'EXACT_BELOW': 1000,    # smaller results are always counted exactly
+# }
+DEFAULTS = {
+    'ENABLED': True,
+    'TIMEOUT': 60,
+    'EXACT_BELOW': 1000,
+}
+
+
+def counts_setting(name):
+    return getattr(settings, 'STORE_APPROXIMATE_COUNTS', {}).get(name, DEFAULTS[name])
+
+
+def count_cache_key(queryset) -> str:
+    """One key per filter signature: the SQL of the query and its params
+    (ordering removed, it doesn't change the count)."""
+    sql, params = queryset.order_by().query.sql_with_params()
+    raw = f'{queryset.db}:{sql}:{params!r}'
+    return f'store:count:{hashlib.md5(raw.encode()).hexdigest()}'
+
+
+def planner_estimate(queryset):
+    """
+    Row estimate of the query planner, without running the query, or None
+    if the database doesn't offer one. PostgreSQL's EXPLAIN gives "Plan
+    Rows" (from table statistics); SQLite has nothing comparable.
+    """
+    if connections[queryset.db].vendor != 'postgresql':
+        return None
+    plan = json.loads(queryset.order_by().explain(format='json'))
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def estimated_count(queryset) -> tuple[int, bool]:
+    """
+    (count, is_approximate) for a queryset.
+
+    1. A count cached for this filter signature less than TIMEOUT seconds
+       ago is reused (approximate: rows may have changed since).
+    2. Otherwise the planner estimate is used where there is one.
+    3. Otherwise COUNT(*) runs and its result is cached.
+
+    Anything below EXACT_BELOW is counted exactly every time: small counts
+    are cheap, and "about 3 results" on a nearly empty page looks broken.
+    """
+    if not counts_setting('ENABLED'):
+        return queryset.count(), False
+    exact_below = counts_setting('EXACT_BELOW')
+    try:
+        key = count_cache_key(queryset)
+    except EmptyResultSet:
+        # .none() or id__in=[]: there is no SQL to key on, and nothing to count
+        return 0, False
+
+    count = cache.get(key)
+    if count is None:
+        count = planner_estimate(queryset)
+    if count is not None and count >= exact_below:
+        return count, True
+
+    count = queryset.count()
+    cache.set(key, count, counts_setting('TIMEOUT'))
+    return count, False
+
+
+class ApproximateCountPaginator(Paginator):
+    """
+    Paginator whose `count` comes from estimated_count(). Used by the API
+    (CustomPagination) and by admin changelists; `count_is_approximate`
+    tells templates and responses to say "about N".
+
+    With an approximate count the page links may be off by a page or so
+    until the cached count expires; the rows on each page are always exact.
+    """
+    count_is_approximate = False
+
+    @cached_property
+    def count(self):
+        if not hasattr(self.object_list, 'query'):
+            self.count_is_approximate = False
+            return len(self.object_list)
+        count, self.count_is_approximate = estimated_count(self.object_list)
+        return count
@@ -0,0 +1,231 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import (BigIntegerField, DateTimeField, DecimalField,
+                              Exists, F, IntegerField, OuterRef, Q, Subquery,
+                              Value)
+from django.db.models.functions import Cast, Greatest, Round
+from django.http import QueryDict
+from django.utils import timezone
+
+from store.bulk import insert_select
+from store.changes import record_bulk_product_changes
+from store.filters import ProductFilter
+from store.models import Discount, PriceChange, Product
+from store.pricing import PriceRules, to_basis_points, to_cents
+
+
+class DiscountError(Exception):
+    pass
+
+
+# ================================================================================
+# Price math in SQL
+# ================================================================================
+#
+# Prices are converted to integer cents, discounted with integer arithmetic
+# and rounded half up, then converted back:
+#
+#   cents     = CAST(ROUND(price * 100) AS BIGINT)
+#   percent:  new_cents = (cents * (10000 - basis_points) + 5000) / 10000
+#   fixed:    new_cents = MAX(cents - amount_cents, 0)
+#   new_price = new_cents * 0.01
+#
+# Integer division truncates, and all values are >= 0, so "+ 5000" before
+# dividing by 10000 is exactly ROUND_HALF_UP - the same result Decimal
+# arithmetic gives (store.pricing uses the same rule), with no float error.
+
+# Conversions come from store.pricing (one rounding rule for both); only
+# the ranges a discount allows are checked here
+
+def discount_basis_points(percent: Decimal) -> int:
+    try:
+        basis_points = to_basis_points(percent)
+    except ValueError:
+        basis_points = None
+    if basis_points is None or not 0 < basis_points <= 10000:
+        raise DiscountError('Percent must be between 0.01 and 100 with at most 2 decimals.')
+    return basis_points
+
+
+def discount_cents(amount: Decimal) -> int:
+    try:
+        cents = to_cents(amount)
+    except ValueError:
+        cents = None
+    if cents is None or cents <= 0:
+        raise DiscountError('Amount must be positive with at most 2 decimals.')
+    return cents
+
+
+def price_in_cents():
+    return Cast(Round(F('price') * Value(100)), BigIntegerField())
+
+
+def price_from_cents(cents):
+    # Multiply instead of dividing: on SQLite INTEGER / 100 would truncate
+    return cents * Value(
+        Decimal('0.01'), output_field=DecimalField(max_digits=12, decimal_places=2))
+
+
+def discounted_price(kind: str, value: Decimal):
+    """Expression for the new price of each row (see the comment above)."""
+    if kind == Discount.KIND_PERCENT:
+        return scaled_price(-value)
+    return price_from_cents(
+        Greatest(price_in_cents() - Value(discount_cents(value)), Value(0)))
+
+
+def scaled_price(percent: Decimal):
+    """Expression for the price changed by `percent` (-10 = 10% off,
+    25 = 25% more), with the same rounding."""
+    basis_points = discount_basis_points(abs(percent))
+    keep = 10000 - basis_points if percent < 0 else 10000 + basis_points
+    keep = Value(keep, output_field=BigIntegerField())
+    return price_from_cents((price_in_cents() * keep + Value(5000)) / Value(10000))
+
+
+# ================================================================================
+# Targets
+# ================================================================================
+
+def target_queryset(discount: Discount):
+    queryset = Product.objects.all()
+    if discount.product_id:
+        queryset = queryset.filter(pk=discount.product_id)
+    if discount.collection_id:
+        queryset = queryset.filter(collection_id=discount.collection_id)
+    if discount.filters:
+        params = QueryDict(mutable=True)
+        for key, value in discount.filters.items():
+            params.setlist(key, value if isinstance(value, list) else [value])
+        filterset = ProductFilter(params, queryset=queryset)
+        if not filterset.is_valid():
+            raise DiscountError(f'Invalid filters: {dict(filterset.errors)}')
+        queryset = filterset.qs
+    return queryset
+
+
+def discount_rules(discount: Discount) -> PriceRules:
+    if discount.kind == Discount.KIND_PERCENT:
+        return PriceRules(discount_percent=discount.value)
+    return PriceRules(amount_off=discount.value)
+
+
+def preview_discount(discount: Discount, limit: int = 20) -> dict:
+    """
+    What apply_discount would do, without writing anything: the number of
+    matching products and old/new prices for the first `limit` of them.
+    New prices come from store.pricing (same rounding as the SQL).
+    """
+    queryset = target_queryset(discount)
+    rows = list(queryset.order_by('id').values_list('id', 'price')[:limit])
+    new_prices = discount_rules(discount).evaluate(price for _, price in rows)
+    return {
+        'product_count': queryset.count(),
+        'sample': [
+            {'id': product_id, 'price': price, 'new_price': new_price}
+            for (product_id, price), new_price in zip(rows, new_prices)
+        ],
+    }
+
+
+# ================================================================================
+# Applying and ending
+# ================================================================================
+
+@transaction.atomic
+def apply_discount(discount: Discount) -> int:
+    """
+    Reprice every product of the discount with two statements, however many
+    products match:
+
+    1. INSERT INTO store_pricechange (...) SELECT id, price, <new price> ...
+       records old and new price of every matching product (the audit);
+    2. UPDATE store_product SET price = (new price from the audit)
+       WHERE id IN (products of this discount).
+
+    Reading the new price back from the audit makes the UPDATE write
+    exactly what was recorded.
+    """
+    if discount.status != Discount.STATUS_SCHEDULED:
+        raise DiscountError('Only scheduled discounts can be applied.')
+    now = timezone.now()
+
+    rows = target_queryset(discount).annotate(
+        audit_discount=Value(discount.pk, output_field=IntegerField()),
+        new_price=discounted_price(discount.kind, discount.value),
+        audit_changed_at=Value(now, output_field=DateTimeField()),
+    ).values('id', 'price', 'new_price', 'audit_discount', 'audit_changed_at')
+    count = insert_select(PriceChange, [
+        ('product', 'id'),
+        ('old_price', 'price'),
+        ('new_price', 'new_price'),
+        ('discount', 'audit_discount'),
+        ('changed_at', 'audit_changed_at'),
+    ], rows)
+
+    changes = PriceChange.objects.filter(discount=discount)
+    products = Product.objects.filter(
+        pk__in=changes.values('product_id'))
+    products.update(price=Subquery(
+        changes.filter(product=OuterRef('pk')).values('new_price')[:1]))
+    # QuerySet.update() sends no signals
+    record_bulk_product_changes(products)
+
+    discount.status = Discount.STATUS_ACTIVE
+    discount.applied_at = now
+    discount.product_count = count
+    discount.save(update_fields=['status', 'applied_at', 'product_count'])
+    return count
+
+
+@transaction.atomic
+def end_discount(discount: Discount) -> int:
+    """
+    Restore the prices recorded in the audit with one UPDATE. Products
+    whose price was changed again since (by hand or by another discount)
+    keep their current price.
+    """
+    if discount.status != Discount.STATUS_ACTIVE:
+        raise DiscountError('Only active discounts can be ended.')
+
+    changes = PriceChange.objects.filter(discount=discount)
+    products = Product.objects.filter(Exists(changes.filter(
+        product=OuterRef('pk'), new_price=OuterRef('price'))))
+    count = products.update(price=Subquery(
+        changes.filter(product=OuterRef('pk')).values('old_price')[:1]))
+    record_bulk_product_changes(Product.objects.filter(
+        pk__in=changes.values('product_id')))
+
+    discount.status = Discount.STATUS_ENDED
+    discount.ended_at = timezone.now()
+    discount.save(update_fields=['status', 'ended_at'])
+    return count
+
+
+def apply_due_discounts(now=None) -> tuple[int, int]:
+    """
+    Sweeper: apply scheduled discounts whose start time has come and end
+    active discounts whose end time has passed. Returns (applied, ended).
+    """
+    now = now or timezone.now()
+    applied = ended = 0
+    # Window passed before the sweeper ever saw it: nothing to apply
+    Discount.objects.filter(
+        status=Discount.STATUS_SCHEDULED, ends_at__lte=now
+    ).update(status=Discount.STATUS_ENDED, ended_at=now)
+    due = Discount.objects.filter(
+        Q(starts_at__isnull=True) | Q(starts_at__lte=now),
+        status=Discount.STATUS_SCHEDULED,
+    ).order_by('id')
+    for discount in due:
+        apply_discount(discount)
+        applied += 1
+    expired = Discount.objects.filter(
+        status=Discount.STATUS_ACTIVE, ends_at__lte=now).order_by('id')
+    for discount in expired:
+        end_discount(discount)
+        ended += 1
+    return applied, ended
+
@@ -0,0 +1,74 @@
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from store.caching import catalog_version, query_signature
+
+# (name, lower bound inclusive, upper bound exclusive); None = open ended
+PRICE_BANDS = [
+    ('under_25', None, Decimal('25')),
+    ('25_to_50', Decimal('25'), Decimal('50')),
+    ('50_to_100', Decimal('50'), Decimal('100')),
+    ('100_and_up', Decimal('100'), None),
+]
+
+FACETS_CACHE_TIMEOUT = 60 * 5
+
+# Query parameters that don't change the counts
+NON_FILTER_PARAMS = ['page', 'page_size', 'ordering', 'facets', 'format']
+
+
+def price_band_q(low, high) -> Q:
+    q = Q()
+    if low is not None:
+        q &= Q(price__gte=low)
+    if high is not None:
+        q &= Q(price__lt=high)
+    return q
+
+
+def product_facets(queryset) -> dict:
+    """
+    Count products per collection and per price band in ONE query.
+
+    GROUP BY collection_id gives the collection counts, and a conditional
+    Count (COUNT(...) FILTER (WHERE ...)) per price band in the same SELECT
+    gives the band counts for each collection, which are summed up here.
+
+    SELECT collection_id,
+           COUNT(id) AS total,
+           COUNT(id) FILTER (WHERE price < 25) AS band_0, ...
+    FROM store_product WHERE <current filters> GROUP BY collection_id
+    """
+    band_counts = {
+        f'band_{index}': Count('id', filter=price_band_q(low, high))
+        for index, (name, low, high) in enumerate(PRICE_BANDS)
+    }
+    # order_by() clears the default ordering so it doesn't end up in GROUP BY
+    rows = queryset.order_by().values('collection_id').annotate(
+        total=Count('id'), **band_counts)
+
+    collections = []
+    bands = [0] * len(PRICE_BANDS)
+    for row in rows:
+        collections.append({'value': row['collection_id'], 'count': row['total']})
+        for index in range(len(PRICE_BANDS)):
+            bands[index] += row[f'band_{index}']
+
+    collections.sort(key=lambda facet: -facet['count'])
+    return {
+        'collection_id': collections,
+        'price': [
+            {'band': name, 'min': low, 'max': high, 'count': bands[index]}
+            for index, (name, low, high) in enumerate(PRICE_BANDS)
+        ],
+    }
+
+
+def cached_product_facets(queryset, params) -> dict:
+    """Facet counts cached per filter signature (and catalog version)."""
+    key = (f'store:facets:{catalog_version()}:'
+           f'{query_signature(params, exclude=NON_FILTER_PARAMS)}')
+    return cache.get_or_set(key, lambda: product_facets(queryset),
+                            FACETS_CACHE_TIMEOUT)
@@ -1,12 +1,117 @@
-from django_filters.rest_framework import FilterSet
+import sys
 
-from store.models import Product
+from django.db.models import Case, IntegerField, Value, When
+from django.db.models.functions import Lower
+from django_filters.rest_framework import CharFilter, ChoiceFilter, FilterSet, MultipleChoiceFilter
+from rest_framework.filters import BaseFilterBackend
+
+from store import trigrams
+from store.models import Customer, Product
+
+
+def prefix_range(prefix: str) -> tuple[str, str | None]:
+    """
+    Turn a prefix into a [low, high) range: 'Smi' -> ('Smi', 'Smj').
+
+    `field >= low AND field < high` is a plain range scan on a B-tree
+    index on every database, unlike LIKE 'Smi%' which SQLite only
+    optimizes for case-insensitive collations.
+
+    Trailing U+10FFFF (the last code point) can't be incremented and is
+    dropped first; a prefix made only of it has no upper bound (None).
+    """
+    stem = prefix.rstrip(chr(sys.maxunicode))
+    if not stem:
+        return prefix, None
+    code = ord(stem[-1]) + 1
+    if 0xD800 <= code <= 0xDFFF:
+        code = 0xE000  # surrogates aren't characters (can't be encoded)
+    return prefix, stem[:-1] + chr(code)
+
+
+def prefix_lookups(field: str, prefix: str) -> dict:
+    """filter() keyword arguments for `field` starting with `prefix`."""
+    low, high = prefix_range(prefix)
+    lookups = {f'{field}__gte': low}
+    if high is not None:
+        lookups[f'{field}__lt'] = high
+    return lookups
 
 
 class ProductFilter(FilterSet):
+    # ?stock_status=low -> inventory > 0 AND inventory < 10, served by the
+    # partial low-stock index (see ProductQuerySet)
+    stock_status = ChoiceFilter(choices=Product.STOCK_STATUS_CHOICES,
+                                method='filter_stock_status')
+
     class Meta:
         model = Product
         fields = {
             'collection_id': ['exact'],
             'price': ['lt', 'gt'],
         }
+
+    def filter_stock_status(self, queryset, name, value):
+        return queryset.stock_status(value)
+
+
+class CustomerFilter(FilterSet):
+    """
+    Prefix-only filters so every lookup can use an index:
+
+    - ?membership=G&membership=S   -> membership IN ('G', 'S')
+    - ?name=Smi                    -> last_name prefix        (last_name, first_name) index
+    - ?name=Smith, Jo              -> last_name = 'Smith' AND first_name prefix
+    - ?email=john@                 -> LOWER(email) prefix     lower(email) index
+    - ?email=john@example.com      -> LOWER(email) = '...'    lower(email) index
+    """
+    membership = MultipleChoiceFilter(choices=Customer.MEMBERSHIP_CHOICES)
+    name = CharFilter(method='filter_name')
+    email = CharFilter(method='filter_email')
+
+    class Meta:
+        model = Customer
+        fields = ['membership']
+
+    def filter_name(self, queryset, name, value):
+        last_name, _, first_name = (part.strip() for part in value.partition(','))
+        if first_name:
+            return queryset.filter(last_name=last_name,
+                                   **prefix_lookups('first_name', first_name))
+        if not last_name:
+            return queryset
+        return queryset.filter(**prefix_lookups('last_name', last_name))
+
+    def filter_email(self, queryset, name, value):
+        value = value.strip().lower()
+        if not value:
+            return queryset
+        # Same expression as the index, so the planner can use it
+        queryset = queryset.alias(email_lower=Lower('email'))
+        if '@' in value and '.' in value.rpartition('@')[2]:
+            return queryset.filter(email_lower=value)
+        return queryset.filter(**prefix_lookups('email_lower', value))
+
+
+class FuzzySearchFilter(BaseFilterBackend):
+    """
+    ?fuzzy=hedphones -> products whose title shares most trigrams with the
+    query (store.trigrams), best match first. Unlike ?search= it tolerates
+    typos. An explicit ?ordering= still wins over the match order.
+    """
+    search_param = 'fuzzy'
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        ranked = trigrams.search(query)
+        if not ranked:
+            return queryset.none()
+        position = Case(
+            *[When(pk=product_id, then=Value(index))
+              for index, (product_id, _) in enumerate(ranked)],
+            output_field=IntegerField(),
+        )
+        return queryset.filter(pk__in=[product_id for product_id, _ in ranked]) \
+            .alias(fuzzy_rank=position).order_by('fuzzy_rank')
@@ -0,0 +1,96 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import F, Q
+
+from store.changes import record_bulk_product_changes
+from store.models import Product, StockEntry
+
+# id__in chunk size, below SQLite's bound-parameter limit
+CHUNK_SIZE = 500
+
+
+def record_stock_events(events) -> list[StockEntry]:
+    """
+    Append [{'product': id, 'delta': -1, 'reason': 'sale'}, ...] to the
+    ledger with one INSERT. Nothing is read or locked, so this does not
+    check that enough stock is available: use store.stock for movements
+    that must not oversell.
+    """
+    return StockEntry.objects.bulk_create([
+        StockEntry(product_id=event['product'], delta=event['delta'],
+                   reason=event.get('reason', ''))
+        for event in events
+    ])
+
+
+def with_available(queryset):
+    """
+    Annotate `pending` and `available` = inventory + pending
+    (ProductQuerySet.with_available). Both come from the same statement,
+    so they are consistent with each other even while the compaction job
+    runs (it moves deltas from one to the other in a single transaction).
+    """
+    return queryset.with_available()
+
+
+def compact_ledger(batch_size=5000) -> dict:
+    """
+    Fold pending entries into Product.inventory, `batch_size` entries per
+    transaction. Each batch adds the summed deltas to the inventory of
+    its products (one UPDATE per product, in id order) and flags the
+    entries compacted.
+
+    Entries are picked by the flag, not by an id checkpoint: an entry
+    whose transaction commits late (with an id lower than entries already
+    compacted) is still pending and gets folded in by the next run.
+
+    The ledger doesn't check balances, so a product's inventory plus its
+    entries can run past what the column holds (Product.MAX_INVENTORY).
+    Such a product is not updated: its entries stay pending and it is
+    listed under `overflow` for someone to correct.
+    """
+    entries = 0
+    products = set()
+    overflow = set()
+    while True:
+        with transaction.atomic():
+            batch = list(
+                StockEntry.objects.select_for_update()
+                .filter(compacted=False)
+                .exclude(product_id__in=overflow)
+                .order_by('product_id', 'id')
+                .values_list('id', 'product_id', 'delta')[:batch_size]
+            )
+            if not batch:
+                break
+            totals = Counter()
+            for _, product_id, delta in batch:
+                totals[product_id] += delta
+            changed = []
+            for product_id in sorted(product_id for product_id, total in totals.items() if total):
+                total = totals[product_id]
+                in_range = (Q(inventory__lte=Product.MAX_INVENTORY - total) if total > 0
+                            else Q(inventory__gte=-Product.MAX_INVENTORY - total))
+                if Product.objects.filter(in_range, id=product_id).update(
+                        inventory=F('inventory') + total):
+                    changed.append(product_id)
+                else:
+                    overflow.add(product_id)
+                    del totals[product_id]
+            ids = [entry_id for entry_id, product_id, _ in batch if product_id not in overflow]
+            for start in range(0, len(ids), CHUNK_SIZE):
+                StockEntry.objects.filter(id__in=ids[start:start + CHUNK_SIZE]) \
+                    .update(compacted=True)
+            if changed:
+                record_bulk_product_changes(Product.objects.filter(id__in=changed))
+        entries += len(ids)
+        products.update(totals)
+    return {'entries': entries, 'products': len(products), 'overflow': sorted(overflow)}
+
+
+def prune_ledger(before) -> int:
+    """Delete compacted entries created before `before` (they are already
+    in the inventory). Only needed if the full history isn't wanted."""
+    deleted, _ = StockEntry.objects.filter(compacted=True, created_at__lt=before).delete()
+    return deleted
@@ -0,0 +1,162 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+
+from store.models import Collection, Product
+
+
+class ModelLookup:
+    """
+    Two-tier cache for fetching model instances by primary key.
+
+    Tier 1: a small in-process LRU (OrderedDict) with a TTL. No network,
+            no pickling - a hit costs a dict lookup.
+    Tier 2: the shared Django cache, so all workers benefit from one fetch.
+    Misses in both tiers are loaded from the DB with ONE `pk IN (...)` query.
+
+    Invalidation:
+    - post_save writes the fresh instance to the shared tier (write-through)
+      and drops it from the local LRU; post_delete removes it.
+    - Readers filling misses use cache.add(), which never overwrites, so a
+      slow reader can't replace a fresher value written by a save.
+    - Entries carry `last_update` (when the model has it) and the local
+      tier always keeps the newer copy.
+    - invalidate_all() bumps a generation number that is part of every
+      shared key (for bulk UPDATEs that don't send signals).
+    - Other processes' local tiers expire after `local_ttl` seconds, which
+      bounds how stale they can be.
+
+    Callers get a shallow copy, so changing an attribute on the returned
+    object never leaks into the cache.
+    """
+
+    def __init__(self, model, max_size=2048, local_ttl=30, shared_timeout=300):
+        self.model = model
+        self.max_size = max_size
+        self.local_ttl = local_ttl
+        self.shared_timeout = shared_timeout
+        self.name = model._meta.label_lower
+        self._local = OrderedDict()  # pk -> (expires_at, instance)
+        self._lock = threading.Lock()
+
+    def __deepcopy__(self, memo):
+        # Shared singleton: DRF deep-copies serializer fields (and their
+        # arguments) for every serializer instance
+        return self
+
+    # ----------------------------------------------------------------
+    # Reading
+    # ----------------------------------------------------------------
+
+    def get(self, pk):
+        """Return the instance with this pk, or None if it doesn't exist."""
+        return self.get_many([pk]).get(self._normalize(pk))
+
+    def get_many(self, pks) -> dict:
+        """Return {pk: instance} for the pks that exist (one IN query at most)."""
+        found = {}
+        missing = []
+        now = time.monotonic()
+        pks = {self._normalize(pk) for pk in pks} - {None}
+        with self._lock:
+            for pk in pks:
+                entry = self._local.get(pk)
+                if entry is not None and entry[0] > now:
+                    self._local.move_to_end(pk)
+                    found[pk] = entry[1]
+                else:
+                    missing.append(pk)
+
+        if missing:
+            generation = self._generation()
+            keys = {self._key(pk, generation): pk for pk in missing}
+            fetched = {
+                keys[key]: instance
+                for key, instance in cache.get_many(list(keys)).items()
+            }
+            missing = [pk for pk in missing if pk not in fetched]
+
+            if missing:
+                from_db = self.model.objects.in_bulk(missing)
+                for pk, instance in from_db.items():
+                    cache.add(self._key(pk, generation), instance,
+                              self.shared_timeout)
+                fetched.update(from_db)
+
+            self._remember(fetched.values())
+            found.update(fetched)
+
+        return {pk: copy.copy(instance) for pk, instance in found.items()}
+
+    # ----------------------------------------------------------------
+    # Invalidation
+    # ----------------------------------------------------------------
+
+    def refresh(self, instance):
+        """Store the current version of a saved instance (post_save)."""
+        cache.set(self._key(instance.pk), copy.copy(instance), self.shared_timeout)
+        with self._lock:
+            self._local.pop(instance.pk, None)
+
+    def invalidate(self, pk):
+        pk = self._normalize(pk)
+        cache.delete(self._key(pk))
+        with self._lock:
+            self._local.pop(pk, None)
+
+    def invalidate_all(self):
+        """Forget everything, e.g. after a bulk UPDATE (doesn't send signals)."""
+        try:
+            cache.incr(self._generation_key())
+        except ValueError:
+            cache.set(self._generation_key(), 1, timeout=None)
+        with self._lock:
+            self._local.clear()
+
+    # ----------------------------------------------------------------
+    # Helpers
+    # ----------------------------------------------------------------
+
+    def _remember(self, instances):
+        expires_at = time.monotonic() + self.local_ttl
+        with self._lock:
+            for instance in instances:
+                current = self._local.get(instance.pk)
+                if current is not None and self._is_newer(current[1], instance):
+                    continue
+                self._local[instance.pk] = (expires_at, instance)
+                self._local.move_to_end(instance.pk)
+            while len(self._local) > self.max_size:
+                self._local.popitem(last=False)
+
+    def _is_newer(self, a, b) -> bool:
+        a_updated = getattr(a, 'last_update', None)
+        b_updated = getattr(b, 'last_update', None)
+        return a_updated is not None and b_updated is not None and a_updated > b_updated
+
+    def _normalize(self, pk):
+        # '5' from a URL and 5 from a serializer are the same key;
+        # values that can't be a pk (e.g. 'abc') become None
+        try:
+            return self.model._meta.pk.to_python(pk)
+        except ValidationError:
+            return None
+
+    def _generation_key(self) -> str:
+        return f'store:lookup-generation:{self.name}'
+
+    def _generation(self) -> int:
+        return cache.get(self._generation_key(), 0)
+
+    def _key(self, pk, generation=None) -> str:
+        if generation is None:
+            generation = self._generation()
+        return f'store:lookup:{self.name}:{generation}:{pk}'
+
+
+product_lookup = ModelLookup(Product)
+collection_lookup = ModelLookup(Collection, max_size=512)
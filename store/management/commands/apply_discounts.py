@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from store.discounts import apply_due_discounts
+
+
+class Command(BaseCommand):
+    help = ('Apply scheduled discounts whose start time has come and end '
+            'discounts whose end time has passed. Run it every minute (cron).')
+
+    def handle(self, *args, **options):
+        applied, ended = apply_due_discounts()
+        self.stdout.write(self.style.SUCCESS(
+            f'Applied {applied} discounts, ended {ended} discounts.'))
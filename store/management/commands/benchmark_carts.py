@@ -0,0 +1,109 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from store.cartstore import CartStore
+from store.models import Cart, CartItem, Product
+from store.sharding import cart_shards, group_by_shard, shard_for
+
+
+def write_to_db(cart_id, product_id, quantity):
+    """What the cart-items API does per change: upsert the line and touch
+    the cart, in its own transaction on the cart's shard."""
+    shard = shard_for(cart_id)
+    with transaction.atomic(using=shard):
+        item, created = CartItem.objects.using(shard).get_or_create(
+            cart_id=cart_id, product_id=product_id, defaults={'quantity': quantity})
+        if not created:
+            item.quantity += quantity
+            item.save(update_fields=['quantity'])
+        Cart.objects.using(shard).get(pk=cart_id).save(update_fields=['updated_at'])
+
+
+class Command(BaseCommand):
+    help = ('Cart changes per second written straight to the database(s) vs '
+            'through the write-behind cart store (store.cartstore), plus the '
+            'time to flush the store. With sharded carts (store.sharding), '
+            '--parallel writes to all shards at once. Creates and deletes its '
+            'own carts.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--carts', type=int, default=200)
+        parser.add_argument('--changes', type=int, default=20,
+                            help='Changes per cart.')
+        parser.add_argument('--parallel', action='store_true',
+                            help='One writer thread per cart shard.')
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Carts per flush transaction.')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        product_ids = list(Product.objects.values_list('id', flat=True)[:50])
+        if not product_ids:
+            self.stderr.write('No products to put in carts.')
+            return
+        rng = random.Random(options['seed'])
+        changes = [(index, rng.choice(product_ids), rng.randint(1, 3))
+                   for index in range(options['carts'])
+                   for _ in range(options['changes'])]
+        rng.shuffle(changes)
+        # A store of its own, so the benchmark never touches real carts' keys
+        store = CartStore(prefix='store:cart-benchmark')
+        threads = len(cart_shards()) if options['parallel'] else 1
+        self.stdout.write(f'Cart shards: {len(cart_shards())}, writer threads: {threads}')
+
+        results = {}
+        for name in ['database', 'cart store']:
+            carts = [Cart() for _ in range(options['carts'])]
+            by_id = {str(cart.id): cart for cart in carts}
+            for shard, ids in group_by_shard(by_id).items():
+                Cart.objects.using(shard).bulk_create([by_id[cart_id] for cart_id in ids])
+            ids = list(by_id)
+            write = write_to_db if name == 'database' else store.add
+            try:
+                elapsed = self.run(write, ids, changes, options['parallel'])
+                flushed = time.perf_counter()
+                if name == 'cart store':
+                    store.flush(batch_size=options['batch_size'])
+                flush_seconds = time.perf_counter() - flushed
+                results[name] = sorted(
+                    row for shard, shard_ids in group_by_shard(ids).items()
+                    for row in CartItem.objects.using(shard).filter(cart_id__in=shard_ids)
+                    .values_list('product_id', 'quantity'))
+                self.stdout.write(
+                    f'{name:<12} {len(changes) / elapsed:>10.0f} changes/s  '
+                    f'flush: {flush_seconds * 1000:>7.1f} ms')
+            finally:
+                for shard, shard_ids in group_by_shard(ids).items():
+                    Cart.objects.using(shard).filter(id__in=shard_ids).delete()
+                for cart_id in ids:
+                    store.discard(cart_id)
+
+        same = results['database'] == results['cart store']
+        self.stdout.write(f'Same cart contents after flush: {same}')
+
+    def run(self, write, ids, changes, parallel):
+        # One thread per shard: SQLite allows one writer per file, so
+        # threads only add write capacity when they write to different files
+        shards = cart_shards()
+        chunks = [[change for change in changes if shard_for(ids[change[0]]) == shard]
+                  for shard in shards]
+
+        def worker(chunk):
+            try:
+                for index, product_id, quantity in chunk:
+                    write(ids[index], product_id, quantity)
+            finally:
+                connections.close_all()
+
+        started = time.perf_counter()
+        if not parallel:
+            for index, product_id, quantity in changes:
+                write(ids[index], product_id, quantity)
+        else:
+            with ThreadPoolExecutor(max_workers=len(shards)) as pool:
+                list(pool.map(worker, chunks))
+        return time.perf_counter() - started
@@ -0,0 +1,92 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Avg, F, Max, Min, Sum
+from django.test.utils import CaptureQueriesContext
+
+from store.facets import PRICE_BANDS, price_band_q
+from store.models import Customer, Order, OrderItem, Product
+from store.stats import (CUSTOMER_SEGMENTS, PRODUCT_SEGMENTS, STOCK_BUCKETS,
+                         catalog_stats, cached_catalog_stats, money)
+
+
+def fanout_stats() -> dict:
+    """
+    The same numbers as store.stats.catalog_stats(), computed the way the
+    playground views do: one .count() / .aggregate() per number.
+    """
+    products = Product.objects.all()
+    price = {
+        'min': money(products.aggregate(value=Min('price'))['value']),
+        'max': money(products.aggregate(value=Max('price'))['value']),
+        'avg': money(products.aggregate(value=Avg('price'))['value']),
+        'sum': money(products.aggregate(value=Sum('price'))['value'] or 0),
+    }
+    customers = Customer.objects.all()
+    items = OrderItem.objects.all()
+    return {
+        'products': {
+            'count': products.count(),
+            'total_inventory': products.aggregate(value=Sum('inventory'))['value'] or 0,
+            'inventory_value': money(products.aggregate(
+                value=Sum(F('price') * F('inventory')))['value'] or 0),
+            'price': price,
+            'price_bands': {name: products.filter(price_band_q(low, high)).count()
+                            for name, low, high in PRICE_BANDS},
+            'stock': {name: products.filter(q).count() for name, q in STOCK_BUCKETS.items()},
+            'segments': {name: products.filter(q).count()
+                         for name, q in PRODUCT_SEGMENTS.items()},
+        },
+        'customers': {
+            'count': customers.count(),
+            'membership': {label.lower(): customers.filter(membership=code).count()
+                           for code, label in Customer.MEMBERSHIP_CHOICES},
+            'segments': {name: customers.filter(q).count()
+                         for name, q in CUSTOMER_SEGMENTS.items()},
+        },
+        'orders': {
+            'count': Order.objects.count(),
+            'first_placed_at': Order.objects.aggregate(value=Min('placed_at'))['value'],
+            'last_placed_at': Order.objects.aggregate(value=Max('placed_at'))['value'],
+            'lines': items.count(),
+            'units': items.aggregate(value=Sum('quantity'))['value'] or 0,
+            'revenue': money(items.aggregate(
+                value=Sum(F('quantity') * F('unit_price')))['value'] or 0),
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = ('Compare the single-query /store/stats/ numbers with the '
+            'one-query-per-number (playground style) version.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Runs per variant (the best time is reported).')
+
+    def handle(self, *args, **options):
+        variants = [
+            ('fan-out (.count() per number)', fanout_stats),
+            ('conditional aggregation', catalog_stats),
+            ('conditional aggregation, cached', cached_catalog_stats),
+        ]
+        results = {}
+        for name, compute in variants:
+            best = None
+            for _ in range(options['repeat']):
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    results[name] = compute()
+                    elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            self.stdout.write(
+                f'{name:<34} {len(queries.captured_queries):>3} queries '
+                f'{best * 1000:>9.2f} ms')
+
+        fanout, single = results[variants[0][0]], results[variants[1][0]]
+        single = {key: value for key, value in single.items() if key != 'generated_at'}
+        if fanout == single:
+            self.stdout.write(self.style.SUCCESS('Both versions return the same numbers.'))
+        else:
+            self.stdout.write(self.style.ERROR('The versions disagree!'))
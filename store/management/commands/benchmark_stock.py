@@ -0,0 +1,120 @@
+import os
+import random
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from store.models import Product
+from store.stock import StockError, apply_stock_movements, net_deltas
+
+START_INVENTORY = 1_000_000
+
+
+def read_modify_write(adjustments, transfers):
+    """The playground transfer_inventory() pattern: lock, read, compute in
+    Python, write back - one product at a time, in request order."""
+    with transaction.atomic():
+        for product_id, delta in net_deltas(adjustments, transfers).items():
+            product = Product.objects.select_for_update().get(id=product_id)
+            if product.inventory + delta < 0:
+                raise StockError('Insufficient stock.')
+            Product.objects.filter(id=product_id).update(inventory=product.inventory + delta)
+
+
+class Command(BaseCommand):
+    help = ('Contention benchmark for stock movements on a few hot products: '
+            'read-modify-write with select_for_update vs store.stock '
+            '(conditional UPDATEs in id order). Runs in a throwaway database, '
+            'never against the catalog.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--batches', type=int, default=50,
+                            help='Batches per thread.')
+        parser.add_argument('--products', type=int, default=5,
+                            help='Hot products every batch picks from.')
+        parser.add_argument('--lines', type=int, default=4,
+                            help='Transfers and adjustments per batch.')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        # A test database, as the test runner creates it (migrated, empty);
+        # on SQLite a file rather than the default in-memory one, so that
+        # every worker thread locks it like the real one
+        with tempfile.TemporaryDirectory() as directory:
+            if connection.vendor == 'sqlite':
+                connection.settings_dict['TEST']['NAME'] = os.path.join(
+                    directory, 'benchmark.sqlite3')
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True,
+                                                          serialize=False)
+            try:
+                self.benchmark(options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def benchmark(self, options):
+        products = Product.objects.bulk_create([
+            Product(title=f'benchmark-stock-{index}', description='benchmark',
+                    price=1, inventory=START_INVENTORY)
+            for index in range(options['products'])
+        ])
+        ids = [product.id for product in products]
+        for name, apply in [('read-modify-write', read_modify_write),
+                            ('conditional update', apply_stock_movements)]:
+            Product.objects.filter(id__in=ids).update(inventory=START_INVENTORY)
+            self.run(name, apply, ids, options)
+
+    def run(self, name, apply, ids, options):
+        rng = random.Random(options['seed'])
+        batches = [self.make_batch(rng, ids, options['lines'])
+                   for _ in range(options['threads'] * options['batches'])]
+
+        def worker(chunk):
+            applied, errors = Counter(), Counter()
+            try:
+                for adjustments, transfers in chunk:
+                    try:
+                        apply(adjustments, transfers)
+                        applied.update(net_deltas(adjustments, transfers))
+                        applied['batches'] += 1
+                    except Exception as error:
+                        errors[type(error).__name__] += 1
+            finally:
+                connection.close()
+            return applied, errors
+
+        chunks = [batches[index::options['threads']] for index in range(options['threads'])]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            results = list(pool.map(worker, chunks))
+        elapsed = time.perf_counter() - started
+
+        applied, errors = Counter(), Counter()
+        for worker_applied, worker_errors in results:
+            applied.update(worker_applied)
+            errors.update(worker_errors)
+        done = applied.pop('batches', 0)
+        # Every applied batch must be reflected exactly once
+        lost = sum(
+            inventory != START_INVENTORY + applied[product_id]
+            for product_id, inventory in Product.objects.filter(id__in=ids)
+            .values_list('id', 'inventory')
+        )
+        self.stdout.write(
+            f'{name:<20} {done:>5}/{len(batches)} batches '
+            f'{done / elapsed:>8.1f} batches/s  errors: {dict(errors) or 0}  '
+            f'products with lost updates: {lost}')
+
+    def make_batch(self, rng, ids, lines):
+        adjustments = [{'product': rng.choice(ids), 'delta': rng.choice([-2, -1, 1, 2])}
+                       for _ in range(lines // 2)]
+        transfers = []
+        for _ in range(lines - len(adjustments)):
+            from_product, to_product = rng.sample(ids, 2)
+            transfers.append({'from_product': from_product, 'to_product': to_product,
+                              'quantity': rng.randint(1, 5)})
+        return adjustments, transfers
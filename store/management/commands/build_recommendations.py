@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from store.recommendations import TOP_K, reset, update_cooccurrence
+
+
+class Command(BaseCommand):
+    help = ('Update "frequently bought together" data from cart and order '
+            'lines added since the last run.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Drop all co-occurrence data and rebuild from scratch.')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Lines processed per transaction.')
+        parser.add_argument('--top-k', type=int, default=TOP_K,
+                            help='Related products kept per product.')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            reset()
+        result = update_cooccurrence(
+            batch_size=options['batch_size'], top_k=options['top_k'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {result['lines']} new lines, "
+            f"updated {result['products']} products."))
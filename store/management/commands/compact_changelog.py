@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from store.changes import compact_changes, prune_deletes
+
+
+class Command(BaseCommand):
+    help = 'Compact the catalog change log and prune old delete markers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=30,
+            help='Keep delete markers for this many days (default: 30).')
+        parser.add_argument(
+            '--batch-size', type=int, default=10_000,
+            help='Number of sequence numbers handled per DELETE.')
+
+    def handle(self, *args, **options):
+        superseded = compact_changes(batch_size=options['batch_size'])
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        tombstones = prune_deletes(cutoff)
+        self.stdout.write(self.style.SUCCESS(
+            f'Removed {superseded} superseded entries and '
+            f'{tombstones} delete markers older than {options["days"]} days.'))
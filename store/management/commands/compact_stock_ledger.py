@@ -0,0 +1,33 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from store.ledger import compact_ledger, prune_ledger
+
+
+class Command(BaseCommand):
+    help = ('Fold pending stock ledger entries into Product.inventory and '
+            'optionally prune old compacted entries.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Entries folded per transaction.')
+        parser.add_argument(
+            '--prune-days', type=int,
+            help='Also delete compacted entries older than this many days '
+                 '(default: keep the full history).')
+
+    def handle(self, *args, **options):
+        result = compact_ledger(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Folded {result['entries']} entries into "
+            f"{result['products']} products."))
+        if result['overflow']:
+            self.stdout.write(self.style.WARNING(
+                f"Left pending, inventory would overflow: products {result['overflow']}."))
+        if options['prune_days'] is not None:
+            cutoff = timezone.now() - timedelta(days=options['prune_days'])
+            pruned = prune_ledger(cutoff)
+            self.stdout.write(f'Pruned {pruned} compacted entries.')
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from store.cartstore import cart_store
+
+
+class Command(BaseCommand):
+    help = ('Write carts changed in the cart store (store.cartstore) to the '
+            'database. Run it every few seconds while the store is enabled.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Carts written per transaction.')
+
+    def handle(self, *args, **options):
+        result = cart_store.flush(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Flushed {result['carts']} carts "
+            f"({result['busy']} busy, left for the next run)."))
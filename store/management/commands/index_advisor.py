@@ -0,0 +1,185 @@
+import re
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.http import Http404
+from django.urls import URLPattern
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import GenericAPIView
+from rest_framework.test import APIRequestFactory
+
+from store import urls as store_urls
+from store.sharding import ScatterGather
+
+# Plan lines that mean "read every row" or "sort rows without an index",
+# per database vendor
+WARNING_PATTERNS = {
+    'sqlite': [
+        (re.compile(r'\bSCAN (?!.*\bUSING\b)'), 'full table scan'),
+        (re.compile(r'USE TEMP B-TREE'), 'temp B-tree sort'),
+    ],
+    'postgresql': [
+        (re.compile(r'Seq Scan'), 'full table scan'),
+        (re.compile(r'^\s*(->\s*)?Sort\b'), 'sort without index'),
+    ],
+}
+
+
+class Command(BaseCommand):
+    help = ('Replay the list querysets of every route in store.urls, run '
+            'EXPLAIN on them and flag full scans and sorts without an index. '
+            'Only list routes are replayed, not detail routes or custom actions.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verbose-plans', action='store_true',
+            help='Print the full plan for every query, not only warnings.')
+        parser.add_argument(
+            '--fail-on-warnings', action='store_true',
+            help='Exit with an error if any query was flagged (for CI).')
+
+    def handle(self, *args, **options):
+        patterns = WARNING_PATTERNS.get(connection.vendor)
+        if patterns is None:
+            raise CommandError(
+                f'No EXPLAIN rules for the {connection.vendor} backend.')
+
+        self.skipped = 0
+        flagged = 0
+        checked = 0
+        for label, queryset in self.replayed_querysets():
+            checked += 1
+            plan = queryset.explain()
+            warnings = [
+                (line.strip(), reason)
+                for line in plan.splitlines()
+                for pattern, reason in patterns
+                if pattern.search(line)
+            ]
+            if warnings:
+                flagged += 1
+                self.stdout.write(self.style.WARNING(label))
+                for line, reason in warnings:
+                    self.stdout.write(f'    {reason}: {line}')
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{label}  ok'))
+            if options['verbose_plans']:
+                for line in plan.splitlines():
+                    self.stdout.write(f'      | {line}')
+
+        self.stdout.write(f'\n{checked} queries checked, {flagged} flagged, '
+                          f'{self.skipped} skipped.')
+        self.stdout.write('Only list routes were replayed; detail routes and custom '
+                          'actions (e.g. /products/low-stock/) are not checked.')
+        if flagged and options['fail_on_warnings']:
+            raise CommandError(f'{flagged} queries need an index.')
+
+    # ----------------------------------------------------------------
+    # Collecting querysets
+    # ----------------------------------------------------------------
+
+    def replayed_querysets(self):
+        """
+        Yield (label, queryset) for each list route and query variant.
+
+        For every router URL that maps GET to `list`, the viewset is set up
+        the same way DRF does for a real request, and its queryset is run
+        through the view's filter backends so filters and ordering end up
+        in the SQL. Variants: no parameters, each ordering field (asc and
+        desc) and each filter of the view's filterset.
+        """
+        factory = APIRequestFactory()
+        for pattern in store_urls.urlpatterns:
+            if not isinstance(pattern, URLPattern):
+                continue
+            callback = pattern.callback
+            view_class = getattr(callback, 'cls', None)
+            actions = getattr(callback, 'actions', None) or {}
+            if (view_class is None or actions.get('get') != 'list'
+                    or not issubclass(view_class, GenericAPIView)
+                    or pattern.pattern.regex.pattern.endswith(r'\.(?P<format>[a-z0-9]+)/?$')):
+                continue
+
+            # Nested routes (e.g. products/{product_pk}/reviews/) need their
+            # URL kwargs; any well-formed id works for the plan
+            kwargs = {name: self.sample_pk(name) for name in pattern.pattern.regex.groupindex}
+            for params in self.query_variants(view_class):
+                route = pattern.pattern.regex.pattern.strip('^$')
+                label = f'{route}?{self.format_params(params)}'
+                request = factory.get('/', params)
+                view = view_class(**callback.initkwargs)
+                view.action_map = actions
+                view.action = 'list'
+                view.args = ()
+                view.kwargs = kwargs
+                view.format_kwarg = None
+                view.request = view.initialize_request(request)
+                try:
+                    queryset = view.filter_queryset(view.get_queryset())
+                except ValidationError as error:
+                    # The sample value didn't pass the filterset: this
+                    # variant's plan is unknown, so say so
+                    self.skipped += 1
+                    self.stdout.write(self.style.WARNING(
+                        f'{label}  skipped (invalid sample parameters: {error.detail})'))
+                    continue
+                except Http404:
+                    # The view checks that the parent object exists
+                    self.skipped += 1
+                    self.stdout.write(f'{label}  skipped (no object with {kwargs})')
+                    break
+                # Only one page is fetched per request
+                page_size = None
+                if view.paginator is not None:
+                    page_size = getattr(view.paginator, 'page_size', None) or 100
+                if isinstance(queryset, ScatterGather):
+                    # Sharded carts: the same query runs on every shard
+                    for shard_queryset in queryset.shard_querysets():
+                        yield (f'{label} [{shard_queryset.db}]',
+                               shard_queryset[:page_size] if page_size else shard_queryset)
+                    continue
+                if page_size:
+                    queryset = queryset[:page_size]
+                yield label, queryset
+
+    def sample_pk(self, name):
+        # Carts have UUID keys; every other model an integer id
+        if name == 'cart_pk':
+            return str(uuid.UUID(int=1))
+        return '1'
+
+    def query_variants(self, view_class):
+        yield {}
+        for field in getattr(view_class, 'ordering_fields', None) or []:
+            if field == '__all__':
+                continue
+            yield {'ordering': field}
+            yield {'ordering': f'-{field}'}
+        filterset_class = getattr(view_class, 'filterset_class', None)
+        if filterset_class is not None:
+            samples = {
+                name: self.sample_value(filter_)
+                for name, filter_ in filterset_class.base_filters.items()
+            }
+            samples = {name: value for name, value in samples.items()
+                       if value is not None}
+            for name, value in samples.items():
+                yield {name: value}
+            if len(samples) > 1:
+                yield samples
+
+    def sample_value(self, filter_):
+        # Model choice filters only accept ids that exist
+        queryset = getattr(filter_, 'queryset', None)
+        if queryset is not None:
+            return queryset.values_list('pk', flat=True).first()
+        # Choice filters only accept one of their choices
+        choices = filter_.extra.get('choices')
+        if choices is not None:
+            choices = list(choices() if callable(choices) else choices)
+            return choices[0][0] if choices else None
+        return '1'
+
+    def format_params(self, params):
+        return '&'.join(f'{key}={value}' for key, value in params.items())
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from store.trigrams import rebuild
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the trigram index used by ?fuzzy= product search, e.g. '
+            'after loading products with bulk_create or raw SQL.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--missing', action='store_true',
+                            help='Only index products that have no trigrams yet.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Products indexed per transaction.')
+
+    def handle(self, *args, **options):
+        count = rebuild(batch_size=options['batch_size'],
+                        missing_only=options['missing'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} products.'))
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from store.caching import catalog_cache
+from store.warmer import cache_is_shared, warm_top
+
+
+class Command(BaseCommand):
+    help = ('Re-render the most requested catalog pages (and a default set) '
+            'so the first users after a deploy or cache flush get cache hits. '
+            'Needs a cache shared with the web workers (Redis, Memcached, ...).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int,
+                            help='Number of recorded query signatures to warm.')
+        parser.add_argument('--workers', type=int,
+                            help='Thread pool size.')
+        parser.add_argument('--host',
+                            help='Host header used for the warm-up requests '
+                                 '(part of the cache key).')
+        parser.add_argument('--no-defaults', action='store_true',
+                            help='Only warm recorded signatures.')
+
+    def handle(self, *args, **options):
+        if not cache_is_shared():
+            raise CommandError(
+                'The default cache is local to this process, so warming it would not '
+                'help the web workers. Configure a shared cache (Redis, Memcached, ...) '
+                'in CACHES, or use STORE_CACHE_WARMER ON_STARTUP / AFTER_INVALIDATION '
+                'to warm inside the workers.')
+        misses_before = self.misses()
+        report = warm_top(
+            limit=options['top'],
+            workers=options['workers'],
+            host=options['host'],
+            defaults=not options['no_defaults'],
+        )
+        misses = self.misses() - misses_before
+        self.stdout.write(
+            f"Warmed {report['signatures']} signatures in {report['seconds']}s "
+            f"({misses} pages rendered, {report['errors']} errors)")
+        self.stdout.write(self.style.SUCCESS(
+            f"Hit rate for these signatures: {report['hit_rate_before']:.0%} "
+            f"-> {report['hit_rate_after']:.0%}"))
+
+    def misses(self):
+        # Pages rendered by catalog_cache in this process so far
+        return sum(counters.get('misses', 0) + counters.get('early_refreshes', 0)
+                   for counters in catalog_cache.metrics().values())
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0005_alter_cartitem_cart_alter_cartitem_unique_together'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLogEntry',
+            fields=[
+                ('seq', models.BigAutoField(primary_key=True, serialize=False)),
+                ('entity', models.CharField(max_length=50)),
+                ('object_id', models.BigIntegerField()),
+                ('action', models.CharField(choices=[('U', 'Upsert'), ('D', 'Delete')], max_length=1)),
+                ('changed_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['seq'],
+                'indexes': [models.Index(fields=['entity', 'object_id', 'seq'], name='store_chang_entity_fdf9b2_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0006_changelogentry'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='customer',
+            name='store_custo_email_8208ee_idx',
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['last_name', 'first_name'], name='store_custo_last_na_2e448d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['collection', 'price'], name='store_produ_collect_c955f3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price'], name='store_produ_price_2d55a6_idx'),
+        ),
+    ]
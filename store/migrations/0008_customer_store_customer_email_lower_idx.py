@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:26
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0007_remove_customer_store_custo_email_8208ee_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(django.db.models.functions.text.Lower('email'), name='store_customer_email_lower_idx'),
+        ),
+    ]
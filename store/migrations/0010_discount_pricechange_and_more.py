@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0009_orderitem_order_store_order_custome_4e931e_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Discount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('P', 'Percent'), ('F', 'Fixed amount')], default='P', max_length=1)),
+                ('value', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('filters', models.JSONField(blank=True, default=dict)),
+                ('starts_at', models.DateTimeField(blank=True, null=True)),
+                ('ends_at', models.DateTimeField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('S', 'Scheduled'), ('A', 'Active'), ('E', 'Ended')], default='S', max_length=1)),
+                ('product_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('applied_at', models.DateTimeField(blank=True, null=True)),
+                ('ended_at', models.DateTimeField(blank=True, null=True)),
+                ('collection', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='discounts', to='store.collection')),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='discounts', to='store.product')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PriceChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('old_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('new_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('changed_at', models.DateTimeField()),
+                ('discount', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_changes', to='store.discount')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_changes', to='store.product')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='discount',
+            index=models.Index(fields=['status', 'starts_at'], name='store_disco_status_3c90de_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='discount',
+            index=models.Index(fields=['status', 'ends_at'], name='store_disco_status_e0fec2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pricechange',
+            index=models.Index(fields=['discount', 'product'], name='store_price_discoun_dbe0c6_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0012_producttrigram'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['membership', 'last_name', 'first_name'], name='store_custo_members_0a38c3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['-placed_at', '-id'], name='store_order_placed__e37042_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['inventory'], name='store_produ_invento_b4e03e_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0013_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockEntry',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('delta', models.IntegerField()),
+                ('reason', models.CharField(blank=True, max_length=50)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('compacted', models.BooleanField(default=False)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_entries', to='store.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', '-id'], name='store_stock_product_35f339_idx'), models.Index(condition=models.Q(('compacted', False)), fields=['product', 'id'], name='store_stockentry_pending_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0015_cartitem_product_no_constraint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='customer',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='carts', to='store.customer'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0016_cart_customer'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('inventory__gt', 0), ('inventory__lt', 10)), fields=['inventory', 'id'], name='product_low_stock_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('inventory__lte', 0)), fields=['id'], name='product_out_of_stock_idx'),
+        ),
+    ]
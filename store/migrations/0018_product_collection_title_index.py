@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0017_product_stock_partial_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['collection', 'title', 'id'], name='store_produ_collect_59c882_idx'),
+        ),
+    ]
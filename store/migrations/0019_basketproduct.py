@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0018_product_collection_title_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BasketProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=20)),
+                ('basket', models.CharField(max_length=36)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='store.product')),
+            ],
+            options={
+                'unique_together': {('source', 'basket', 'product')},
+            },
+        ),
+    ]
@@ -1,5 +1,6 @@
 from uuid import uuid4
 from django.db import models
+from django.db.models.functions import Coalesce, Lower
 
 # Create your models here.
 
@@ -24,7 +25,96 @@ class Collection(models.Model):
         verbose_name_plural = 'Collections'  # Plural name shown in Django admin
 
 
+def pending_stock():
+    """
+    Expression: sum of a product's ledger entries (StockEntry) not yet
+    folded into its inventory, 0 if none.
+    """
+    pending = StockEntry.objects.filter(
+        product=models.OuterRef('pk'), compacted=False,
+    ).order_by().values('product').annotate(total=models.Sum('delta')).values('total')
+    return Coalesce(models.Subquery(pending, output_field=models.IntegerField()),
+                    models.Value(0))
+
+
+class ProductQuerySet(models.QuerySet):
+    """
+    Stock status in SQL, so "low-stock products" is a WHERE instead of
+    loading every product to ask product.is_low_stock:
+
+        Product.objects.low_stock()
+        Product.objects.stock_status('out')
+        Product.objects.with_stock_status()   # .stock_status = 'in' / 'low' / 'out'
+
+    Everything is decided on the AVAILABLE stock, inventory + pending
+    ledger entries (see StockEntry), the same number store.stock checks
+    before removing units. Low and out-of-stock filters first narrow the
+    rows to those whose inventory matches (the partial indexes in
+    Product.Meta) or that have pending entries (the pending index on
+    StockEntry), so they still read only a few rows.
+
+    `low` defaults to Product.LOW_STOCK; another threshold works the same
+    but can't use the low-stock partial index.
+    """
+
+    def with_available(self):
+        """Annotate `pending` and `available` = inventory + pending."""
+        return self.annotate(pending=pending_stock()).annotate(
+            available=models.F('inventory') + models.F('pending'))
+
+    def _available(self):
+        return self.alias(available=models.F('inventory') + pending_stock())
+
+    def _pending_products(self):
+        return StockEntry.objects.filter(compacted=False).values('product_id')
+
+    def in_stock(self):
+        return self._available().filter(available__gt=0)
+
+    def low_stock(self, low=None):
+        low = low or Product.LOW_STOCK
+        return self._available().filter(
+            models.Q(inventory__gt=0, inventory__lt=low)
+            | models.Q(id__in=self._pending_products()),
+            available__gt=0, available__lt=low)
+
+    def out_of_stock(self):
+        return self._available().filter(
+            models.Q(inventory__lte=0) | models.Q(id__in=self._pending_products()),
+            available__lte=0)
+
+    def stock_status(self, status, low=None):
+        if status == Product.STOCK_OUT:
+            return self.out_of_stock()
+        if status == Product.STOCK_LOW:
+            return self.low_stock(low)
+        return self._available().filter(available__gte=low or Product.LOW_STOCK)
+
+    def with_stock_status(self, low=None):
+        return self._available().annotate(stock_status=models.Case(
+            models.When(available__lte=0, then=models.Value(Product.STOCK_OUT)),
+            models.When(available__lt=low or Product.LOW_STOCK,
+                        then=models.Value(Product.STOCK_LOW)),
+            default=models.Value(Product.STOCK_IN),
+            output_field=models.CharField(),
+        ))
+
+
 class Product(models.Model):
+    STOCK_IN = 'in'
+    STOCK_LOW = 'low'
+    STOCK_OUT = 'out'
+
+    STOCK_STATUS_CHOICES = [
+        (STOCK_IN, 'In stock'),
+        (STOCK_LOW, 'Low stock'),
+        (STOCK_OUT, 'Out of stock'),
+    ]
+
+    # Largest inventory: `inventory` is a 32-bit integer column on
+    # PostgreSQL and MySQL (store.stock and store.ledger stay below it)
+    MAX_INVENTORY = 2**31 - 1
+
     title = models.CharField(max_length=255)  # varchar(255)
     description = models.TextField()  # text
     price = models.DecimalField(
@@ -44,10 +134,15 @@ class Product(models.Model):
     def __repr__(self) -> str:
         return f"<Product(id={self.pk}, title='{self.title}', price={self.price})>"
 
+    # Below this many units a product counts as low on stock
+    LOW_STOCK = 10
+
+    objects = ProductQuerySet.as_manager()
+
     @property
     # Property that returns True if inventory is less than 10 (access like: product.is_low_stock)
     def is_low_stock(self) -> bool:
-        return self.inventory < 10
+        return self.inventory < self.LOW_STOCK
 
     @property
     # Property that returns True if product has inventory (access like: product.is_in_stock)
@@ -71,8 +166,28 @@ class Product(models.Model):
         ordering = ['title']  # Default sort order: alphabetical by title
         verbose_name = 'Product'  # Singular name in admin
         verbose_name_plural = 'Products'  # Plural name in admin
-        # Database index for faster title searches
-        indexes = [models.Index(fields=['title'])]
+        indexes = [
+            # Database index for faster title searches
+            models.Index(fields=['title']),
+            # ProductFilter: ?collection_id=1&price__gt=10&price__lt=50
+            # (equality column first, then the range column)
+            models.Index(fields=['collection', 'price']),
+            # A collection's products A-Z: /collections/{id}/products/
+            # (keyset pages on title, id break ties)
+            models.Index(fields=['collection', 'title', 'id']),
+            # OrderingFilter: ?ordering=price (and price ranges without a collection)
+            models.Index(fields=['price']),
+            # Admin: stock status filter and sorting by inventory
+            models.Index(fields=['inventory']),
+            # Low / out-of-stock queries (ProductQuerySet): partial indexes
+            # hold only the few matching rows, so they stay tiny and a
+            # report reads nothing else. Conditions must match the
+            # queryset filters for the planner to use them.
+            models.Index(fields=['inventory', 'id'], name='product_low_stock_idx',
+                         condition=models.Q(inventory__gt=0, inventory__lt=10)),  # LOW_STOCK
+            models.Index(fields=['id'], name='product_out_of_stock_idx',
+                         condition=models.Q(inventory__lte=0)),
+        ]
 
 
 class Customer(models.Model):
@@ -114,8 +229,15 @@ class Customer(models.Model):
         ordering = ['last_name', 'first_name']
         verbose_name = 'Customer'  # Singular name in admin
         verbose_name_plural = 'Customers'  # Plural name in admin
-        # Database index for faster email lookups
-        indexes = [models.Index(fields=['email'])]
+        # email needs no extra index: unique=True already creates one.
+        # This one matches Meta.ordering, so listings don't need a sort step
+        indexes = [
+            models.Index(fields=['last_name', 'first_name']),
+            # Case-insensitive email lookups: WHERE LOWER(email) = 'john@x.com'
+            models.Index(Lower('email'), name='store_customer_email_lower_idx'),
+            # Admin membership filter, in phonebook order
+            models.Index(fields=['membership', 'last_name', 'first_name']),
+        ]
 
 
 class Order(models.Model):
@@ -126,6 +248,29 @@ class Order(models.Model):
     customer = models.ForeignKey(
         Customer, on_delete=models.PROTECT, related_name='orders')
 
+    class Meta:
+        indexes = [
+            # A customer's order history, newest first:
+            # WHERE customer_id = 5 ORDER BY placed_at DESC, id DESC
+            # (id breaks ties between orders placed at the same time)
+            models.Index(fields=['customer', '-placed_at', '-id']),
+            # All orders, newest first (admin changelist and its keyset paging)
+            models.Index(fields=['-placed_at', '-id']),
+        ]
+
+
+class OrderItem(models.Model):
+    # ForeignKey - Many OrderItems (line items) belong to ONE Order
+    # related_name='items' allows: order.items.all()
+    order = models.ForeignKey(
+        Order, on_delete=models.PROTECT, related_name='items')
+    # PROTECT: products that were ordered can't be deleted
+    product = models.ForeignKey(
+        Product, on_delete=models.PROTECT, related_name='orderitems')
+    quantity = models.PositiveSmallIntegerField()
+    # Price at the time of the order (product price may change later)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+
 
 class Review(models.Model):
     # ForeignKey - Many Reviews belong to ONE Product
@@ -141,16 +286,258 @@ class Review(models.Model):
 # Cart
 class Cart(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid4)
+    # Null while the cart is anonymous; set at login (store.carts.merge_guest_cart).
+    # No database constraint: carts may be on another shard than customers
+    customer = models.ForeignKey(
+        Customer, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='carts', db_constraint=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
 
 class CartItem(models.Model):
+    # Units of one product per cart line (API input is checked against it)
+    MAX_QUANTITY = 10000
+
     cart = models.ForeignKey(
         Cart, on_delete=models.CASCADE, related_name='items')
-    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    # No database constraint: with sharded carts (store.sharding) the
+    # products are in another database
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, db_constraint=False)
     quantity = models.PositiveIntegerField()
 
     class Meta:
         # Ensures one entry per product in a cart
         unique_together = ('cart', 'product')
+
+
+# ====================================
+# Change feed
+class ChangeLogEntry(models.Model):
+    """
+    Append-only log of catalog changes.
+
+    Every save/delete of a Product, Collection or Review appends one row.
+    `seq` is an auto-increment primary key, so it only ever grows and
+    downstream mirrors can ask "what changed since seq N?".
+
+    That question is only safe if entries become visible in seq order.
+    SQLite has one writer at a time, so a transaction that took seq N has
+    committed before any other can take N + 1. On PostgreSQL or MySQL
+    sequence values are handed out at INSERT time, and a slow transaction
+    can commit seq 41 after a reader has already seen 42 and moved past
+    41 for good. Before running the feed on such a database, hold back
+    entries newer than the oldest open transaction (e.g. record
+    pg_current_xact_id() with each entry and only serve entries below
+    pg_snapshot_xmin(pg_current_snapshot())).
+    """
+    ACTION_UPSERT = 'U'
+    ACTION_DELETE = 'D'
+
+    ACTION_CHOICES = [
+        (ACTION_UPSERT, 'Upsert'),
+        (ACTION_DELETE, 'Delete'),
+    ]
+
+    # BigAutoField on SQLite is created with AUTOINCREMENT, so sequence
+    # numbers are never reused even after old rows are pruned
+    seq = models.BigAutoField(primary_key=True)
+    entity = models.CharField(max_length=50)  # model name, e.g. 'product'
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=1, choices=ACTION_CHOICES)
+    changed_at = models.DateTimeField(auto_now_add=True)
+
+    def __repr__(self) -> str:
+        return f"<ChangeLogEntry(seq={self.seq}, {self.entity}:{self.object_id}, action='{self.action}')>"
+
+    class Meta:
+        ordering = ['seq']
+        # Used by compaction to find newer entries for the same object
+        indexes = [models.Index(fields=['entity', 'object_id', 'seq'])]
+
+
+# ====================================
+# Discounts
+class Discount(models.Model):
+    """
+    A percentage or fixed-amount price reduction for a product, a collection
+    or a ProductFilter result (stored as its query parameters).
+
+    Applying/ending a discount is done by store.discounts with set-based
+    UPDATEs; the previous prices are kept in PriceChange.
+    """
+    KIND_PERCENT = 'P'
+    KIND_FIXED = 'F'
+
+    KIND_CHOICES = [
+        (KIND_PERCENT, 'Percent'),
+        (KIND_FIXED, 'Fixed amount'),
+    ]
+
+    STATUS_SCHEDULED = 'S'
+    STATUS_ACTIVE = 'A'
+    STATUS_ENDED = 'E'
+
+    STATUS_CHOICES = [
+        (STATUS_SCHEDULED, 'Scheduled'),
+        (STATUS_ACTIVE, 'Active'),
+        (STATUS_ENDED, 'Ended'),
+    ]
+
+    kind = models.CharField(max_length=1, choices=KIND_CHOICES, default=KIND_PERCENT)
+    # Percent (12.50 = 12.5% off) or amount off the price
+    value = models.DecimalField(max_digits=10, decimal_places=2)
+    # Target: any combination narrows it down; none of them = whole catalog
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, null=True, blank=True, related_name='discounts')
+    collection = models.ForeignKey(
+        Collection, on_delete=models.CASCADE, null=True, blank=True, related_name='discounts')
+    filters = models.JSONField(default=dict, blank=True)  # ProductFilter params
+    # Optional window: applied by the apply_discounts sweeper
+    starts_at = models.DateTimeField(null=True, blank=True)
+    ends_at = models.DateTimeField(null=True, blank=True)
+    status = models.CharField(max_length=1, choices=STATUS_CHOICES, default=STATUS_SCHEDULED)
+    product_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    applied_at = models.DateTimeField(null=True, blank=True)
+    ended_at = models.DateTimeField(null=True, blank=True)
+
+    def __repr__(self) -> str:
+        return f"<Discount(id={self.pk}, kind='{self.kind}', value={self.value}, status='{self.status}')>"
+
+    class Meta:
+        # The sweeper looks for due discounts by status and time
+        indexes = [
+            models.Index(fields=['status', 'starts_at']),
+            models.Index(fields=['status', 'ends_at']),
+        ]
+
+
+class PriceChange(models.Model):
+    """Audit row: the price of a product before and after a discount."""
+    discount = models.ForeignKey(
+        Discount, on_delete=models.CASCADE, related_name='price_changes')
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='price_changes')
+    old_price = models.DecimalField(max_digits=10, decimal_places=2)
+    new_price = models.DecimalField(max_digits=10, decimal_places=2)
+    changed_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [models.Index(fields=['discount', 'product'])]
+
+
+# ====================================
+# Recommendations ("customers also bought")
+class ProductPair(models.Model):
+    """
+    Sparse co-occurrence counts: how many carts/orders contained both
+    `product` and `other`. Stored in both directions (a, b) and (b, a) so
+    every lookup starts from one product.
+    """
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='+')
+    other = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='+')
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('product', 'other')
+
+
+class BasketProduct(models.Model):
+    """
+    Products already counted in ProductPair for one cart or order. A line
+    removed and added again (or moved by a cart merge) gets a new id, so
+    the line ids alone would count its pairs twice.
+    """
+    source = models.CharField(max_length=20)  # model name: 'cartitem', 'orderitem'
+    basket = models.CharField(max_length=36)  # cart UUID or order id
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        unique_together = ('source', 'basket', 'product')
+
+
+class RelatedProduct(models.Model):
+    """
+    The top-K of ProductPair per product, precomputed so that
+    /products/{id}/related/ is one indexed lookup.
+    """
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='related_products')
+    related = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='+')
+    score = models.PositiveIntegerField()  # co-occurrence count
+    rank = models.PositiveSmallIntegerField()  # 1 = most bought together
+
+    class Meta:
+        # Also the index for "WHERE product_id = ? ORDER BY rank"
+        unique_together = ('product', 'rank')
+
+
+class JobCheckpoint(models.Model):
+    """
+    Where an incremental background job stopped, e.g. the last CartItem id
+    already folded into ProductPair.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    position = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return f"{self.name} @ {self.position}"
+
+
+# Fuzzy search (store.trigrams)
+class ProductTrigram(models.Model):
+    """
+    Inverted index for typo-tolerant search: one row per distinct trigram
+    of a product's title, e.g. 'headphones' -> '  h', ' he', 'hea', ...
+    Candidates for a query are the products sharing the most trigrams.
+    """
+    trigram = models.CharField(max_length=3)
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        # (trigram, product): "WHERE trigram IN (...) GROUP BY product_id"
+        # is answered from this index alone
+        unique_together = ('trigram', 'product')
+
+
+# Inventory ledger (store.ledger)
+class StockEntry(models.Model):
+    """
+    Append-only stock event: +10 received, -1 sold, ... Recording one is a
+    plain INSERT, so concurrent events for the same product don't wait on
+    each other the way UPDATEs of Product.inventory do.
+
+    Product.inventory is the snapshot. Entries not yet folded into it
+    (compacted=False) are pending, and
+        available = inventory + SUM(delta of pending entries)
+    The compaction job adds pending deltas to the snapshot and flags the
+    entries compacted in the same transaction. Entries are kept as the
+    audit trail.
+    """
+    id = models.BigAutoField(primary_key=True)
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='stock_entries')
+    delta = models.IntegerField()
+    reason = models.CharField(max_length=50, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    compacted = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            # A product's history, newest first
+            models.Index(fields=['product', '-id']),
+            # Only pending entries, so it stays small however long the
+            # history gets: per-product pending sums and the compaction scan
+            models.Index(fields=['product', 'id'], condition=models.Q(compacted=False),
+                         name='store_stockentry_pending_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.product_id}: {self.delta:+d} {self.reason}"
@@ -1,6 +1,80 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+
+from store.counting import ApproximateCountPaginator
 
 
 class CustomPagination(PageNumberPagination):
 
     page_size = 3  # Default number of items per page
+    # `count` may come from a cache or the planner instead of COUNT(*)
+    # on every page (see store.counting); the response says when
+    django_paginator_class = ApproximateCountPaginator
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.page.paginator.count,
+            'count_is_approximate': self.page.paginator.count_is_approximate,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['count_is_approximate'] = {'type': 'boolean'}
+        return response_schema
+
+
+class CartPagination(CustomPagination):
+    """Pages of carts; the list may be gathered from several shards
+    (store.sharding.ScatterGather), which the paginator can slice too."""
+    page_size = 50
+
+
+class CustomerCursorPagination(CursorPagination):
+    """
+    Cursor (keyset) pagination for customers.
+
+    Instead of OFFSET (which reads and throws away every skipped row), the
+    cursor remembers the last position and the next page starts with
+    WHERE last_name > ..., so page 10,000 costs the same as page 1.
+    Ordering matches Customer.Meta.ordering and its composite index.
+
+    The cursor position is the first ordering field only: customers who
+    share a last name are paged with an OFFSET within that name, while
+    first_name and id just keep their order stable. A name shared by huge
+    numbers of customers costs more the deeper one pages into it.
+    """
+    page_size = 50
+    ordering = ('last_name', 'first_name', 'id')
+
+
+class OrderCursorPagination(CursorPagination):
+    """
+    Cursor pagination for a customer's order history, newest first.
+
+    Together with the (customer_id, placed_at DESC) index every page is
+    "WHERE customer_id = ? AND placed_at < ? ORDER BY placed_at DESC LIMIT n",
+    so opening page 1 or page 500 of a heavy customer costs the same.
+    Orders placed at the same instant are told apart by an offset, not by
+    id (the cursor keeps the first ordering field only); -id just makes
+    their order stable.
+    """
+    page_size = 20
+    ordering = ('-placed_at', '-id')
+
+
+class CollectionProductCursorPagination(CursorPagination):
+    """
+    Cursor pagination for the products of one collection, A-Z.
+
+    With the (collection_id, title, id) index every page is
+    "WHERE collection_id = ? AND title > ? ORDER BY title, id LIMIT n",
+    read straight from the index whatever the size of the collection.
+    Products with the same title are told apart by an offset, not by id
+    (the cursor keeps the first ordering field only); id just makes their
+    order stable.
+    """
+    page_size = 20
+    ordering = ('title', 'id')
@@ -0,0 +1,161 @@
+"""
+Price rules evaluated over whole columns of prices at once.
+
+All math is done in integer cents. Percentages are basis points
+(12.5% = 1250) and every percentage step rounds half up to the cent:
+
+    cents = (cents * (10000 ± basis_points) + 5000) // 10000
+
+which is exactly what Decimal.quantize(Decimal('0.01'), ROUND_HALF_UP)
+gives for non-negative prices, so results are the same with or without
+NumPy, and the same as the SQL in store.discounts.
+
+NumPy is optional: when it's installed a column is processed with int64
+array operations, otherwise with plain Python ints.
+"""
+from decimal import Decimal
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency
+    np = None
+
+# calculate_tax in serializers used price * 1.2
+TAX_PERCENT = Decimal('20')
+
+# Below this many rows the NumPy conversion costs more than it saves
+NUMPY_MIN_ROWS = 64
+
+
+def to_basis_points(percent) -> int:
+    basis_points = Decimal(percent) * 100
+    if basis_points != basis_points.to_integral_value():
+        raise ValueError(f'{percent}% has more than 2 decimals')
+    return int(basis_points)
+
+
+def to_cents(amount) -> int:
+    cents = Decimal(amount) * 100
+    if cents != cents.to_integral_value():
+        raise ValueError(f'{amount} has more than 2 decimals')
+    return int(cents)
+
+
+class PriceRules:
+    """
+    A rule set, applied in this order to each unit price:
+
+    1. discount_percent  - percent off every price
+    2. amount_off        - fixed amount off (never below 0)
+    3. membership_percent - percent off by Customer.membership, e.g. {'G': 10}
+    4. bundle_breaks     - percent off by quantity, e.g. ((3, 5), (10, 12))
+                           = 5% off from 3 items, 12% off from 10 items
+    5. tax_percent       - added last, on the discounted price
+    """
+
+    def __init__(self, discount_percent=0, amount_off=0, membership_percent=None,
+                 bundle_breaks=(), tax_percent=0):
+        self.discount_bp = to_basis_points(discount_percent)
+        self.amount_off_cents = to_cents(amount_off)
+        self.membership_bp = {
+            membership: to_basis_points(percent)
+            for membership, percent in (membership_percent or {}).items()
+        }
+        # Highest threshold first, so the first match wins
+        self.bundle_breaks = sorted(
+            ((int(quantity), to_basis_points(percent))
+             for quantity, percent in bundle_breaks),
+            reverse=True,
+        )
+        self.tax_bp = to_basis_points(tax_percent)
+
+    def evaluate(self, prices, memberships=None, quantities=None) -> list[Decimal]:
+        """
+        Unit prices after all rules, one Decimal per input price.
+
+        `memberships` and `quantities` are optional columns of the same
+        length (one membership code / quantity per row).
+        """
+        cents = [to_cents(price) for price in prices]
+        if not cents:
+            return []
+        if np is not None and len(cents) >= NUMPY_MIN_ROWS:
+            result = self._evaluate_numpy(cents, memberships, quantities)
+        else:
+            result = self._evaluate_python(cents, memberships, quantities)
+        return [Decimal(value).scaleb(-2) for value in result]
+
+    def line_totals(self, prices, quantities, memberships=None) -> list[Decimal]:
+        """Unit price after rules times quantity, per row."""
+        units = self.evaluate(prices, memberships, quantities)
+        return [unit * quantity for unit, quantity in zip(units, quantities)]
+
+    # ----------------------------------------------------------------
+    # Per-row basis points
+    # ----------------------------------------------------------------
+
+    def _membership_column(self, memberships):
+        if memberships is None or not self.membership_bp:
+            return None
+        return [self.membership_bp.get(membership, 0) for membership in memberships]
+
+    def _bundle_column(self, quantities):
+        if quantities is None or not self.bundle_breaks:
+            return None
+        return [self._bundle_bp(quantity) for quantity in quantities]
+
+    def _bundle_bp(self, quantity) -> int:
+        for threshold, basis_points in self.bundle_breaks:
+            if quantity >= threshold:
+                return basis_points
+        return 0
+
+    # ----------------------------------------------------------------
+    # Backends
+    # ----------------------------------------------------------------
+
+    def _evaluate_python(self, cents, memberships, quantities):
+        def off(values, basis_points):
+            return [(value * (10000 - bp) + 5000) // 10000
+                    for value, bp in zip(values, basis_points)]
+
+        if self.discount_bp:
+            cents = off(cents, [self.discount_bp] * len(cents))
+        if self.amount_off_cents:
+            cents = [max(value - self.amount_off_cents, 0) for value in cents]
+        membership = self._membership_column(memberships)
+        if membership is not None:
+            cents = off(cents, membership)
+        bundle = self._bundle_column(quantities)
+        if bundle is not None:
+            cents = off(cents, bundle)
+        if self.tax_bp:
+            cents = [(value * (10000 + self.tax_bp) + 5000) // 10000
+                     for value in cents]
+        return cents
+
+    def _evaluate_numpy(self, cents, memberships, quantities):
+        # int64 is plenty: the largest price (10 digits) times 20000 is ~2e14
+        values = np.array(cents, dtype=np.int64)
+        if self.discount_bp:
+            values = (values * (10000 - self.discount_bp) + 5000) // 10000
+        if self.amount_off_cents:
+            values = np.maximum(values - self.amount_off_cents, 0)
+        membership = self._membership_column(memberships)
+        if membership is not None:
+            keep = 10000 - np.array(membership, dtype=np.int64)
+            values = (values * keep + 5000) // 10000
+        bundle = self._bundle_column(quantities)
+        if bundle is not None:
+            keep = 10000 - np.array(bundle, dtype=np.int64)
+            values = (values * keep + 5000) // 10000
+        if self.tax_bp:
+            values = (values * (10000 + self.tax_bp) + 5000) // 10000
+        return values.tolist()
+
+
+tax_rules = PriceRules(tax_percent=TAX_PERCENT)
+
+
+def prices_with_tax(prices) -> list[Decimal]:
+    return tax_rules.evaluate(prices)
@@ -0,0 +1,133 @@
+from collections import Counter, defaultdict
+from itertools import combinations
+
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from store.bulk import upsert_add
+from store.models import (BasketProduct, CartItem, JobCheckpoint, OrderItem,
+                          ProductPair, RelatedProduct)
+from store.sharding import cart_shards
+
+TOP_K = 10
+# basket__in chunk size, below SQLite's bound-parameter limit
+CHUNK_SIZE = 500
+
+
+def sources() -> list:
+    """
+    (checkpoint name, line model, field that groups lines into a basket,
+    database) of every source. Cart lines get one source per cart shard
+    (store.sharding): line ids are only ordered within one database.
+    """
+    carts = [
+        ('cooccurrence:cartitem' if alias == 'default' else f'cooccurrence:cartitem:{alias}',
+         CartItem, 'cart_id', alias)
+        for alias in cart_shards()
+    ]
+    return carts + [('cooccurrence:orderitem', OrderItem, 'order_id', 'default')]
+
+
+def update_cooccurrence(batch_size=5000, top_k=TOP_K) -> dict:
+    """
+    Fold cart/order lines added since the last run into ProductPair, then
+    rebuild the top-K RelatedProduct rows of the products that changed.
+
+    Lines are read in id order from a JobCheckpoint, so each run only
+    touches new lines and the baskets they belong to - never the whole
+    items table. Every batch and its checkpoint commit together, so an
+    interrupted run continues where it stopped. A product counts once per
+    basket (BasketProduct), however many lines it had there.
+    """
+    affected = set()
+    lines = 0
+    for name, model, basket_field, alias in sources():
+        while True:
+            with transaction.atomic():
+                checkpoint, _ = JobCheckpoint.objects.select_for_update().get_or_create(name=name)
+                new_lines = list(
+                    model.objects.using(alias).filter(id__gt=checkpoint.position)
+                    .order_by('id')
+                    .values_list('id', basket_field, 'product_id')[:batch_size]
+                )
+                if not new_lines:
+                    break
+                pairs = count_pairs(model._meta.model_name, new_lines)
+                upsert_add(ProductPair, ['product', 'other'], 'count',
+                           [(a, b, count) for (a, b), count in pairs.items()])
+                affected.update(a for a, _ in pairs)
+                checkpoint.position = new_lines[-1][0]
+                checkpoint.save(update_fields=['position', 'updated_at'])
+            lines += len(new_lines)
+
+    rebuild_top_k(affected, top_k=top_k)
+    return {'lines': lines, 'products': len(affected)}
+
+
+def count_pairs(source, new_lines) -> Counter:
+    """
+    Pairs (a, b) created by `new_lines`, in both directions: products new
+    to their basket with each other, and with the products already counted
+    for that basket (BasketProduct). A product already counted for the
+    basket adds nothing, and the new ones are recorded as counted.
+    """
+    line_products = defaultdict(set)
+    for _, basket, product in new_lines:
+        line_products[str(basket)].add(product)
+
+    old_by_basket = defaultdict(set)
+    baskets = sorted(line_products)
+    for start in range(0, len(baskets), CHUNK_SIZE):
+        counted = BasketProduct.objects.filter(
+            source=source, basket__in=baskets[start:start + CHUNK_SIZE],
+        ).values_list('basket', 'product_id')
+        for basket, product in counted:
+            old_by_basket[basket].add(product)
+
+    pairs = Counter()
+    new_rows = []
+    for basket, products in line_products.items():
+        old_products = old_by_basket[basket]
+        new_products = products - old_products
+        new_rows += [BasketProduct(source=source, basket=basket, product_id=product)
+                     for product in new_products]
+        for a, b in combinations(sorted(new_products), 2):
+            pairs[(a, b)] += 1
+            pairs[(b, a)] += 1
+        for a in new_products:
+            for b in old_products:
+                pairs[(a, b)] += 1
+                pairs[(b, a)] += 1
+    BasketProduct.objects.bulk_create(new_rows, batch_size=CHUNK_SIZE)
+    return pairs
+
+
+def rebuild_top_k(product_ids, top_k=TOP_K, chunk_size=500) -> None:
+    """Replace RelatedProduct rows of these products with their current top-K."""
+    product_ids = sorted(product_ids)
+    for start in range(0, len(product_ids), chunk_size):
+        chunk = product_ids[start:start + chunk_size]
+        # ROW_NUMBER() OVER (PARTITION BY product ORDER BY count DESC):
+        # the top-K of every product in the chunk in one query
+        ranked = ProductPair.objects.filter(product_id__in=chunk).annotate(
+            rank=Window(RowNumber(), partition_by=[F('product_id')],
+                        order_by=[F('count').desc(), F('other_id').asc()]),
+        ).filter(rank__lte=top_k).values_list('product_id', 'other_id', 'count', 'rank')
+        rows = [
+            RelatedProduct(product_id=product, related_id=other, score=count, rank=rank)
+            for product, other, count, rank in ranked
+        ]
+        with transaction.atomic():
+            RelatedProduct.objects.filter(product_id__in=chunk).delete()
+            RelatedProduct.objects.bulk_create(rows)
+
+
+def reset() -> None:
+    """Forget everything so the next update_cooccurrence() starts from scratch."""
+    with transaction.atomic():
+        RelatedProduct.objects.all().delete()
+        ProductPair.objects.all().delete()
+        BasketProduct.objects.all().delete()
+        JobCheckpoint.objects.filter(
+            name__in=[name for name, _, _, _ in sources()]).delete()
@@ -1,7 +1,46 @@
 from decimal import Decimal
 from rest_framework import serializers
 
-from store.models import Product, Review, Cart, CartItem
+from store.lookups import collection_lookup, product_lookup
+from store.pricing import prices_with_tax
+from store.models import Collection, Product, Review, Cart, CartItem, Customer, Discount, Order, OrderItem, RelatedProduct, StockEntry
+
+
+class CachedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    PrimaryKeyRelatedField that validates ids through a lookup cache
+    (store.lookups) instead of running queryset.get(pk=...) every time.
+    """
+
+    def __init__(self, lookup, **kwargs):
+        self.lookup = lookup
+        kwargs.setdefault('queryset', lookup.model.objects.all())
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        instance = self.lookup.get(data)
+        if instance is None:
+            self.fail('does_not_exist', pk_value=data)
+        return instance
+
+
+def attach_products(items):
+    """
+    Set item.product for a list of CartItems from product_lookup, using
+    one get_many() (one IN query at most) instead of one query per item.
+    Items whose product is already loaded (select/prefetch_related) are
+    left alone.
+    """
+    pending = [item for item in items
+               if not CartItem.product.is_cached(item)]
+    if pending:
+        products = product_lookup.get_many(item.product_id for item in pending)
+        for item in pending:
+            if item.product_id in products:
+                item.product = products[item.product_id]
+    return items
 
 
 class CollectionSerializer(serializers.Serializer):
@@ -32,16 +71,38 @@ class CollectionSerializer(serializers.Serializer):
 #         return product.price * Decimal("1.2")
 
 
+class ProductListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        # Price with tax for the whole page in one pricing call
+        products = list(data.all() if hasattr(data, 'all') else data)
+        for product, price in zip(products, prices_with_tax(
+                product.price for product in products)):
+            product.price_with_tax = price
+        return super().to_representation(products)
+
+
 # Model serializers automatically generate fields based on model attributes
 class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
-        fields = ['id', 'title', 'unit_price', 'collection', 'inventory']
+        fields = ['id', 'title', 'unit_price', 'price_with_tax', 'collection', 'inventory']
         # fields = '__all__'  # Include all fields from the model
+        list_serializer_class = ProductListSerializer
 
     # Custom field for unit price, mapping to the model's 'price' field
     unit_price = serializers.DecimalField(
         max_digits=10, decimal_places=2, source='price')
+    collection = CachedPrimaryKeyRelatedField(
+        lookup=collection_lookup, allow_null=True)
+    price_with_tax = serializers.SerializerMethodField(
+        method_name='calculate_tax')
+
+    def calculate_tax(self, product: Product) -> Decimal:
+        # Set in bulk by ProductListSerializer; single products compute it here
+        price = getattr(product, 'price_with_tax', None)
+        if price is None:
+            price = prices_with_tax([product.price])[0]
+        return price
 
     # Serializing relationships - primary key
     # collection = CollectionSerializer()
@@ -52,17 +113,36 @@ class ReviewSerializer(serializers.ModelSerializer):
         model = Review
         fields = ['id', 'product', 'name', 'description', 'date', 'product']
 
+    product = CachedPrimaryKeyRelatedField(lookup=product_lookup)
+
+
+class CartItemListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        # Load all products of the list with one lookup before serializing
+        items = attach_products(list(data.all() if hasattr(data, 'all') else data))
+        return super().to_representation(items)
+
 
 class CartItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = CartItem
         fields = ['id', 'product', 'quantity', 'total_price']
+        list_serializer_class = CartItemListSerializer
+        extra_kwargs = {'quantity': {'max_value': CartItem.MAX_QUANTITY}}
 
+    product = CachedPrimaryKeyRelatedField(lookup=product_lookup)
     total_price = serializers.SerializerMethodField()
 
     def get_total_price(self, cart_item: CartItem) -> Decimal:
+        attach_products([cart_item])
         return cart_item.quantity * cart_item.product.price
 
+    def create(self, validated_data):
+        # Saved through the model so the router sees the cart (store.sharding)
+        item = CartItem(**validated_data)
+        item.save()
+        return item
+
 
 class CartSerializer(serializers.ModelSerializer):
     id = serializers.UUIDField(read_only=True)
@@ -71,9 +151,189 @@ class CartSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Cart
-        fields = ['id', 'items', 'total_price', 'created_at',
+        fields = ['id', 'customer', 'items', 'total_price', 'created_at',
                   'updated_at']
-        read_only_fields = ['created_at', 'updated_at']
+        # The customer is set by logging in (POST /carts/{id}/merge/)
+        read_only_fields = ['customer', 'created_at', 'updated_at']
 
     def get_total_price(self, cart):
-        return sum(item.product.price * item.quantity for item in cart.items.all())
+        items = attach_products(list(cart.items.all()))
+        return sum(item.product.price * item.quantity for item in items)
+
+    def create(self, validated_data):
+        # Model.save(), unlike QuerySet.create(), lets the database router
+        # see the new cart's id and pick its shard (store.sharding)
+        cart = Cart(**validated_data)
+        cart.save()
+        return cart
+
+
+class BufferedCartItemSerializer(serializers.Serializer):
+    """A change to one cart line through the cart store (store.cartstore)."""
+    MODES = ['add', 'set']
+
+    product = CachedPrimaryKeyRelatedField(lookup=product_lookup)
+    quantity = serializers.IntegerField(min_value=-CartItem.MAX_QUANTITY,
+                                        max_value=CartItem.MAX_QUANTITY)
+    mode = serializers.ChoiceField(choices=MODES, default='add')
+
+    def validate(self, data):
+        if data['mode'] == 'set' and data['quantity'] < 0:
+            raise serializers.ValidationError({'quantity': 'Must be 0 or more.'})
+        return data
+
+
+class CartOperationSerializer(serializers.Serializer):
+    OPS = ['set', 'increment', 'remove']
+
+    product = serializers.IntegerField()
+    op = serializers.ChoiceField(choices=OPS, default='set')
+    quantity = serializers.IntegerField(required=False, min_value=-CartItem.MAX_QUANTITY,
+                                        max_value=CartItem.MAX_QUANTITY)
+
+    def validate(self, data):
+        quantity = data.get('quantity')
+        if data['op'] == 'set' and (quantity is None or quantity < 0):
+            raise serializers.ValidationError({'quantity': 'Must be 0 or more.'})
+        if data['op'] == 'increment' and not quantity:
+            raise serializers.ValidationError({'quantity': 'Must not be 0.'})
+        return data
+
+
+class CartBatchSerializer(serializers.Serializer):
+    MAX_OPERATIONS = 500
+
+    operations = CartOperationSerializer(many=True, allow_empty=False)
+
+    def validate_operations(self, value):
+        if len(value) > self.MAX_OPERATIONS:
+            raise serializers.ValidationError(f'At most {self.MAX_OPERATIONS} operations per batch.')
+        return value
+
+
+class CartMergeSerializer(serializers.Serializer):
+    customer = serializers.PrimaryKeyRelatedField(queryset=Customer.objects.all())
+
+
+class CustomerSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Customer
+        fields = ['id', 'first_name', 'last_name', 'email', 'phone',
+                  'birth_date', 'membership']
+
+
+class SimpleProductSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Product
+        fields = ['id', 'title', 'price']
+
+
+class CollectionSummarySerializer(serializers.ModelSerializer):
+    """
+    A collection for navigation menus: its featured product embedded and
+    how many products it has. Expects the queryset to select_related
+    'featured_product' and annotate products_count (CollectionViewSet).
+    """
+    featured_product = SimpleProductSerializer(read_only=True)
+    products_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Collection
+        fields = ['id', 'title', 'featured_product', 'products_count']
+
+
+class RelatedProductSerializer(serializers.ModelSerializer):
+    related = SimpleProductSerializer()
+
+    class Meta:
+        model = RelatedProduct
+        fields = ['related', 'score', 'rank']
+
+
+class OrderItemSerializer(serializers.ModelSerializer):
+    product = SimpleProductSerializer()
+
+    class Meta:
+        model = OrderItem
+        fields = ['id', 'product', 'quantity', 'unit_price']
+
+
+class OrderSerializer(serializers.ModelSerializer):
+    items = OrderItemSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Order
+        fields = ['id', 'customer', 'placed_at', 'items']
+
+
+class DiscountSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Discount
+        fields = ['id', 'kind', 'value', 'product', 'collection', 'filters',
+                  'starts_at', 'ends_at', 'status', 'product_count',
+                  'applied_at', 'ended_at']
+        read_only_fields = ['product', 'filters', 'status', 'product_count',
+                            'applied_at', 'ended_at']
+
+    def validate(self, data):
+        value = data['value']
+        if value <= 0 or (data.get('kind') == Discount.KIND_PERCENT and value > 100):
+            raise serializers.ValidationError(
+                {'value': 'Must be above 0 (and at most 100 for a percent).'})
+        starts_at, ends_at = data.get('starts_at'), data.get('ends_at')
+        if starts_at and ends_at and ends_at <= starts_at:
+            raise serializers.ValidationError(
+                {'ends_at': 'Must be after starts_at.'})
+        return data
+
+
+# Stock movements (store.stock): plain serializers, not tied to a model
+class StockAdjustmentSerializer(serializers.Serializer):
+    # Units one line may add or remove
+    MAX_DELTA = 1_000_000
+
+    product = serializers.IntegerField()
+    delta = serializers.IntegerField(min_value=-MAX_DELTA, max_value=MAX_DELTA)
+
+    def validate_delta(self, value):
+        if value == 0:
+            raise serializers.ValidationError('Must not be 0.')
+        return value
+
+
+class StockEventSerializer(StockAdjustmentSerializer):
+    """One ledger entry (store.ledger): product, delta and an optional reason."""
+    reason = serializers.CharField(max_length=50, required=False, allow_blank=True)
+
+
+class StockTransferSerializer(serializers.Serializer):
+    from_product = serializers.IntegerField()
+    to_product = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1,
+                                        max_value=StockAdjustmentSerializer.MAX_DELTA)
+
+    def validate(self, data):
+        if data['from_product'] == data['to_product']:
+            raise serializers.ValidationError('from_product and to_product must differ.')
+        return data
+
+
+class StockMovementSerializer(serializers.Serializer):
+    MAX_LINES = 1000
+
+    adjustments = StockAdjustmentSerializer(many=True, required=False, default=list)
+    transfers = StockTransferSerializer(many=True, required=False, default=list)
+
+    def validate(self, data):
+        lines = len(data['adjustments']) + len(data['transfers'])
+        if not lines:
+            raise serializers.ValidationError('Send at least one adjustment or transfer.')
+        if lines > self.MAX_LINES:
+            raise serializers.ValidationError(f'At most {self.MAX_LINES} lines per batch.')
+        return data
+
+
+class StockEntrySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = StockEntry
+        fields = ['id', 'delta', 'reason', 'created_at', 'compacted']
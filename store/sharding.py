@@ -0,0 +1,174 @@
+import heapq
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+
+# Settings (optional):
+# STORE_CART_SHARDS = ['carts_0', 'carts_1', ...]   # database aliases
+# DATABASE_ROUTERS = ['store.sharding.CartShardRouter']
+#
+# Without them every cart lives in 'default', as before. storefront.settings
+# sets both up with N local SQLite files when STORE_CART_SHARDS=N is in the
+# environment.
+
+# Models stored on the cart shards; everything else stays in 'default'
+SHARDED_MODELS = {'cart', 'cartitem'}
+
+
+def cart_shards() -> list[str]:
+    return getattr(settings, 'STORE_CART_SHARDS', None) or ['default']
+
+
+def is_sharded(model) -> bool:
+    return model._meta.app_label == 'store' and model._meta.model_name in SHARDED_MODELS
+
+
+def shard_for(cart_id) -> str:
+    """
+    Database alias of a cart: its UUID (random, uuid4) as an integer,
+    modulo the number of shards. Changing the number of shards moves
+    most carts, so it needs a copy of the cart tables, like any modulo
+    scheme. An invalid id maps to the first shard (and won't be found).
+    """
+    shards = cart_shards()
+    try:
+        return shards[uuid.UUID(str(cart_id)).int % len(shards)]
+    except ValueError:
+        return shards[0]
+
+
+def group_by_shard(cart_ids) -> dict:
+    """{alias: [cart_id, ...]} for running one query per shard."""
+    groups = defaultdict(list)
+    for cart_id in cart_ids:
+        groups[shard_for(cart_id)].append(cart_id)
+    return groups
+
+
+def cart_id_of(instance):
+    if instance._meta.model_name == 'cart':
+        return instance.pk
+    # Not instance.cart_id: if deferred, reading it would query (and route) again
+    return instance.__dict__.get('cart_id')
+
+
+class CartShardRouter:
+    """
+    Puts each Cart and its CartItems on the shard of the cart's id.
+
+    Django only passes a hint with the instance (Model.save(), delete,
+    related managers like cart.items), so these are routed automatically:
+
+        cart = Cart()
+        cart.save()                           # -> shard_for(cart.id)
+        cart.items.create(product=p, ...)     # -> same shard
+        cart.items.all()                      # -> same shard
+
+    A plain query has no instance to look at - that includes
+    Cart.objects.create() and bulk_create() - so those say where to go:
+
+        Cart.objects.using(shard_for(cart_id)).get(pk=cart_id)
+
+    and listings over all carts ask every shard (ScatterGather).
+
+    Products, customers and everything else stay in 'default'. CartItem
+    references Product without a database constraint (products aren't on
+    the shards), and deleting a product removes its cart lines on the
+    other shards (store.signals).
+    """
+
+    def db_for_read(self, model, **hints):
+        return self._db(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._db(model, hints)
+
+    def _db(self, model, hints):
+        if not is_sharded(model):
+            # Explicit: otherwise item.product would be read from the
+            # item's shard (Django's fallback is the hint's database)
+            return 'default'
+        instance = hints.get('instance')
+        if instance is not None and is_sharded(type(instance)):
+            cart_id = cart_id_of(instance)
+            if cart_id is not None:
+                return shard_for(cart_id)
+            return instance._state.db
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if is_sharded(type(obj1)) and is_sharded(type(obj2)):
+            cart_ids = [cart_id_of(obj1), cart_id_of(obj2)]
+            if None in cart_ids:
+                return True  # a new item being attached to its cart
+            return shard_for(cart_ids[0]) == shard_for(cart_ids[1])
+        if is_sharded(type(obj1)) or is_sharded(type(obj2)):
+            return True  # cart line -> product in 'default'
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == 'default' or db not in cart_shards():
+            return None
+        return app_label == 'store' and model_name in SHARDED_MODELS
+
+
+class ScatterGather:
+    """
+    A queryset run on every shard, merged into one ordered list.
+
+    Supports what paginators and serializers need: len() (sum of the
+    shards' COUNT(*)), slicing and iteration. A slice [start:stop] reads
+    the first `stop` rows of every shard and merges them, so - like
+    OFFSET - deep pages cost more; the first pages are cheap.
+
+    `ordering` must end in a unique field and go in one direction, e.g.
+    ['-updated_at', '-id'].
+    """
+
+    def __init__(self, queryset, ordering):
+        directions = {name.startswith('-') for name in ordering}
+        if len(directions) != 1:
+            raise ValueError('ScatterGather ordering must go in one direction.')
+        self.queryset = queryset
+        self.ordering = ordering
+        self.reverse = directions.pop()
+        self.fields = [name.lstrip('-') for name in ordering]
+        self._count = None
+
+    def shard_querysets(self):
+        return [self.queryset.using(alias).order_by(*self.ordering)
+                for alias in cart_shards()]
+
+    def count(self) -> int:
+        if self._count is None:
+            self._count = sum(queryset.count() for queryset in self.shard_querysets())
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            if index.step is not None or (index.start or 0) < 0 or (
+                    index.stop is not None and index.stop < 0):
+                raise ValueError('ScatterGather supports only plain slices.')
+            start, stop = index.start or 0, index.stop
+            parts = [queryset if stop is None else queryset[:stop]
+                     for queryset in self.shard_querysets()]
+            merged = heapq.merge(*parts, key=self._key, reverse=self.reverse)
+            return list(merged)[start:stop]
+        return self[index:index + 1][0]
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def _key(self, obj):
+        return tuple(getattr(obj, field) for field in self.fields)
+
+
+def scatter_gather(queryset, ordering):
+    """ScatterGather when carts are sharded, else the ordered queryset."""
+    if len(cart_shards()) == 1:
+        return queryset.using(cart_shards()[0]).order_by(*ordering)
+    return ScatterGather(queryset, ordering)
@@ -0,0 +1,128 @@
+import copy
+
+from django.core.signals import request_started
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from store.autocomplete import title_index
+from store.caching import bump_catalog_version
+from store.changes import TRACKED_MODELS, record_change
+from store.lookups import collection_lookup, product_lookup
+from store.models import Cart, CartItem, ChangeLogEntry, Collection, Customer, Product
+from store.sharding import cart_shards
+from store.trigrams import index_product
+from store.warmer import schedule_warm, warmer_setting
+
+
+def log_save(sender, instance, **kwargs):
+    record_change(instance, ChangeLogEntry.ACTION_UPSERT)
+
+
+def log_delete(sender, instance, **kwargs):
+    record_change(instance, ChangeLogEntry.ACTION_DELETE)
+
+
+def invalidate_catalog(sender, instance, **kwargs):
+    bump_catalog_version()
+    if warmer_setting('AFTER_INVALIDATION'):
+        transaction.on_commit(schedule_warm)
+
+
+# Connected for each tracked model instead of with @receiver so the list
+# of models lives in one place (store.changes.TRACKED_MODELS)
+for model in TRACKED_MODELS:
+    post_save.connect(log_save, sender=model,
+                      dispatch_uid=f'changelog_save_{model._meta.model_name}')
+    post_delete.connect(log_delete, sender=model,
+                        dispatch_uid=f'changelog_delete_{model._meta.model_name}')
+
+# Cached catalog data (facets, list pages) depends on products and collections
+for model in [Product, Collection]:
+    post_save.connect(invalidate_catalog, sender=model,
+                      dispatch_uid=f'catalog_save_{model._meta.model_name}')
+    post_delete.connect(invalidate_catalog, sender=model,
+                        dispatch_uid=f'catalog_delete_{model._meta.model_name}')
+
+
+# Two-tier lookup caches (store.lookups): write-through on save, drop on
+# delete. Only once the transaction commits: a save that is rolled back
+# must not leave its values in the caches
+def refresh_lookup(lookup):
+    def handler(sender, instance, using, **kwargs):
+        saved = copy.copy(instance)  # as saved, whatever happens to it later
+        transaction.on_commit(lambda: lookup.refresh(saved), using=using)
+    return handler
+
+
+def invalidate_lookup(lookup):
+    def handler(sender, instance, using, **kwargs):
+        pk = instance.pk
+        # Now, so requests stop using it, and again after the commit, in
+        # case one of them read the row back before it was gone
+        lookup.invalidate(pk)
+        transaction.on_commit(lambda: lookup.invalidate(pk), using=using)
+    return handler
+
+
+for model, lookup in [(Product, product_lookup), (Collection, collection_lookup)]:
+    post_save.connect(refresh_lookup(lookup), sender=model, weak=False,
+                      dispatch_uid=f'lookup_save_{model._meta.model_name}')
+    post_delete.connect(invalidate_lookup(lookup), sender=model, weak=False,
+                        dispatch_uid=f'lookup_delete_{model._meta.model_name}')
+
+
+# Optional: warm the catalog cache in the background when the first request
+# comes in (STORE_CACHE_WARMER = {'ON_STARTUP': True})
+def warm_on_first_request(sender, **kwargs):
+    request_started.disconnect(dispatch_uid='catalog_warm_on_startup')
+    schedule_warm(delay=0)
+
+
+if warmer_setting('ON_STARTUP'):
+    request_started.connect(warm_on_first_request,
+                            dispatch_uid='catalog_warm_on_startup')
+
+
+# Autocomplete prefix index (store.autocomplete): updated in place once
+# the transaction commits, like the lookup caches above
+def index_title(sender, instance, using, **kwargs):
+    product_id, title = instance.pk, instance.title
+    transaction.on_commit(lambda: title_index.add_product(product_id, title), using=using)
+
+
+def unindex_title(sender, instance, using, **kwargs):
+    product_id = instance.pk
+    transaction.on_commit(lambda: title_index.remove_product(product_id), using=using)
+
+
+post_save.connect(index_title, sender=Product, dispatch_uid='autocomplete_save')
+post_delete.connect(unindex_title, sender=Product, dispatch_uid='autocomplete_delete')
+
+
+# Trigram index for fuzzy search (store.trigrams); rows of deleted
+# products go with them (on_delete=CASCADE)
+def index_trigrams(sender, instance, **kwargs):
+    index_product(instance)
+
+
+post_save.connect(index_trigrams, sender=Product, dispatch_uid='trigram_save')
+
+
+# Carts on other databases (store.sharding) aren't reached by the CASCADE /
+# SET_NULL of a product or customer deleted in 'default'
+def delete_sharded_cart_items(sender, instance, **kwargs):
+    for alias in cart_shards():
+        if alias != 'default':
+            CartItem.objects.using(alias).filter(product_id=instance.pk).delete()
+
+
+def detach_sharded_carts(sender, instance, **kwargs):
+    for alias in cart_shards():
+        if alias != 'default':
+            Cart.objects.using(alias).filter(customer_id=instance.pk).update(customer=None)
+
+
+post_delete.connect(delete_sharded_cart_items, sender=Product,
+                    dispatch_uid='sharded_cart_items_delete')
+post_delete.connect(detach_sharded_carts, sender=Customer,
+                    dispatch_uid='sharded_carts_detach')
@@ -0,0 +1,149 @@
+from decimal import Decimal
+
+from django.db.models import Avg, Count, F, Max, Min, Q, Sum
+from django.utils import timezone
+
+from store.caching import catalog_cache, catalog_version
+from store.facets import PRICE_BANDS, price_band_q
+from store.models import Customer, Order, OrderItem, Product
+
+STATS_CACHE_KEY = 'store:stats'
+
+# The numbers the playground demo pages compute with one .count() each
+PRODUCT_SEGMENTS = {
+    'expensive': Q(price__gt=100),
+    'cheap': Q(price__lte=50),
+    'cheap_or_expensive': Q(price__lte=50) | Q(price__gt=100),
+    'mid_range': Q(price__range=(50, 100)),
+    'expensive_and_low_stock': Q(price__gt=100, inventory__lt=20),
+    'need_restock': Q(inventory__lt=10, price__gt=50),
+    'undervalued': Q(price__lt=F('inventory') / 2),
+    'overpriced': Q(price__gt=F('inventory') * 20),
+}
+
+STOCK_BUCKETS = {
+    'out': Q(inventory__lte=0),
+    'low': Q(inventory__gt=0, inventory__lt=10),
+    'medium': Q(inventory__gte=10, inventory__lte=50),
+    'high': Q(inventory__gt=50),
+}
+
+CUSTOMER_SEGMENTS = {
+    'gmail': Q(email__icontains='gmail'),
+    'first_name_j': Q(first_name__startswith='J'),
+}
+
+
+def money(value):
+    # SQLite sums decimals as floats: 9989494.90999998 -> 9989494.91
+    if value is None:
+        return None
+    return Decimal(value).quantize(Decimal('0.01'))
+
+
+def counts(prefix: str, conditions: dict) -> dict:
+    """{'<prefix><name>': COUNT(*) FILTER (WHERE <condition>)} for aggregate()"""
+    return {f'{prefix}{name}': Count('pk', filter=q) for name, q in conditions.items()}
+
+
+def unprefix(row: dict, prefix: str) -> dict:
+    return {key[len(prefix):]: value for key, value in row.items() if key.startswith(prefix)}
+
+
+# ================================================================================
+# One conditional-aggregation query per table
+# ================================================================================
+#
+# Every number of a table comes out of ONE scan:
+#
+#   SELECT COUNT(*),
+#          COUNT(*) FILTER (WHERE price > 100),
+#          COUNT(*) FILTER (WHERE inventory < 10 AND price > 50),
+#          SUM(price), AVG(price), MIN(price), MAX(price), ...
+#   FROM store_product
+#
+# instead of one query (and one scan) per number.
+
+def product_stats() -> dict:
+    bands = {name: price_band_q(low, high) for name, low, high in PRICE_BANDS}
+    row = Product.objects.aggregate(
+        count=Count('pk'),
+        price_min=Min('price'),
+        price_max=Max('price'),
+        price_avg=Avg('price'),
+        price_sum=Sum('price'),
+        total_inventory=Sum('inventory'),
+        inventory_value=Sum(F('price') * F('inventory')),
+        **counts('band_', bands),
+        **counts('stock_', STOCK_BUCKETS),
+        **counts('segment_', PRODUCT_SEGMENTS),
+    )
+    return {
+        'count': row['count'],
+        'total_inventory': row['total_inventory'] or 0,
+        'inventory_value': money(row['inventory_value'] or 0),
+        'price': {
+            'min': money(row['price_min']),
+            'max': money(row['price_max']),
+            'avg': money(row['price_avg']),
+            'sum': money(row['price_sum'] or 0),
+        },
+        'price_bands': unprefix(row, 'band_'),
+        'stock': unprefix(row, 'stock_'),
+        'segments': unprefix(row, 'segment_'),
+    }
+
+
+def customer_stats() -> dict:
+    memberships = {
+        label.lower(): Q(membership=code) for code, label in Customer.MEMBERSHIP_CHOICES
+    }
+    row = Customer.objects.aggregate(
+        count=Count('pk'),
+        **counts('membership_', memberships),
+        **counts('segment_', CUSTOMER_SEGMENTS),
+    )
+    return {
+        'count': row['count'],
+        'membership': unprefix(row, 'membership_'),
+        'segments': unprefix(row, 'segment_'),
+    }
+
+
+def order_stats() -> dict:
+    orders = Order.objects.aggregate(
+        count=Count('pk'),
+        first_placed_at=Min('placed_at'),
+        last_placed_at=Max('placed_at'),
+    )
+    items = OrderItem.objects.aggregate(
+        lines=Count('pk'),
+        units=Sum('quantity'),
+        revenue=Sum(F('quantity') * F('unit_price')),
+    )
+    return {
+        **orders,
+        'lines': items['lines'],
+        'units': items['units'] or 0,
+        'revenue': money(items['revenue'] or 0),
+    }
+
+
+def catalog_stats() -> dict:
+    """All dashboard numbers: 4 queries (one per table), however many numbers."""
+    return {
+        'products': product_stats(),
+        'customers': customer_stats(),
+        'orders': order_stats(),
+        'generated_at': timezone.now(),
+    }
+
+
+def cached_catalog_stats() -> dict:
+    """
+    catalog_stats() through catalog_cache: recomputed at most once per TTL
+    by one thread, and right away (served stale meanwhile) after a product
+    or collection edit. Customer and order numbers may lag by the TTL.
+    """
+    return catalog_cache.get_or_compute(
+        STATS_CACHE_KEY, catalog_stats, version=catalog_version())
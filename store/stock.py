@@ -0,0 +1,99 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import F
+
+from store.changes import record_bulk_product_changes
+from store.models import Product, pending_stock
+
+
+class StockError(Exception):
+    """
+    The batch can't be applied; nothing was written. `shortages` lists
+    [{'product': id, 'requested': units to remove, 'available': units}, ...]
+    """
+
+    def __init__(self, message, shortages=()):
+        super().__init__(message)
+        self.shortages = list(shortages)
+
+
+def net_deltas(adjustments=(), transfers=()) -> Counter:
+    """
+    One inventory change per product for the whole batch:
+
+        adjustments [{'product': 1, 'delta': -3}, {'product': 1, 'delta': 5}]
+        transfers   [{'from_product': 1, 'to_product': 2, 'quantity': 4}]
+        -> {1: -2, 2: +4}
+
+    A product moved in and out in the same batch needs stock for the net
+    amount only, and gets one UPDATE instead of one per line.
+    """
+    deltas = Counter()
+    for adjustment in adjustments:
+        deltas[adjustment['product']] += adjustment['delta']
+    for transfer in transfers:
+        deltas[transfer['from_product']] -= transfer['quantity']
+        deltas[transfer['to_product']] += transfer['quantity']
+    return deltas
+
+
+def apply_stock_movements(adjustments=(), transfers=()) -> dict:
+    """
+    Apply a batch of stock adjustments and transfers in ONE transaction,
+    all or nothing. Returns {product id: new inventory}.
+
+    No row is read and then written back (read-modify-write). Each product
+    gets a single conditional UPDATE on its available stock, inventory
+    plus pending ledger entries (store.ledger):
+
+        UPDATE store_product SET inventory = inventory - 3
+        WHERE id = 7 AND inventory + (SELECT SUM(delta) ... pending) >= 3
+
+    The database checks and changes the stock in one step under the row
+    lock, so concurrent batches can't oversell and don't have to
+    SELECT ... FOR UPDATE first. 0 rows updated means not enough stock:
+    the transaction is rolled back and StockError reports every shortage.
+    Additions are checked the same way against Product.MAX_INVENTORY.
+
+    Products are updated in id order. Two batches touching the same
+    products lock them in the same order, so they wait for each other
+    instead of deadlocking.
+    """
+    deltas = net_deltas(adjustments, transfers)
+    product_ids = sorted(product_id for product_id, delta in deltas.items() if delta)
+    if not product_ids:
+        return {}
+    found = set(Product.objects.filter(id__in=product_ids).values_list('id', flat=True))
+    missing = [product_id for product_id in product_ids if product_id not in found]
+    if missing:
+        raise StockError(f'Unknown products: {missing}')
+
+    try:
+        with transaction.atomic():
+            for product_id in product_ids:
+                delta = deltas[product_id]
+                rows = Product.objects.filter(id=product_id)
+                if delta < 0:
+                    rows = rows.alias(available=F('inventory') + pending_stock()) \
+                        .filter(available__gte=-delta)
+                    if not rows.update(inventory=F('inventory') + delta):
+                        raise StockError('Insufficient stock.')
+                elif not rows.filter(inventory__lte=Product.MAX_INVENTORY - delta) \
+                        .update(inventory=F('inventory') + delta):
+                    raise StockError(f'Inventory of product {product_id} would exceed '
+                                     f'{Product.MAX_INVENTORY}.')
+            changed = Product.objects.filter(id__in=product_ids)
+            record_bulk_product_changes(changed)
+            return dict(changed.values_list('id', 'inventory'))
+    except StockError as error:
+        # Rolled back; report every product that is short, not just the first
+        removals = {product_id: -delta for product_id, delta in deltas.items() if delta < 0}
+        available = Product.objects.filter(id__in=list(removals)) \
+            .with_available().values_list('id', 'available')
+        error.shortages = [
+            {'product': product_id, 'requested': removals[product_id], 'available': inventory}
+            for product_id, inventory in sorted(available)
+            if inventory < removals[product_id]
+        ]
+        raise
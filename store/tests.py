@@ -1,3 +1,938 @@
-from django.test import TestCase
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from decimal import ROUND_HALF_UP, Decimal
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.cache import cache
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from store import pricing, trigrams
+from store.admin import ProductAdmin
+from store.autocomplete import PrefixIndex, title_index
+from store.caching import CoalescingCache, bump_catalog_version
+from store.carts import CartError, apply_cart_operations, fold_operations, merge_carts
+from store.cartstore import cart_store
+from store.discounts import apply_discount, end_discount
+from store.facets import product_facets
+from store.filters import prefix_range
+from store.ledger import compact_ledger, record_stock_events
+from store.lookups import product_lookup
+from store.models import (Cart, CartItem, Collection, Customer, Discount, Product, ProductPair,
+                          StockEntry)
+from store.pricing import PriceRules
+from store.recommendations import update_cooccurrence
+from store.serializers import CartBatchSerializer
+from store.sharding import cart_shards
+from store.stats import catalog_stats
+from store.warmer import cache_is_shared
+
+
+def make_product(title='Product', price='10.00', inventory=100):
+    return Product.objects.create(title=title, price=Decimal(price), inventory=inventory)
+
+
+def make_cart(**kwargs):
+    # Model.save(): routed to the cart's shard (store.sharding)
+    cart = Cart(**kwargs)
+    cart.save()
+    return cart
+
+
+def cart_contents(cart):
+    return dict(CartItem.objects.using(cart._state.db).filter(cart_id=cart.pk)
+                .values_list('product_id', 'quantity'))
+
+
+# ================================================================================
+# Discounts (store.discounts)
+# ================================================================================
+
+class DiscountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def apply(self, **fields):
+        discount = Discount.objects.create(**fields)
+        apply_discount(discount)
+        return discount
+
+    def test_percent_rounds_half_up_to_the_cent(self):
+        # 9.99 * 0.85 = 8.4915 -> 8.49; 0.05 * 0.9 = 0.045 -> 0.05
+        a = make_product(price='9.99')
+        b = make_product(price='0.05')
+        self.apply(kind=Discount.KIND_PERCENT, value=Decimal('15'), product=a)
+        self.apply(kind=Discount.KIND_PERCENT, value=Decimal('10'), product=b)
+        a.refresh_from_db()
+        b.refresh_from_db()
+        self.assertEqual(a.price, Decimal('8.49'))
+        self.assertEqual(b.price, Decimal('0.05'))
+
+    def test_fixed_amount_does_not_go_below_zero(self):
+        product = make_product(price='3.00')
+        self.apply(kind=Discount.KIND_FIXED, value=Decimal('5'), product=product)
+        product.refresh_from_db()
+        self.assertEqual(product.price, Decimal('0.00'))
+
+    def test_ending_restores_prices_not_changed_since(self):
+        kept = make_product(price='19.99')
+        edited = make_product(price='19.99')
+        discount = self.apply(kind=Discount.KIND_PERCENT, value=Decimal('10'))
+        Product.objects.filter(pk=edited.pk).update(price=Decimal('15.00'))
+
+        self.assertEqual(end_discount(discount), 1)
+        kept.refresh_from_db()
+        edited.refresh_from_db()
+        self.assertEqual(kept.price, Decimal('19.99'))
+        self.assertEqual(edited.price, Decimal('15.00'))
+
+
+# ================================================================================
+# Pricing (store.pricing)
+# ================================================================================
+
+def quantized_off(price, percent):
+    """price minus percent%, rounded half up to the cent (the Decimal reference)."""
+    return (price * (100 - percent) / 100).quantize(Decimal('0.01'), ROUND_HALF_UP)
+
+
+class PriceRulesTests(TestCase):
+    def test_sql_and_python_rounding_agree(self):
+        prices = ['0.01', '0.05', '1.15', '9.99', '19.95', '123.45']
+        products = [make_product(price=price) for price in prices]
+        apply_discount(Discount.objects.create(kind=Discount.KIND_PERCENT, value=Decimal('12.5')))
+        expected = PriceRules(discount_percent=Decimal('12.5')).evaluate(
+            Decimal(price) for price in prices)
+        actual = [Product.objects.get(pk=product.pk).price for product in products]
+        self.assertEqual(actual, list(expected))
+
+    @skipUnless(pricing.np is not None, 'NumPy is not installed')
+    def test_numpy_matches_decimal(self):
+        rows = 3 * pricing.NUMPY_MIN_ROWS  # evaluated with NumPy
+        prices = [Decimal(cents).scaleb(-2) for cents in range(1, 100000, 100000 // rows)][:rows]
+        memberships = ['BSG'[index % 3] for index in range(rows)]
+        quantities = [index % 12 + 1 for index in range(rows)]
+        rules = PriceRules(discount_percent='12.5', amount_off='0.30',
+                           membership_percent={'S': 5, 'G': '7.5'},
+                           bundle_breaks=((3, 5), (10, 12)), tax_percent=20)
+
+        expected = []
+        for price, membership, quantity in zip(prices, memberships, quantities):
+            price = max(quantized_off(price, Decimal('12.5')) - Decimal('0.30'), Decimal('0.00'))
+            price = quantized_off(price, {'S': Decimal(5), 'G': Decimal('7.5')}.get(membership, 0))
+            price = quantized_off(price, 12 if quantity >= 10 else 5 if quantity >= 3 else 0)
+            expected.append(quantized_off(price, -20))
+        self.assertEqual(len(prices), rows)
+        self.assertEqual(rules.evaluate(prices, memberships, quantities), expected)
+
+
+# ================================================================================
+# Nested routes
+# ================================================================================
+
+class NestedRouteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_orders_of_unknown_or_malformed_customer_are_404(self):
+        self.assertEqual(self.client.get('/store/customers/abc/orders/').status_code, 404)
+        self.assertEqual(self.client.get('/store/customers/999999/orders/').status_code, 404)
+        customer = Customer.objects.create(first_name='Ann', last_name='Lee',
+                                           email='ann@example.com', phone='1')
+        response = self.client.get(f'/store/customers/{customer.pk}/orders/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [])
+
+
+    def test_products_of_unknown_or_malformed_collection_are_404(self):
+        collection = Collection.objects.create(title='Toys')
+        Product.objects.create(title='Ball', price=Decimal('5.00'), inventory=1,
+                               collection=collection)
+        self.assertEqual(self.client.get('/store/collections/abc/products/').status_code, 404)
+        self.assertEqual(self.client.get('/store/collections/999999/products/').status_code, 404)
+        response = self.client.get(f'/store/collections/{collection.pk}/products/')
+        self.assertEqual([product['title'] for product in response.json()['results']], ['Ball'])
+
+
+# ================================================================================
+# Autocomplete (store.autocomplete)
+# ================================================================================
+
+class PrefixIndexTests(TestCase):
+    databases = '__all__'  # popularity is read from every cart shard
+
+    def test_short_prefix_list_is_refilled_after_a_removal(self):
+        products = [make_product(title) for title in ['Hat', 'Helmet', 'Hood', 'Sock']]
+        index = PrefixIndex(short_top=2)
+        index.build()
+        self.assertEqual(len(index.search('h', limit=10)), 2)
+
+        index.remove_product(products[0].pk)
+        self.assertEqual([result['title'] for result in index.search('h', limit=10)],
+                         ['Helmet', 'Hood'])
+        # Renamed away from the prefix: same as a removal for 'h'
+        index.add_product(products[1].pk, 'Sweater')
+        self.assertEqual([result['title'] for result in index.search('h', limit=10)],
+                         ['Hood'])
+
+    def test_rolled_back_save_is_not_indexed(self):
+        title_index.build()
+        self.addCleanup(setattr, title_index, '_built', False)  # built from test data
+        with transaction.atomic():
+            make_product('Zither')
+            transaction.set_rollback(True)
+        self.assertEqual(title_index.search('zither'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            product = make_product('Zither')
+        self.assertEqual(title_index.search('zither'), [{'id': product.pk, 'title': 'Zither'}])
+
+    def test_changes_from_other_processes_are_picked_up(self):
+        product = make_product('Hat')
+        index = PrefixIndex()
+        index.build()
+        # As another process would: the row changes and so does the version
+        Product.objects.filter(pk=product.pk).update(title='Xylophone')
+        bump_catalog_version()
+        self.assertEqual(index.search('xylo'), [])  # checked every REFRESH_SECONDS
+        index._refresh_at = 0
+        self.assertEqual(index.search('xylo'), [{'id': product.pk, 'title': 'Xylophone'}])
+
+
+# ================================================================================
+# Lookup caches (store.lookups)
+# ================================================================================
+
+class ProductLookupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        product_lookup.invalidate_all()  # the per-process tier too
+
+    def test_rolled_back_save_is_not_cached(self):
+        product = make_product('Before')
+        self.assertEqual(product_lookup.get(product.pk).title, 'Before')
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    product.title = 'Rolled back'
+                    product.save()
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(product_lookup.get(product.pk).title, 'Before')
+
+    def test_committed_save_is_cached(self):
+        product = make_product('Before')
+        product_lookup.get(product.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            product.title = 'After'
+            product.save()
+        self.assertEqual(product_lookup.get(product.pk).title, 'After')
+
+
+# ================================================================================
+# Write-behind cart store (store.cartstore)
+# ================================================================================
+
+class CartStoreTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.a = make_product('A')
+        self.b = make_product('B')
+        self.cart = make_cart()
+
+    def test_flush_writes_cached_lines(self):
+        cart_store.add(self.cart.pk, self.a.pk, 2)
+        self.assertEqual(cart_contents(self.cart), {})
+        self.assertEqual(cart_store.flush(), {'carts': 1, 'busy': 0})
+        self.assertEqual(cart_contents(self.cart), {self.a.pk: 2})
+
+    def test_direct_write_survives_a_later_flush(self):
+        cart_store.add(self.cart.pk, self.a.pk, 2)
+        with cart_store.write_through(self.cart.pk):
+            # Pending changes are written before the direct write...
+            self.assertEqual(cart_contents(self.cart), {self.a.pk: 2})
+            self.cart.items.create(product=self.b, quantity=1)
+        # ...and the cached copy is dropped, so a flush can't undo it
+        cart_store.flush()
+        self.assertEqual(cart_contents(self.cart), {self.a.pk: 2, self.b.pk: 1})
+        self.assertEqual(cart_store.get(self.cart.pk)['items'],
+                         {self.a.pk: 2, self.b.pk: 1})
+
+    def test_flush_drops_lines_of_deleted_products(self):
+        cart_store.add(self.cart.pk, self.a.pk, 2)
+        cart_store.add(self.cart.pk, self.b.pk, 1)
+        self.b.delete()
+        self.assertEqual(cart_store.flush(), {'carts': 1, 'busy': 0})
+        self.assertEqual(cart_contents(self.cart), {self.a.pk: 2})
+        self.assertEqual(cart_store.dirty_cart_ids(), set())
+
+    @override_settings(STORE_CART_STORE={'ENABLED': True})
+    def test_reading_a_cart_skips_and_prunes_deleted_products(self):
+        cart_store.add(self.cart.pk, self.a.pk, 2)
+        cart_store.add(self.cart.pk, self.b.pk, 1)
+        self.b.delete()
+        response = APIClient().get(f'/store/carts/{self.cart.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['product'] for item in response.json()['items']],
+                         [self.a.pk])
+        self.assertEqual(cart_store.get(self.cart.pk)['items'], {self.a.pk: 2})
+
+
+# ================================================================================
+# Batch cart operations and merging (store.carts)
+# ================================================================================
+
+class CartOperationTests(TestCase):
+    databases = '__all__'
+
+    def test_fold_keeps_one_change_per_product(self):
+        changes = fold_operations([
+            {'product': 1, 'op': 'increment', 'quantity': 2},
+            {'product': 1, 'op': 'increment', 'quantity': 3},
+            {'product': 2, 'op': 'set', 'quantity': 2},
+            {'product': 2, 'op': 'increment', 'quantity': 3},
+            {'product': 3, 'op': 'increment', 'quantity': 4},
+            {'product': 3, 'op': 'set', 'quantity': 1},
+            {'product': 4, 'op': 'set', 'quantity': 5},
+            {'product': 4, 'op': 'remove'},
+        ])
+        self.assertEqual(changes, {
+            1: ('increment', 5),
+            2: ('set', 5),
+            3: ('set', 1),
+            4: ('set', 0),
+        })
+
+    def test_batch_applies_relative_and_absolute_changes(self):
+        a, b, c = make_product('A'), make_product('B'), make_product('C')
+        cart = make_cart()
+        cart.items.create(product=a, quantity=2)
+        cart.items.create(product=b, quantity=7)
+        result = apply_cart_operations(cart, [
+            {'product': a.pk, 'op': 'increment', 'quantity': 3},
+            {'product': b.pk, 'op': 'remove'},
+            {'product': c.pk, 'op': 'set', 'quantity': 4},
+        ])
+        self.assertEqual(result, {'updated': 2, 'removed': 1})
+        self.assertEqual(cart_contents(cart), {a.pk: 5, c.pk: 4})
+
+    def test_quantities_are_bounded(self):
+        product = make_product()
+        cart = make_cart()
+        serializer = CartBatchSerializer(data={'operations': [
+            {'product': product.pk, 'op': 'set', 'quantity': 2 ** 31}]})
+        self.assertFalse(serializer.is_valid())
+
+        # Each increment is valid, their sum isn't: nothing is written
+        limit = CartItem.MAX_QUANTITY
+        with self.assertRaises(CartError):
+            apply_cart_operations(cart, [
+                {'product': product.pk, 'op': 'increment', 'quantity': limit},
+                {'product': product.pk, 'op': 'increment', 'quantity': 1},
+            ])
+        self.assertEqual(cart_contents(cart), {})
+
+    def test_merge_adds_up_quantities_and_deletes_the_source(self):
+        a, b = make_product('A'), make_product('B')
+        source, target = make_cart(), make_cart()
+        source.items.create(product=a, quantity=2)
+        source.items.create(product=b, quantity=1)
+        target.items.create(product=a, quantity=3)
+
+        self.assertEqual(merge_carts(source, target), 2)
+        self.assertEqual(cart_contents(target), {a.pk: 5, b.pk: 1})
+        self.assertFalse(Cart.objects.using(source._state.db).filter(pk=source.pk).exists())
+        self.assertFalse(CartItem.objects.using(source._state.db)
+                         .filter(cart_id=source.pk).exists())
+
+    def test_merged_quantities_are_capped(self):
+        product = make_product()
+        source = make_cart()
+        target = make_cart()
+        while target._state.db != source._state.db:  # the single-database path
+            target = make_cart()
+        source.items.create(product=product, quantity=9000)
+        target.items.create(product=product, quantity=9000)
+
+        merge_carts(source, target)
+        self.assertEqual(cart_contents(target), {product.pk: CartItem.MAX_QUANTITY})
+
+
+class CartEndpointTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.product = make_product()
+        self.cart = make_cart()
+
+    def test_cart_list_is_paginated_only_when_sharded(self):
+        response = self.client.get('/store/carts/')
+        self.assertEqual(response.status_code, 200)
+        if len(cart_shards()) == 1:
+            self.assertEqual([cart['id'] for cart in response.json()], [str(self.cart.pk)])
+        else:
+            self.assertEqual(response.json()['count'], 1)
+
+    def test_merge_is_staff_only(self):
+        customer = Customer.objects.create(first_name='Ann', last_name='Lee',
+                                           email='ann@example.com', phone='1')
+        url = f'/store/carts/{self.cart.pk}/merge/'
+        response = self.client.post(url, {'customer': customer.pk}, format='json')
+        self.assertIn(response.status_code, (401, 403))
+        self.assertIsNone(Cart.objects.using(self.cart._state.db).get(pk=self.cart.pk).customer_id)
+
+        staff = get_user_model().objects.create_user('staff', password='x', is_staff=True)
+        self.client.force_authenticate(staff)
+        response = self.client.post(url, {'customer': customer.pk}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['customer'], customer.pk)
+
+    @override_settings(STORE_CART_STORE={'ENABLED': True})
+    def test_busy_cart_is_a_conflict(self):
+        # Another request holds the cart's lock for longer than we wait
+        with mock.patch.object(cart_store, '_acquire', return_value=None):
+            response = self.client.post(
+                f'/store/carts/{self.cart.pk}/items/batch/',
+                {'operations': [{'product': self.product.pk, 'op': 'set', 'quantity': 1}]},
+                format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(cart_contents(self.cart), {})
+
+
+@skipUnless(len(cart_shards()) > 1, 'needs cart shards: STORE_CART_SHARDS=2')
+class CrossShardMergeTests(TestCase):
+    databases = '__all__'
+
+    def carts_on_two_shards(self):
+        first = make_cart()
+        while True:
+            second = make_cart()
+            if second._state.db != first._state.db:
+                return first, second
+
+    def test_merge_across_shards(self):
+        a, b = make_product('A'), make_product('B')
+        source, target = self.carts_on_two_shards()
+        source.items.create(product=a, quantity=2)
+        source.items.create(product=b, quantity=1)
+        target.items.create(product=a, quantity=3)
+
+        self.assertEqual(merge_carts(source, target), 2)
+        self.assertEqual(cart_contents(target), {a.pk: 5, b.pk: 1})
+        self.assertFalse(Cart.objects.using(source._state.db).filter(pk=source.pk).exists())
+        self.assertFalse(CartItem.objects.using(source._state.db)
+                         .filter(cart_id=source.pk).exists())
+
+    def test_merged_quantities_are_capped(self):
+        product = make_product()
+        source, target = self.carts_on_two_shards()
+        source.items.create(product=product, quantity=9000)
+        target.items.create(product=product, quantity=9000)
+
+        merge_carts(source, target)
+        self.assertEqual(cart_contents(target), {product.pk: CartItem.MAX_QUANTITY})
+
+
+# ================================================================================
+# Bulk availability (store.availability)
+# ================================================================================
+
+class AvailabilityTests(TestCase):
+    url = '/store/products/availability/'
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.in_stock = make_product('In', inventory=50)
+        self.low = make_product('Low', inventory=3)
+
+    def get(self, **headers):
+        return self.client.get(self.url, {'ids': f'{self.in_stock.pk},{self.low.pk},999999'},
+                               headers=headers)
+
+    def test_statuses_and_unknown_ids(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            'products': {str(self.in_stock.pk): 'in', str(self.low.pk): 'low'},
+            'unknown': [999999],
+        })
+
+    def test_unchanged_etag_gets_304(self):
+        etag = self.get()['ETag']
+        response = self.get(if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_stock_change_gives_a_new_etag(self):
+        etag = self.get()['ETag']
+        self.low.inventory = 0
+        self.low.save()  # bumps the catalog version (store.signals)
+        response = self.get(if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['products'][str(self.low.pk)], 'out')
+
+
+# ================================================================================
+# Product list counts (store.counting)
+# ================================================================================
+
+class ProductCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        make_product('Headphones')
+
+    def test_fuzzy_search_without_a_match_counts_zero(self):
+        response = APIClient().get('/store/products/', {'fuzzy': 'zzzzqqq'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 0)
+        self.assertEqual(response.json()['results'], [])
+
+
+# ================================================================================
+# Stock movements (store.stock)
+# ================================================================================
+
+class StockMovementTests(TestCase):
+    url = '/store/stock/movements/'
+
+    def setUp(self):
+        self.product = make_product(inventory=5)
+        self.client = APIClient()
+        self.client.force_authenticate(
+            get_user_model().objects.create_user('staff', password='x', is_staff=True))
+
+    def post(self, **movements):
+        return self.client.post(self.url, movements, format='json')
+
+    def test_transfer_and_adjustments_apply_together(self):
+        other = make_product(inventory=0)
+        response = self.post(
+            adjustments=[{'product': self.product.pk, 'delta': -2}],
+            transfers=[{'from_product': self.product.pk, 'to_product': other.pk, 'quantity': 3}])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['products'], [
+            {'id': self.product.pk, 'inventory': 0}, {'id': other.pk, 'inventory': 3}])
+
+    def test_shortage_is_a_conflict_and_applies_nothing(self):
+        response = self.post(adjustments=[{'product': self.product.pk, 'delta': -6}])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['shortages'],
+                         [{'product': self.product.pk, 'requested': 6, 'available': 5}])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.inventory, 5)
+
+    def test_oversized_deltas_are_rejected(self):
+        response = self.post(adjustments=[{'product': self.product.pk, 'delta': 10**30}])
+        self.assertEqual(response.status_code, 400)
+        Product.objects.filter(pk=self.product.pk).update(inventory=Product.MAX_INVENTORY)
+        response = self.post(adjustments=[{'product': self.product.pk, 'delta': 1}])
+        self.assertEqual(response.status_code, 400)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.inventory, Product.MAX_INVENTORY)
+
+
+# ================================================================================
+# Stock ledger (store.ledger)
+# ================================================================================
+
+class StockLedgerTests(TestCase):
+    url = '/store/stock/entries/'
+
+    def setUp(self):
+        self.product = make_product(inventory=5)
+        self.client = APIClient()
+        self.client.force_authenticate(
+            get_user_model().objects.create_user('staff', password='x', is_staff=True))
+
+    def test_entries_count_as_available_until_compacted(self):
+        response = self.client.post(self.url, [
+            {'product': self.product.pk, 'delta': -2, 'reason': 'sale'},
+            {'product': self.product.pk, 'delta': 10},
+        ], format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Product.objects.with_available().get(pk=self.product.pk).available, 13)
+        self.assertEqual(compact_ledger(),
+                         {'entries': 2, 'products': 1, 'overflow': []})
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.inventory, 13)
+
+    def test_oversized_delta_is_rejected(self):
+        response = self.client.post(self.url, [{'product': self.product.pk, 'delta': 10**30}],
+                                    format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(StockEntry.objects.exists())
+
+    def test_compaction_leaves_an_overflowing_product_pending(self):
+        Product.objects.filter(pk=self.product.pk).update(inventory=Product.MAX_INVENTORY - 1)
+        record_stock_events([{'product': self.product.pk, 'delta': 2}])
+        self.assertEqual(compact_ledger(),
+                         {'entries': 0, 'products': 0, 'overflow': [self.product.pk]})
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.inventory, Product.MAX_INVENTORY - 1)
+        self.assertTrue(StockEntry.objects.filter(compacted=False).exists())
+
+
+# ================================================================================
+# Cache warming (store.warmer)
+# ================================================================================
+
+class WarmCacheCommandTests(TestCase):
+    def test_refuses_to_warm_a_process_local_cache(self):
+        with self.assertRaisesMessage(CommandError, 'local to this process'):
+            call_command('warm_cache')
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': tempfile.gettempdir(),
+    }})
+    def test_cache_shared_between_processes_is_accepted(self):
+        self.assertTrue(cache_is_shared())
+
+
+# ================================================================================
+# Recommendations (store.recommendations)
+# ================================================================================
+
+class CooccurrenceTests(TestCase):
+    databases = '__all__'  # cart lines may be on any shard
+
+    def pair_count(self, a, b):
+        return ProductPair.objects.filter(product=a, other=b).values_list('count', flat=True).first()
+
+    def test_pairs_count_once_per_basket(self):
+        a, b, c = make_product('A'), make_product('B'), make_product('C')
+        cart = make_cart()
+        cart.items.create(product=a, quantity=1)
+        cart.items.create(product=b, quantity=1)
+        update_cooccurrence()
+        self.assertEqual(self.pair_count(a, b), 1)
+
+        # b removed and added again: a new line id, but not a new pair
+        cart.items.filter(product=b).delete()
+        cart.items.create(product=b, quantity=2)
+        cart.items.create(product=c, quantity=1)
+        update_cooccurrence()
+        self.assertEqual(self.pair_count(a, b), 1)
+        self.assertEqual(self.pair_count(b, a), 1)
+        self.assertEqual(self.pair_count(a, c), 1)
+        self.assertEqual(self.pair_count(b, c), 1)
+
+
+# ================================================================================
+# Change feed (store.changes)
+# ================================================================================
+
+class ChangeFeedTests(TestCase):
+    databases = '__all__'  # deleting a product clears its lines on every cart shard
+    url = '/store/changes/'
+
+    def test_entries_of_one_object_are_compacted_to_the_latest(self):
+        kept = make_product('Kept')
+        kept.title = 'Renamed'
+        kept.save()
+        gone = make_product('Gone')
+        gone_id = gone.pk
+        gone.delete()
+
+        response = APIClient().get(self.url, {'since': 0})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertFalse(body['has_more'])
+        self.assertEqual([(change['entity'], change['id'], change['action'])
+                          for change in body['results']],
+                         [('product', kept.pk, 'upsert'), ('product', gone_id, 'delete')])
+        self.assertEqual(body['results'][0]['data']['title'], 'Renamed')
+
+        # Nothing new since: an empty batch that keeps the position
+        again = APIClient().get(self.url, {'since': body['next_since']}).json()
+        self.assertEqual((again['results'], again['next_since']), ([], body['next_since']))
+
+    def test_batches_are_limited_and_chained(self):
+        products = [make_product(f'P{index}') for index in range(3)]
+        first = APIClient().get(self.url, {'since': 0, 'limit': 2}).json()
+        self.assertTrue(first['has_more'])
+        second = APIClient().get(self.url, {'since': first['next_since'], 'limit': 2}).json()
+        self.assertFalse(second['has_more'])
+        self.assertEqual([change['id'] for change in first['results'] + second['results']],
+                         [product.pk for product in products])
+
+
+# ================================================================================
+# Facets (store.facets)
+# ================================================================================
+
+class FacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.audio = Collection.objects.create(title='Audio')
+        self.video = Collection.objects.create(title='Video')
+        for price, collection in [('10.00', self.audio), ('30.00', self.audio),
+                                  ('150.00', self.video), ('60.00', None)]:
+            Product.objects.create(title='P', price=Decimal(price), inventory=1,
+                                   collection=collection)
+
+    def test_counts_by_collection_and_price_band_in_one_query(self):
+        with self.assertNumQueries(1):
+            facets = product_facets(Product.objects.all())
+        self.assertEqual(facets['collection_id'][0], {'value': self.audio.pk, 'count': 2})
+        self.assertCountEqual(facets['collection_id'][1:], [
+            {'value': self.video.pk, 'count': 1}, {'value': None, 'count': 1}])
+        self.assertEqual([band['count'] for band in facets['price']], [1, 1, 1, 1])
+
+    def test_facets_follow_the_list_filters(self):
+        response = APIClient().get('/store/products/',
+                                   {'facets': 'true', 'collection_id': self.audio.pk})
+        self.assertEqual(response.status_code, 200)
+        facets = response.json()['facets']
+        self.assertEqual(facets['collection_id'], [{'value': self.audio.pk, 'count': 2}])
+        self.assertEqual([band['count'] for band in facets['price']], [1, 1, 0, 0])
+
+
+# ================================================================================
+# Customer filters (store.filters)
+# ================================================================================
+
+class CustomerFilterTests(TestCase):
+    url = '/store/customers/'
+
+    def setUp(self):
+        for first_name, last_name, email, membership in [
+            ('John', 'Smith', 'john@example.com', 'G'),
+            ('Jane', 'Smith', 'jane@example.com', 'S'),
+            ('Anna', 'Smithers', 'anna@example.org', 'B'),
+            ('Bob', 'Jones', 'Bob.Jones@example.com', 'G'),
+        ]:
+            Customer.objects.create(first_name=first_name, last_name=last_name, email=email,
+                                    phone='1', membership=membership)
+
+    def names(self, **params):
+        response = APIClient().get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return [f"{customer['first_name']} {customer['last_name']}"
+                for customer in response.json()['results']]
+
+    def test_name_prefix(self):
+        self.assertEqual(self.names(name='Smi'), ['Jane Smith', 'John Smith', 'Anna Smithers'])
+        self.assertEqual(self.names(name='Smith, Jo'), ['John Smith'])
+
+    def test_email_prefix_and_exact_match_ignore_case(self):
+        self.assertEqual(self.names(email='BOB.'), ['Bob Jones'])
+        self.assertEqual(self.names(email='bob.jones@example.com'), ['Bob Jones'])
+
+    def test_membership_is_multiple_choice(self):
+        self.assertEqual(self.names(membership=['G', 'S']),
+                         ['Bob Jones', 'Jane Smith', 'John Smith'])
+
+    def test_prefix_ending_in_the_last_code_point(self):
+        last = chr(sys.maxunicode)
+        self.assertEqual(prefix_range('ab' + last), ('ab' + last, 'ac'))
+        self.assertEqual(prefix_range(last), (last, None))
+        self.assertEqual(prefix_range('\ud7ff'), ('\ud7ff', '\ue000'))  # skips surrogates
+        self.assertEqual(self.names(name=last), [])
+
+
+# ================================================================================
+# Stampede protection (store.caching)
+# ================================================================================
+
+class CoalescingCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.coalescing = CoalescingCache()
+
+    def test_concurrent_misses_compute_once(self):
+        computing, release = threading.Event(), threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            computing.set()
+            release.wait(5)
+            return 'page'
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            leader = pool.submit(self.coalescing.get_or_compute, 'key', compute)
+            computing.wait(5)
+            waiters = [pool.submit(self.coalescing.get_or_compute, 'key', compute)
+                       for _ in range(3)]
+            release.set()
+            results = [leader.result()] + [waiter.result() for waiter in waiters]
+
+        self.assertEqual(results, ['page'] * 4)
+        self.assertEqual(len(calls), 1)
+        # Each waiter either waited for the leader or found its result
+        counters = self.coalescing.metrics()['key']
+        self.assertEqual(counters.get('coalesced_waits', 0) + counters.get('hits', 0), 3)
+
+    def test_stale_value_is_served_while_another_thread_recomputes(self):
+        self.coalescing.get_or_compute('key', lambda: 'old', version=1)
+        self.coalescing._join('key')  # a refresh is in progress elsewhere
+        self.assertEqual(self.coalescing.get_or_compute('key', lambda: 'new', version=2), 'old')
+        self.assertEqual(self.coalescing.metrics()['key']['stale_served'], 1)
+
+
+# ================================================================================
+# Fuzzy search (store.trigrams)
+# ================================================================================
+
+class FuzzySearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        # Indexed by the post_save signal
+        self.headphones = make_product('Wireless Headphones')
+        self.phone = make_product('Phone Case')
+        make_product('Garden Hose')
+
+    def test_typos_still_match_best_first(self):
+        ranked = trigrams.search('hedphones')
+        self.assertEqual(ranked[0][0], self.headphones.pk)
+        self.assertTrue(all(score >= trigrams.MIN_SCORE for _, score in ranked))
+
+    def test_list_is_ordered_by_match(self):
+        response = APIClient().get('/store/products/', {'fuzzy': 'wireles hedphones'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([product['id'] for product in response.json()['results']],
+                         [self.headphones.pk])
+
+    def test_renamed_product_is_reindexed(self):
+        self.phone.title = 'Laptop Sleeve'
+        self.phone.save()
+        self.assertEqual([product_id for product_id, _ in trigrams.search('laptop sleve')],
+                         [self.phone.pk])
+        self.assertEqual(trigrams.search('phone case'), [])
+
+
+# ================================================================================
+# Admin changelists (store.admin, store.changelist)
+# ================================================================================
+
+@mock.patch.object(ProductAdmin, 'list_per_page', 2)
+class ProductChangelistTests(TestCase):
+    url = '/admin/store/product/'
+
+    def setUp(self):
+        cache.clear()
+        self.products = [make_product(f'P{index}', inventory=index) for index in range(5)]
+        self.client.force_login(get_user_model().objects.create_superuser('admin', password='x'))
+
+    def titles(self, response):
+        return [product.title for product in response.context['cl'].result_list]
+
+    def test_next_pages_by_keyset(self):
+        pages = []
+        query = ''
+        while query is not None:
+            response = self.client.get(self.url + query)
+            self.assertEqual(response.status_code, 200)
+            pages.append((self.titles(response), response.context['cl'].keyset))
+            query = response.context['cl'].next_page_url  # '?after=...'
+        self.assertEqual(pages, [(['P0', 'P1'], False), (['P2', 'P3'], True), (['P4'], True)])
+
+    def test_stock_status_filter(self):
+        response = self.client.get(self.url, {'stock': 'out'})
+        self.assertEqual(self.titles(response), ['P0'])
+
+
+# ================================================================================
+# Catalog statistics (store.stats)
+# ================================================================================
+
+class StatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        make_product(price='10.00', inventory=0)
+        make_product(price='60.00', inventory=5)
+        make_product(price='150.00', inventory=100)
+
+    def test_one_query_per_table(self):
+        with self.assertNumQueries(4):
+            stats = catalog_stats()
+        products = stats['products']
+        self.assertEqual(products['count'], 3)
+        self.assertEqual(products['total_inventory'], 105)
+        self.assertEqual(products['price'], {'min': Decimal('10.00'), 'max': Decimal('150.00'),
+                                             'avg': Decimal('73.33'), 'sum': Decimal('220.00')})
+        self.assertEqual(products['stock'], {'out': 1, 'low': 1, 'medium': 0, 'high': 1})
+        self.assertEqual(products['price_bands'],
+                         {'under_25': 1, '25_to_50': 0, '50_to_100': 1, '100_and_up': 1})
+        self.assertEqual(stats['orders']['revenue'], Decimal('0.00'))
+
+    def test_endpoint_is_staff_only(self):
+        client = APIClient()
+        self.assertEqual(client.get('/store/stats/').status_code, 403)
+        client.force_authenticate(
+            get_user_model().objects.create_user('staff', password='x', is_staff=True))
+        response = client.get('/store/stats/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['products']['count'], 3)
+
+
+# ================================================================================
+# Stock status in SQL (ProductQuerySet)
+# ================================================================================
+
+class StockStatusTests(TestCase):
+    def setUp(self):
+        self.out = make_product('Out', inventory=0)
+        self.low = make_product('Low', inventory=Product.LOW_STOCK - 1)
+        self.plenty = make_product('Plenty', inventory=Product.LOW_STOCK)
+        # Pending ledger entries count: 'Pending' is really out of stock
+        self.pending = make_product('Pending', inventory=50)
+        record_stock_events([{'product': self.pending.pk, 'delta': -50}])
+
+    def ids(self, queryset):
+        return set(queryset.values_list('id', flat=True))
+
+    def test_filters_use_available_stock(self):
+        self.assertEqual(self.ids(Product.objects.out_of_stock()), {self.out.pk, self.pending.pk})
+        self.assertEqual(self.ids(Product.objects.low_stock()), {self.low.pk})
+        self.assertEqual(self.ids(Product.objects.in_stock()), {self.low.pk, self.plenty.pk})
+        self.assertEqual(self.ids(Product.objects.stock_status(Product.STOCK_IN)),
+                         {self.plenty.pk})
+
+    def test_annotation_agrees_with_the_filters(self):
+        statuses = dict(Product.objects.with_stock_status().values_list('id', 'stock_status'))
+        self.assertEqual(statuses, {
+            self.out.pk: Product.STOCK_OUT, self.low.pk: Product.STOCK_LOW,
+            self.plenty.pk: Product.STOCK_IN, self.pending.pk: Product.STOCK_OUT,
+        })
+
+    def test_low_stock_csv_is_staff_only(self):
+        client = APIClient()
+        self.assertEqual(client.get('/store/products/low-stock/').status_code, 403)
+        client.force_authenticate(
+            get_user_model().objects.create_user('staff', password='x', is_staff=True))
+        response = client.get('/store/products/low-stock/', {'status': 'out'})
+        self.assertEqual(response.status_code, 200)
+        rows = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(rows), 3)  # header + 2 products
+
+
+# ================================================================================
+# Index advisor (management command)
+# ================================================================================
+
+class IndexAdvisorTests(TestCase):
+    databases = '__all__'  # the carts routes are replayed on every shard
+    def test_choice_filters_are_replayed_with_a_valid_choice(self):
+        make_product()
+        out = StringIO()
+        call_command('index_advisor', stdout=out)
+        output = out.getvalue()
+        self.assertIn(f'products/?stock_status={Product.STOCK_IN}', output)
+        self.assertIn('customers/?membership=B', output)
+        self.assertNotIn('invalid sample parameters', output)
+        self.assertIn('Only list routes were replayed', output)
@@ -0,0 +1,139 @@
+import math
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+
+from store.autocomplete import normalize
+from store.models import Product, ProductTrigram
+
+# Fields indexed for fuzzy search; add 'description' to match on it too
+# (STORE_FUZZY_SEARCH_FIELDS = ['title', 'description'])
+DEFAULT_FIELDS = ['title']
+
+# Share of the query's trigrams a product must have (pg_trgm uses 0.3 for
+# its similarity threshold; ours is measured against the query only, see
+# search() below, so it can be stricter)
+MIN_SCORE = 0.5
+# Products ranked in Python after the SQL candidate query
+MAX_CANDIDATES = 200
+MAX_QUERY_LENGTH = 100
+
+
+def indexed_fields() -> list[str]:
+    return getattr(settings, 'STORE_FUZZY_SEARCH_FIELDS', DEFAULT_FIELDS)
+
+
+def trigrams(text: str) -> set[str]:
+    """
+    Trigrams of every word, padded like PostgreSQL's pg_trgm does:
+    'hedphones' -> {'  h', ' he', 'hed', 'edp', ..., 'nes', 'es '}
+
+    The padding makes the start of a word count twice, so a typo in the
+    middle of a word costs less than one at the beginning.
+    """
+    grams = set()
+    for word in normalize(text):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def product_trigrams(product) -> set[str]:
+    grams = set()
+    for field in indexed_fields():
+        grams |= trigrams(getattr(product, field) or '')
+    return grams
+
+
+# ================================================================================
+# Maintaining the index
+# ================================================================================
+
+def index_product(product) -> None:
+    """Replace the trigram rows of one product (called on post_save)."""
+    with transaction.atomic():
+        ProductTrigram.objects.filter(product_id=product.pk).delete()
+        ProductTrigram.objects.bulk_create([
+            ProductTrigram(trigram=gram, product_id=product.pk)
+            for gram in product_trigrams(product)
+        ])
+
+
+def rebuild(batch_size=1000, missing_only=False) -> int:
+    """
+    (Re)index products in batches - for data loaded with bulk_create or
+    raw SQL, which send no post_save. Returns the number of products.
+    """
+    products = Product.objects.order_by('id').only('id', *indexed_fields())
+    if missing_only:
+        products = products.exclude(
+            id__in=ProductTrigram.objects.values('product_id'))
+    else:
+        ProductTrigram.objects.all().delete()
+
+    count = 0
+    last_id = 0
+    while True:
+        batch = list(products.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            return count
+        with transaction.atomic():
+            ProductTrigram.objects.bulk_create([
+                ProductTrigram(trigram=gram, product_id=product.pk)
+                for product in batch
+                for gram in product_trigrams(product)
+            ], batch_size=500)
+        count += len(batch)
+        last_id = batch[-1].pk
+
+
+# ================================================================================
+# Searching
+# ================================================================================
+
+def search(query: str, min_score=MIN_SCORE, limit=MAX_CANDIDATES) -> list[tuple[int, float]]:
+    """
+    [(product_id, score), ...] best first, for a query with typos:
+    'hedphones' finds 'Wireless Headphones'.
+
+    1. SQL, on the (trigram, product) index only:
+           SELECT product_id, COUNT(*) AS shared FROM store_producttrigram
+           WHERE trigram IN (<trigrams of the query>)
+           GROUP BY product_id HAVING shared >= ? ORDER BY shared DESC LIMIT 200
+    2. SQL: total number of trigrams of those candidates.
+    3. Python: score = shared / query trigrams (how much of the query is
+       found - a title is allowed to have other words), ties broken by
+       Jaccard similarity shared / (query + product - shared) so the
+       closest, shortest titles come first.
+
+    No row of store_product is read, and no edit distance is computed.
+    """
+    grams = trigrams(query[:MAX_QUERY_LENGTH])
+    if not grams:
+        return []
+    min_shared = max(1, math.ceil(len(grams) * min_score))
+    candidates = dict(
+        ProductTrigram.objects.filter(trigram__in=grams)
+        .values('product_id')
+        .annotate(shared=Count('*'))
+        .filter(shared__gte=min_shared)
+        .order_by('-shared', 'product_id')
+        .values_list('product_id', 'shared')[:limit]
+    )
+    if not candidates:
+        return []
+    totals = dict(
+        ProductTrigram.objects.filter(product_id__in=list(candidates))
+        .values('product_id')
+        .annotate(total=Count('*'))
+        .order_by()
+        .values_list('product_id', 'total')
+    )
+
+    ranked = []
+    for product_id, shared in candidates.items():
+        jaccard = shared / (len(grams) + totals.get(product_id, shared) - shared)
+        ranked.append((shared / len(grams), jaccard, product_id))
+    ranked.sort(key=lambda row: (-row[0], -row[1], row[2]))
+    return [(product_id, round(score, 3)) for score, _, product_id in ranked]
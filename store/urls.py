@@ -53,6 +53,8 @@ from . import views
 router = DefaultRouter()
 router.register('products', views.ProductViewSet, basename='product')
 router.register('carts', views.CartViewSet, basename='cart')
+router.register('customers', views.CustomerViewSet, basename='customer')
+router.register('collections', views.CollectionViewSet, basename='collection')
 
 
 product_router = routers.NestedDefaultRouter(
@@ -62,9 +64,30 @@ product_router.register('reviews', views.ReviewViewSet,
 # Create nested router for cart items (similar to product reviews)
 cart_router = routers.NestedDefaultRouter(router, 'carts', lookup='cart')
 cart_router.register('items', views.CartItemViewSet, basename='cart-items')
+# Customer order history: /customers/{customer_pk}/orders/
+customer_router = routers.NestedDefaultRouter(
+    router, 'customers', lookup='customer')
+customer_router.register('orders', views.CustomerOrderViewSet,
+                         basename='customer-orders')
+# A collection's products: /collections/{collection_pk}/products/
+collection_router = routers.NestedDefaultRouter(
+    router, 'collections', lookup='collection')
+collection_router.register('products', views.CollectionProductViewSet,
+                           basename='collection-products')
 
 # The router.urls contains all auto-generated URL patterns
-urlpatterns = router.urls + product_router.urls + cart_router.urls
+urlpatterns = router.urls + product_router.urls + cart_router.urls + customer_router.urls + collection_router.urls + [
+    # Delta sync for downstream catalog mirrors
+    path('changes/', views.ChangeFeedView.as_view(), name='changes'),
+    # Catalog cache counters (staff only)
+    path('cache-metrics/', views.CacheMetricsView.as_view(), name='cache-metrics'),
+    # Ops dashboard numbers (staff only)
+    path('stats/', views.StatsView.as_view(), name='stats'),
+    # Batched stock adjustments and transfers (staff only)
+    path('stock/movements/', views.StockMovementView.as_view(), name='stock-movements'),
+    # Append-only stock ledger (staff only)
+    path('stock/entries/', views.StockEntryView.as_view(), name='stock-entries'),
+]
 
 # Alternative: If you want to mix manual URLs with router URLs:
 # urlpatterns = [
@@ -1,13 +1,24 @@
-from django.http import HttpResponse
+import csv
+import hashlib
+import json
+from contextlib import ExitStack
 
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+
+from django.db import transaction
+from django.db.models import Count, F
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.http import parse_etags
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
 from rest_framework.pagination import PageNumberPagination
-from rest_framework import status
+from rest_framework import generics, status
 from rest_framework.decorators import api_view, action
+from rest_framework.exceptions import APIException, ValidationError
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework.permissions import IsAdminUser
 from rest_framework.generics import GenericAPIView
 from rest_framework.mixins import (
     ListModelMixin,
@@ -16,13 +27,26 @@ from rest_framework.mixins import (
     UpdateModelMixin,
     DestroyModelMixin
 )
-from rest_framework.viewsets import ModelViewSet
-
-
-from store.filters import ProductFilter
-from store.pagination import CustomPagination
-from .serializers import CartItemSerializer, CartSerializer, ProductSerializer, ReviewSerializer
-from .models import Cart, CartItem, Product, Review
+from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
+
+
+from store.autocomplete import MAX_LIMIT, title_index
+from store.availability import availability_setting, inventories, stock_status
+from store.carts import CartError, apply_cart_operations, cart_lines, customer_cart, merge_guest_cart
+from store.cartstore import CartBusy, cart_key, cart_store, cart_store_setting
+from store.caching import catalog_cache, catalog_version, request_cache_key
+from store.discounts import DiscountError, apply_discount, preview_discount
+from store.facets import cached_product_facets
+from store.filters import CustomerFilter, FuzzySearchFilter, ProductFilter
+from store.lookups import collection_lookup, product_lookup
+from store.warmer import query_stats
+from store.pagination import CartPagination, CollectionProductCursorPagination, CustomPagination, CustomerCursorPagination, OrderCursorPagination
+from store.sharding import cart_shards, scatter_gather, shard_for
+from store.stats import cached_catalog_stats
+from store.ledger import record_stock_events, with_available
+from store.stock import StockError, apply_stock_movements
+from .serializers import BufferedCartItemSerializer, CartBatchSerializer, CartItemSerializer, CartMergeSerializer, CartSerializer, CollectionSerializer, CollectionSummarySerializer, CustomerSerializer, DiscountSerializer, OrderSerializer, ProductSerializer, RelatedProductSerializer, ReviewSerializer, StockEntrySerializer, StockEventSerializer, StockMovementSerializer
+from .models import Cart, CartItem, ChangeLogEntry, Collection, Customer, Discount, Order, Product, RelatedProduct, Review, StockEntry
 
 # def product_list(request):
 #     return HttpResponse("Product List Page")
@@ -217,6 +241,14 @@ class ProductDetailView(GenericAPIView, RetrieveModelMixin, UpdateModelMixin, De
         return self.destroy(request, *args, **kwargs)
 
 
+class EchoBuffer:
+    """File-like object for csv.writer that hands each line back instead
+    of storing it, so a CSV can be streamed."""
+
+    def write(self, value):
+        return value
+
+
 # ================================================================================
 # ViewSet-Based Views (Most DRY approach)
 # ================================================================================
@@ -284,7 +316,8 @@ class ProductViewSet(ModelViewSet):
     """
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    # FuzzySearchFilter: typo-tolerant ?fuzzy=hedphones (store.trigrams)
+    filter_backends = [DjangoFilterBackend, SearchFilter, FuzzySearchFilter, OrderingFilter]
     # if i want to filter by collection_id
     # i.e. GET /products/?collection_id=1
     filterset_fields = ['collection_id',]
@@ -302,20 +335,48 @@ class ProductViewSet(ModelViewSet):
     # OPTIONAL: Override methods for custom behavior
     # ============================================================================
 
-    # def list(self, request, *args, **kwargs):
-    #     """Override to add custom list logic"""
-    #     print("Listing all products")
-    #     return super().list(request, *args, **kwargs)
+    def list(self, request, *args, **kwargs):
+        """
+        GET /products/?facets=true adds facet counts to the page:
+        products per collection_id and per price band, for the same
+        filters and search as the listed results.
+        """
+        query_stats.record('product-list', request)
+        # Whole pages are cached per query string; catalog_cache makes sure
+        # that when a page expires (or a product is edited) only one thread
+        # rebuilds it while the others wait or get the previous version
+        data = catalog_cache.get_or_compute(
+            request_cache_key('product-list', request),
+            lambda: self.list_data(request, *args, **kwargs),
+            version=catalog_version(),
+        )
+        return Response(data)
+
+    def list_data(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if request.query_params.get('facets') in ('1', 'true'):
+            queryset = self.filter_queryset(self.get_queryset())
+            response.data['facets'] = cached_product_facets(
+                queryset, request.query_params)
+        return response.data
 
     # def create(self, request, *args, **kwargs):
     #     """Override to add custom create logic"""
     #     print("Creating a new product")
     #     return super().create(request, *args, **kwargs)
 
-    # def retrieve(self, request, *args, **kwargs):
-    #     """Override to add custom retrieve logic"""
-    #     print(f"Retrieving product {kwargs.get('pk')}")
-    #     return super().retrieve(request, *args, **kwargs)
+    def retrieve(self, request, *args, **kwargs):
+        """
+        GET /products/{id}/ served from the two-tier product cache
+        (store.lookups.product_lookup); only misses reach the database.
+        """
+        product = product_lookup.get(kwargs['pk'])
+        if product is None:
+            raise Http404
+        # What get_object() would do after fetching the object
+        self.check_object_permissions(request, product)
+        serializer = self.get_serializer(product)
+        return Response(serializer.data)
 
     # ============================================================================
     # CUSTOM ACTIONS: Add extra endpoints
@@ -332,11 +393,144 @@ class ProductViewSet(ModelViewSet):
 
         Returns the 5 most recently created products
         """
-        recent_products = Product.objects.all().order_by('-id')[:5]
-        serializer = self.get_serializer(recent_products, many=True)
-        return Response(serializer.data)
+        query_stats.record('product-recent', request)
 
-    @action(detail=True, methods=['post'])
+        def compute():
+            recent_products = Product.objects.all().order_by('-id')[:5]
+            return self.get_serializer(recent_products, many=True).data
+
+        data = catalog_cache.get_or_compute(
+            request_cache_key('product-recent', request), compute,
+            version=catalog_version())
+        return Response(data)
+
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        """
+        Custom endpoint: GET /products/autocomplete/?q=wire%20hea&limit=10
+
+        Search-as-you-type on product titles, most popular first. Served
+        from an in-memory prefix index (store.autocomplete), not the DB.
+        Add ?stats=true to get the size and memory use of the index.
+        """
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), MAX_LIMIT)
+        except ValueError:
+            limit = 10
+        data = {'results': title_index.search(request.query_params.get('q', ''), limit)}
+        if request.query_params.get('stats') in ('1', 'true'):
+            data['index'] = title_index.stats()
+        return Response(data)
+
+    @action(detail=False, methods=['get'])
+    def availability(self, request):
+        """
+        Custom endpoint: GET /products/availability/?ids=1,2,3
+
+        Stock status of many products at once (up to MAX_IDS):
+
+            {"products": {"1": "in", "2": "low", "3": "out"}, "unknown": [99]}
+
+        Add &inventory=true for the number of units instead of in/low/out.
+        Inventories come from a short-lived per-product cache, with one
+        query for the ids not cached (store.availability). The response
+        has an ETag: send it back in If-None-Match to get a 304 while
+        nothing changed.
+        """
+        raw = ','.join(request.query_params.getlist('ids'))
+        try:
+            ids = sorted({int(value) for value in raw.split(',') if value.strip()})
+        except ValueError:
+            raise ValidationError({'ids': 'Comma-separated product ids.'})
+        if not ids:
+            raise ValidationError({'ids': 'At least one product id is required.'})
+        if len(ids) > availability_setting('MAX_IDS'):
+            raise ValidationError({'ids': f"At most {availability_setting('MAX_IDS')} ids."})
+
+        found = inventories(ids)
+        with_inventory = request.query_params.get('inventory') in ('1', 'true')
+        data = {
+            'products': {str(product_id): found[product_id] if with_inventory
+                         else stock_status(found[product_id])
+                         for product_id in ids if product_id in found},
+            'unknown': [product_id for product_id in ids if product_id not in found],
+        }
+        etag = '"%s"' % hashlib.md5(json.dumps(data, sort_keys=True).encode()).hexdigest()
+        headers = {'ETag': etag,
+                   'Cache-Control': f"max-age={availability_setting('TIMEOUT')}"}
+        if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+        if etag in if_none_match or '*' in if_none_match:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(data, headers=headers)
+
+    @action(detail=False, methods=['get'], url_path='low-stock',
+            permission_classes=[IsAdminUser])
+    def low_stock(self, request):
+        """
+        Custom endpoint: GET /products/low-stock/?status=low (staff only)
+
+        CSV of the products low on available stock (?status=out: out of
+        stock), streamed while it is read: only the matching rows are
+        fetched, in chunks, through the partial indexes (see ProductQuerySet).
+        """
+        status_param = request.query_params.get('status', Product.STOCK_LOW)
+        if status_param not in (Product.STOCK_LOW, Product.STOCK_OUT):
+            raise ValidationError({'status': 'Must be low or out.'})
+        # Fewest units first. The few matching rows are sorted after the
+        # index lookups (ORDER BY id alone would tempt a full rowid scan)
+        rows = (Product.objects.stock_status(status_param).order_by('available', 'id')
+                .annotate(available_units=F('available'))
+                .values_list('id', 'title', 'collection_id', 'inventory', 'available_units')
+                .iterator(chunk_size=2000))
+
+        def lines():
+            writer = csv.writer(EchoBuffer())
+            yield writer.writerow(['id', 'title', 'collection_id', 'inventory', 'available'])
+            for row in rows:
+                yield writer.writerow(row)
+
+        response = StreamingHttpResponse(lines(), content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="{status_param}-stock.csv"'
+        return response
+
+    @action(detail=True, methods=['get'])
+    def stock(self, request, pk=None):
+        """
+        Custom endpoint: GET /products/{id}/stock/
+
+        Stock from the inventory ledger (store.ledger): the inventory
+        snapshot, the pending deltas not yet compacted into it, what is
+        available, and the 20 latest ledger entries.
+        """
+        try:
+            pk = int(pk)
+        except ValueError:
+            raise Http404
+        product = with_available(Product.objects.filter(pk=pk)) \
+            .values('id', 'inventory', 'pending', 'available').first()
+        if product is None:
+            raise Http404
+        entries = StockEntry.objects.filter(product_id=pk).order_by('-id')[:20]
+        return Response({
+            **product,
+            'entries': StockEntrySerializer(entries, many=True).data,
+        })
+
+    @action(detail=True, methods=['get'])
+    def related(self, request, pk=None):
+        """
+        Custom endpoint: GET /products/{id}/related/
+
+        "Customers also bought": the precomputed top-K co-occurring products
+        (see store.recommendations), read with one indexed query.
+        """
+        if product_lookup.get(pk) is None:
+            raise Http404
+        related = (RelatedProduct.objects.filter(product_id=pk)
+                   .select_related('related').order_by('rank'))
+        return Response(RelatedProductSerializer(related, many=True).data)
+
+    @action(detail=True, methods=['post'], permission_classes=[IsAdminUser])
     def discount(self, request, pk=None):
         """
         Custom endpoint: POST /products/{id}/discount/
@@ -345,15 +539,144 @@ class ProductViewSet(ModelViewSet):
         - detail=True → Detail endpoint (requires id)
         - methods=['post'] → Only POST requests allowed
 
-        Apply a discount to a specific product
+        Apply a discount to a specific product (staff only).
+        Body: {"percent": 10} or {"amount": 5}, optional "starts_at"/"ends_at".
+        With "preview": true nothing is changed; the response shows the
+        products that would be repriced and their new prices.
         """
         product = self.get_object()
-        discount_percent = request.data.get('percent', 10)
-        # Custom discount logic would go here
+        return self.create_discount(request, product=product)
+
+    @action(detail=False, methods=['post'], url_path='discount',
+            permission_classes=[IsAdminUser])
+    def bulk_discount(self, request):
+        """
+        Custom endpoint: POST /products/discount/?collection_id=1&price__gt=100
+
+        Discount every product matching the ProductFilter query parameters
+        (and/or "collection" in the body) with one UPDATE statement
+        (staff only). Repricing the whole catalog has to be asked for
+        explicitly with "all": true.
+        """
+        filters = {
+            key: request.query_params.getlist(key)
+            for key in ProductFilter.base_filters
+            if key in request.query_params
+        }
+        collection = request.data.get('collection')
+        if not filters and collection is None and request.data.get('all') not in (True, 'true', '1'):
+            raise ValidationError({'detail': 'Give a collection or product filters, '
+                                             'or "all": true to discount the whole catalog.'})
+        return self.create_discount(request, collection=collection, filters=filters)
+
+    def create_discount(self, request, collection=None, **target):
+        data = {
+            'starts_at': request.data.get('starts_at'),
+            'ends_at': request.data.get('ends_at'),
+            'collection': collection,
+        }
+        if 'amount' in request.data:
+            data.update(kind=Discount.KIND_FIXED, value=request.data['amount'])
+        elif 'percent' in request.data:
+            data.update(kind=Discount.KIND_PERCENT, value=request.data['percent'])
+        else:
+            raise ValidationError({'detail': 'Give "percent" or "amount".'})
+        serializer = DiscountSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+
+        if request.data.get('preview') in (True, 'true', '1'):
+            discount = Discount(**serializer.validated_data, **target)
+            try:
+                return Response(preview_discount(discount))
+            except DiscountError as error:
+                raise ValidationError({'detail': str(error)})
+
+        with transaction.atomic():
+            discount = serializer.save(**target)
+            # Scheduled for later: the apply_discounts sweeper will apply it
+            if discount.starts_at is None or discount.starts_at <= timezone.now():
+                try:
+                    apply_discount(discount)
+                except DiscountError as error:
+                    raise ValidationError({'detail': str(error)})
+
+        if discount.status == Discount.STATUS_ACTIVE:
+            message = f'Discount applied to {discount.product_count} products'
+        else:
+            message = f'Discount scheduled for {discount.starts_at}'
         return Response({
             'status': 'success',
-            'message': f'{discount_percent}% discount applied to {product.title}'
-        })
+            'message': message,
+            'discount': DiscountSerializer(discount).data,
+        }, status=status.HTTP_201_CREATED)
+
+
+class CollectionViewSet(ReadOnlyModelViewSet):
+    """
+    Collections for navigation menus:
+
+    - list: GET /collections/ → every collection with its featured product
+      and product count
+    - retrieve: GET /collections/{id}/ → the same for one collection
+
+    One query whatever the number of collections: the featured product
+    comes from a JOIN (select_related) and the count from a GROUP BY
+    (annotate), instead of 2 extra queries per collection. Responses are
+    cached under the catalog version, which store.signals bumps whenever
+    a product or collection is saved or deleted, so a menu is served from
+    the cache until the catalog actually changes.
+    """
+    queryset = Collection.objects.select_related('featured_product').annotate(
+        products_count=Count('products'))
+    serializer_class = CollectionSummarySerializer
+
+    def list(self, request, *args, **kwargs):
+        data = catalog_cache.get_or_compute(
+            request_cache_key('collection-list', request),
+            lambda: super(CollectionViewSet, self).list(request, *args, **kwargs).data,
+            version=catalog_version(),
+        )
+        return Response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        data = catalog_cache.get_or_compute(
+            request_cache_key(f'collection:{kwargs["pk"]}', request),
+            lambda: super(CollectionViewSet, self).retrieve(request, *args, **kwargs).data,
+            version=catalog_version(),
+        )
+        return Response(data)
+
+
+class CollectionProductViewSet(ReadOnlyModelViewSet):
+    """
+    A collection's products, A-Z: GET /collections/{collection_pk}/products/
+
+    Keyset (cursor) pagination on title, ordered by (title, id) over the
+    (collection_id, title, id) index, so every page costs the same. Pages
+    are cached per cursor under the catalog version, like the product list.
+    The collection is checked first through collection_lookup (cached), so
+    an unknown or malformed id is a 404 and never gets a cached page.
+    """
+    serializer_class = ProductSerializer
+    pagination_class = CollectionProductCursorPagination
+
+    def get_collection(self):
+        collection = collection_lookup.get(self.kwargs['collection_pk'])
+        if collection is None:
+            raise Http404
+        return collection
+
+    def get_queryset(self):
+        return Product.objects.filter(collection_id=self.get_collection().pk)
+
+    def list(self, request, *args, **kwargs):
+        collection = self.get_collection()
+        data = catalog_cache.get_or_compute(
+            request_cache_key(f'collection-products:{collection.pk}', request),
+            lambda: super(CollectionProductViewSet, self).list(request, *args, **kwargs).data,
+            version=catalog_version(),
+        )
+        return Response(data)
 
 
 class ReviewViewSet(ModelViewSet):
@@ -383,10 +706,108 @@ class CartViewSet(ModelViewSet):
     - update: PUT /carts/{id}/ → Full update
     - partial_update: PATCH /carts/{id}/ → Partial update
     - destroy: DELETE /carts/{id}/ → Delete cart
+
+    Custom action:
+    - merge: POST /carts/{id}/merge/ → Give the cart to a customer at login (staff)
+
+    Custom actions, with STORE_CART_STORE['ENABLED'] (store.cartstore):
+    - buffered_items: POST /carts/{id}/buffered-items/ → Change a line in the cache
+    - checkout: POST /carts/{id}/checkout/ → Write the cart to the DB now
+    While enabled, retrieve reads the cart from the store, so it includes
+    changes not flushed yet.
+
+    Carts may be spread over several databases (store.sharding): a cart
+    is read from the shard of its id, and the list gathers the newest
+    carts of every shard. Only then is the list paginated (CartPagination,
+    {count, next, previous, results}); with a single database it stays a
+    plain array, as before sharding.
     """
-    queryset = Cart.objects.prefetch_related('items__product').all()
+    # Products of the items come from product_lookup (see CartItemSerializer)
+    queryset = Cart.objects.prefetch_related('items').all()
     serializer_class = CartSerializer
 
+    @property
+    def pagination_class(self):
+        return CartPagination if len(cart_shards()) > 1 else None
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            return scatter_gather(queryset, ['-updated_at', '-id'])
+        return queryset.using(shard_for(self.kwargs.get('pk')))
+
+    def retrieve(self, request, *args, **kwargs):
+        if not cart_store_setting('ENABLED'):
+            return super().retrieve(request, *args, **kwargs)
+        return self.stored_cart_response(kwargs['pk'])
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        cart_store.discard(instance.pk)
+
+    @action(detail=True, methods=['post'], permission_classes=[IsAdminUser])
+    def merge(self, request, pk=None):
+        """
+        {"customer": 5}  (staff only: called by the login flow, which knows
+        the customer; a guest must not pick one)
+
+        The guest cart is merged into the customer's current cart (then
+        deleted), or becomes the customer's cart if they have none. A fixed
+        number of queries however big the carts are (store.carts).
+        Returns the customer's cart.
+        """
+        serializer = CartMergeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        customer = serializer.validated_data['customer']
+        cart = self.get_object()
+        target = customer_cart(customer, exclude=cart.pk)
+        try:
+            with cart_writes(cart.pk, target.pk if target else None):
+                merged = merge_guest_cart(cart, customer, target)
+        except CartError as error:
+            raise ValidationError({'detail': str(error)})
+        return Response(CartSerializer(self.get_queryset().using(merged._state.db)
+                                       .get(pk=merged.pk)).data)
+
+    @action(detail=True, methods=['post'], url_path='buffered-items')
+    def buffered_items(self, request, pk=None):
+        """
+        {"product": 1, "quantity": 2}                 → add 2 (negative removes)
+        {"product": 1, "quantity": 0, "mode": "set"}  → remove the line
+
+        Only the cache is written; flush_carts (or checkout) writes the
+        cart to the DB later, many carts per transaction.
+        """
+        if not cart_store_setting('ENABLED'):
+            raise Http404('The cart store is not enabled.')
+        serializer = BufferedCartItemSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        change = cart_store.add if data['mode'] == 'add' else cart_store.set_quantity
+        try:
+            entry = change(pk, data['product'].pk, data['quantity'])
+        except CartBusy as error:
+            return Response({'detail': str(error)}, status=status.HTTP_409_CONFLICT)
+        if entry is None:
+            raise Http404
+        return Response(CartSerializer(cart_store.as_cart(pk, entry)).data)
+
+    @action(detail=True, methods=['post'])
+    def checkout(self, request, pk=None):
+        """Flush the cart's pending changes and return it as stored in the DB."""
+        if cart_store_setting('ENABLED'):
+            result = cart_store.flush([pk])
+            if result['busy']:
+                return Response({'detail': f'Cart {pk} is busy.'},
+                                status=status.HTTP_409_CONFLICT)
+        return Response(CartSerializer(self.get_object()).data)
+
+    def stored_cart_response(self, pk):
+        entry = cart_store.get(pk)
+        if entry is None:
+            raise Http404
+        return Response(CartSerializer(cart_store.as_cart(pk, entry)).data)
+
 
 class CartItemViewSet(ModelViewSet):
     """
@@ -399,6 +820,315 @@ class CartItemViewSet(ModelViewSet):
     - update: PUT /cart-items/{id}/ → Full update
     - partial_update: PATCH /cart-items/{id}/ → Partial update
     - destroy: DELETE /cart-items/{id}/ → Delete cart item
+
+    Custom action:
+    - batch: POST /carts/{cart_id}/items/batch/ → Many changes in one request
     """
     queryset = CartItem.objects.all()
     serializer_class = CartItemSerializer
+
+    def get_queryset(self):
+        # Items of the cart in the URL, on the cart's shard (store.sharding)
+        cart_id = self.kwargs['cart_pk']
+        if cart_key(cart_id) is None:
+            raise Http404
+        return super().get_queryset().using(shard_for(cart_id)).filter(cart_id=cart_id)
+
+    def perform_create(self, serializer):
+        cart_id = cart_key(self.kwargs['cart_pk'])
+        if cart_id is None:
+            raise Http404
+        cart = get_object_or_404(Cart.objects.using(shard_for(cart_id)), pk=cart_id)
+        with cart_writes(cart.pk):
+            serializer.save(cart=cart)
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request, cart_pk=None):
+        """
+        {"operations": [
+            {"product": 1, "op": "set", "quantity": 2},
+            {"product": 2, "op": "increment", "quantity": -1},
+            {"product": 3, "op": "remove"}
+        ]}
+
+        Validates all products with one query and applies the batch in one
+        transaction (store.carts). Lines that end at 0 are removed.
+        Returns the cart with totals computed by the database.
+        """
+        serializer = CartBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        cart_id = cart_key(cart_pk)
+        if cart_id is None:
+            raise Http404
+        cart = get_object_or_404(Cart.objects.using(shard_for(cart_id)), pk=cart_id)
+        try:
+            with cart_writes(cart.pk):
+                result = apply_cart_operations(cart, serializer.validated_data['operations'])
+        except CartError as error:
+            raise ValidationError({'detail': str(error)})
+        cart.refresh_from_db(fields=['updated_at'])
+        items, total = cart_lines(cart)
+        return Response({
+            'id': cart.pk,
+            'items': items,
+            'total_price': total,
+            'created_at': cart.created_at,
+            'updated_at': cart.updated_at,
+            **result,
+        })
+
+    def perform_update(self, serializer):
+        with cart_writes(serializer.instance.cart_id):
+            super().perform_update(serializer)
+
+    def perform_destroy(self, instance):
+        with cart_writes(instance.cart_id):
+            super().perform_destroy(instance)
+
+
+class CartConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'The cart is being changed by another request; try again.'
+    default_code = 'cart_busy'
+
+
+def cart_writes(*cart_ids) -> ExitStack:
+    """
+    Context for writing cart lines directly to the database. With the cart
+    store on, such a write must not be overwritten by a later flush of an
+    older cached copy (see CartStore.write_through); carts are taken in id
+    order so two requests can't wait for each other.
+
+    A cart whose lock can't be taken in time is a 409 (CartConflict), and
+    the carts already taken are released.
+    """
+    stack = ExitStack()
+    if cart_store_setting('ENABLED'):
+        try:
+            for cart_id in sorted(str(cart_id) for cart_id in cart_ids if cart_id):
+                stack.enter_context(cart_store.write_through(cart_id))
+        except CartBusy as error:
+            stack.close()
+            raise CartConflict(str(error))
+    return stack
+
+
+class CustomerViewSet(ModelViewSet):
+    """
+    A complete ViewSet for Customer CRUD operations.
+
+    - list: GET /customers/?membership=G&name=Smi&email=john@
+    - create, retrieve, update, partial_update, destroy as usual
+
+    Listing uses cursor pagination in (last_name, first_name, id) order and
+    prefix-only filters (see CustomerFilter), so every page is an index
+    range scan even with millions of customers.
+    """
+    queryset = Customer.objects.all()
+    serializer_class = CustomerSerializer
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = CustomerFilter
+    pagination_class = CustomerCursorPagination
+
+
+class CustomerOrderViewSet(ReadOnlyModelViewSet):
+    """
+    A customer's order history: GET /customers/{customer_pk}/orders/
+
+    Newest first with cursor pagination. Line items and their products
+    are loaded with prefetch_related, so a page always costs 4 queries
+    (customer, orders, items, products) no matter how many items the
+    orders have. An unknown or malformed customer id is a 404.
+    """
+    serializer_class = OrderSerializer
+    pagination_class = OrderCursorPagination
+
+    def get_queryset(self):
+        # generics.get_object_or_404: a malformed id is a 404 too, not a ValueError
+        customer = generics.get_object_or_404(
+            Customer.objects.only('pk'), pk=self.kwargs['customer_pk'])
+        return Order.objects.filter(
+            customer_id=customer.pk
+        ).prefetch_related('items__product')
+
+
+# ================================================================================
+# Change feed (delta sync for downstream mirrors)
+# ================================================================================
+
+class ChangeFeedView(APIView):
+    """
+    Custom endpoint: GET /changes/?since=<seq>&limit=<n>
+
+    Returns what changed after `since`, oldest first, in batches of at most
+    `limit` log entries. Within a batch, entries for the same object are
+    compacted: only the latest action is returned, with the current data for
+    upserts. Clients store `next_since` and pass it back on the next call;
+    when `has_more` is False they are up to date.
+
+    The cost of a call depends on the batch size only (a range scan on the
+    primary key + one IN query per entity), not on the size of the catalog.
+
+    Assumes entries commit in seq order, which holds on SQLite only (see
+    ChangeLogEntry); other databases can skip entries for good.
+    """
+    default_limit = 500
+    max_limit = 5000
+
+    # entity name in the log -> (model, serializer used for upserts)
+    entities = {
+        'product': (Product, ProductSerializer),
+        'collection': (Collection, CollectionSerializer),
+        'review': (Review, ReviewSerializer),
+    }
+
+    def get(self, request):
+        try:
+            since = int(request.query_params.get('since', 0))
+            limit = int(request.query_params.get('limit', self.default_limit))
+        except ValueError:
+            return Response({'detail': 'since and limit must be integers.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, self.max_limit))
+
+        entries = list(
+            ChangeLogEntry.objects.filter(seq__gt=since)
+            .order_by('seq')
+            .values_list('seq', 'entity', 'object_id', 'action')[:limit]
+        )
+
+        # Compact: later entries for the same object replace earlier ones
+        latest = {}
+        for seq, entity, object_id, action in entries:
+            latest[(entity, object_id)] = (seq, action)
+
+        # Load current data for upserts with one query per entity
+        upsert_ids = {}
+        for (entity, object_id), (seq, action) in latest.items():
+            if action == ChangeLogEntry.ACTION_UPSERT:
+                upsert_ids.setdefault(entity, []).append(object_id)
+        objects = {}
+        for entity, ids in upsert_ids.items():
+            if entity in self.entities:
+                model, _ = self.entities[entity]
+                objects[entity] = model.objects.in_bulk(ids)
+
+        results = []
+        for (entity, object_id), (seq, action) in sorted(
+                latest.items(), key=lambda item: item[1][0]):
+            instance = objects.get(entity, {}).get(object_id)
+            if action == ChangeLogEntry.ACTION_UPSERT and instance is None:
+                # Deleted after this entry was written; a later entry says so,
+                # but reporting the delete now is just as correct
+                action = ChangeLogEntry.ACTION_DELETE
+            data = None
+            if instance is not None and action == ChangeLogEntry.ACTION_UPSERT:
+                data = self.entities[entity][1](instance).data
+            results.append({
+                'seq': seq,
+                'entity': entity,
+                'id': object_id,
+                'action': 'delete' if action == ChangeLogEntry.ACTION_DELETE else 'upsert',
+                'data': data,
+            })
+
+        next_since = entries[-1][0] if entries else since
+        has_more = len(entries) == limit
+        next_url = None
+        if has_more:
+            next_url = request.build_absolute_uri(
+                f'{request.path}?since={next_since}&limit={limit}')
+        return Response({
+            'since': since,
+            'next_since': next_since,
+            'has_more': has_more,
+            'next': next_url,
+            'results': results,
+        })
+
+
+class CacheMetricsView(APIView):
+    """
+    Custom endpoint: GET /cache-metrics/ (staff only)
+
+    Per-key counters of the catalog response cache in this process:
+    hits, misses, early_refreshes, stale_served, coalesced_waits and the
+    total time spent waiting (wait_seconds).
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(catalog_cache.metrics())
+
+
+class StatsView(APIView):
+    """
+    Custom endpoint: GET /stats/ (staff only)
+
+    Catalog numbers for the ops dashboard - price bands, stock buckets,
+    membership counts, order totals - from one aggregate query per table
+    (store.stats), cached.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(cached_catalog_stats())
+
+
+class StockMovementView(APIView):
+    """
+    Custom endpoint: POST /stock/movements/ (staff only)
+
+    {
+        "adjustments": [{"product": 1, "delta": -3}, {"product": 2, "delta": 10}],
+        "transfers": [{"from_product": 1, "to_product": 5, "quantity": 4}]
+    }
+
+    Applies the whole batch in one transaction, with one conditional UPDATE
+    per product (store.stock). Returns the new inventory of every changed
+    product. If any product would go below 0 nothing is applied and the
+    response is 409 with the shortages.
+    """
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        serializer = StockMovementSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            inventory = apply_stock_movements(**serializer.validated_data)
+        except StockError as error:
+            if not error.shortages:
+                raise ValidationError({'detail': str(error)})
+            return Response({'detail': str(error), 'shortages': error.shortages},
+                            status=status.HTTP_409_CONFLICT)
+        return Response({
+            'products': [{'id': product_id, 'inventory': inventory[product_id]}
+                         for product_id in sorted(inventory)],
+        })
+
+
+class StockEntryView(APIView):
+    """
+    Custom endpoint: POST /stock/entries/ (staff only)
+
+    [{"product": 1, "delta": -1, "reason": "sale"}, ...]
+
+    Appends stock events to the ledger with one INSERT, without locking
+    the products (store.ledger). The compact_stock_ledger command folds
+    them into Product.inventory later. Does not check available stock.
+    """
+    permission_classes = [IsAdminUser]
+    max_events = 1000
+
+    def post(self, request):
+        serializer = StockEventSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        events = serializer.validated_data
+        if not 0 < len(events) <= self.max_events:
+            raise ValidationError({'detail': f'Send 1 to {self.max_events} events.'})
+        product_ids = {event['product'] for event in events}
+        found = set(Product.objects.filter(id__in=product_ids).values_list('id', flat=True))
+        if product_ids - found:
+            raise ValidationError({'detail': f'Unknown products: {sorted(product_ids - found)}'})
+        entries = record_stock_events(events)
+        return Response({'recorded': len(entries)}, status=status.HTTP_201_CREATED)
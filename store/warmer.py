@@ -0,0 +1,264 @@
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection
+from django.http.request import split_domain_port, validate_host
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from store.caching import catalog_version, request_cache_key
+
+# Settings (all optional):
+# STORE_CACHE_WARMER = {
+#     'ON_STARTUP': False,          # warm in the background on the first request
+#     'AFTER_INVALIDATION': False,  # re-warm shortly after a product/collection changes
+#     'TOP': 50,                    # how many recorded signatures to warm
+#     'WORKERS': 4,                 # thread pool size
+#     'HOST': None,                 # Host header for warm-up requests (default:
+#                                   # the first concrete ALLOWED_HOSTS entry)
+# }
+#
+# The warm_cache command only helps with a cache the web workers share
+# (Redis, Memcached, ...): with the default per-process LocMemCache it
+# would warm its own memory and never see the signatures the workers
+# record, so it refuses to run (cache_is_shared). There, only the
+# in-process hook (ON_STARTUP / AFTER_INVALIDATION, schedule_warm) helps.
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ON_STARTUP': False,
+    'AFTER_INVALIDATION': False,
+    'TOP': 50,
+    'WORKERS': 4,
+    'HOST': None,
+}
+
+SIGNATURES_KEY = 'store:warm-signatures'
+MAX_SIGNATURES = 500
+FLUSH_EVERY = 50
+
+
+def cache_is_shared() -> bool:
+    """False for the default cache backends that live in one process
+    (LocMemCache, DummyCache)."""
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def warmer_setting(name):
+    return getattr(settings, 'STORE_CACHE_WARMER', {}).get(name, DEFAULTS[name])
+
+
+def allowed_hosts() -> list:
+    # What HttpRequest.get_host() accepts
+    hosts = settings.ALLOWED_HOSTS
+    if settings.DEBUG and not hosts:
+        hosts = ['.localhost', '127.0.0.1', '[::1]']
+    return hosts
+
+
+def warm_host() -> str:
+    """HOST, or a host ALLOWED_HOSTS accepts ('.example.com' -> 'example.com')."""
+    host = warmer_setting('HOST')
+    if host:
+        return host
+    for pattern in allowed_hosts():
+        if pattern != '*':
+            return pattern.lstrip('.')
+    return 'localhost'
+
+
+# ================================================================================
+# Recording what users ask for
+# ================================================================================
+
+class QueryStats:
+    """
+    Counts normalized catalog query signatures: (route, host, query string).
+
+    Counting happens in memory; every FLUSH_EVERY requests the counts are
+    merged into the shared cache so the warm_cache command (another process)
+    sees them. Only the MAX_SIGNATURES most frequent are kept.
+    """
+
+    def __init__(self):
+        self._pending = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, route: str, request) -> None:
+        if request.META.get('HTTP_X_CACHE_WARMER'):
+            return  # don't count our own warm-up requests
+        # Sorted by name only: repeated parameters keep their order
+        query = urlencode(sorted(
+            ((key, value)
+             for key in request.query_params.keys() if key != 'format'
+             for value in request.query_params.getlist(key)),
+            key=lambda item: item[0],
+        ))
+        with self._lock:
+            self._pending[(route, request.get_host(), query)] += 1
+            if sum(self._pending.values()) < FLUSH_EVERY:
+                return
+            pending, self._pending = self._pending, Counter()
+        self._flush(pending)
+
+    def top(self, limit: int) -> list:
+        """[(route, host, query), ...], most requested first."""
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+        counts = self._flush(pending)
+        return [signature for signature, _ in counts.most_common(limit)]
+
+    def counts(self) -> Counter:
+        return Counter(cache.get(SIGNATURES_KEY) or {})
+
+    def _flush(self, pending) -> Counter:
+        counts = self.counts()
+        counts.update(pending)
+        counts = Counter(dict(counts.most_common(MAX_SIGNATURES)))
+        cache.set(SIGNATURES_KEY, dict(counts), timeout=None)
+        return counts
+
+
+query_stats = QueryStats()
+
+
+def default_signatures(host: str) -> list:
+    """What to warm when nothing was recorded yet (e.g. right after a deploy):
+    the first list pages, ordering by price, each collection and `recent`."""
+    from store.models import Collection
+
+    signatures = [
+        ('product-list', host, ''),
+        ('product-list', host, 'page=2'),
+        ('product-list', host, 'ordering=price'),
+        ('product-recent', host, ''),
+    ]
+    for collection_id in Collection.objects.values_list('id', flat=True)[:50]:
+        signatures.append(('product-list', host, f'collection_id={collection_id}'))
+    return signatures
+
+
+# ================================================================================
+# Re-rendering
+# ================================================================================
+
+def route_views():
+    from store.views import ProductViewSet
+
+    return {
+        'product-list': ProductViewSet.as_view({'get': 'list'}),
+        'product-recent': ProductViewSet.as_view({'get': 'recent'}),
+    }
+
+
+def build_request(host: str, query: str):
+    # The recorded query string as is: a dict would keep one value of
+    # repeated parameters (?ordering=a&ordering=b) and warm another key
+    factory = APIRequestFactory()
+    path = f'/store/products/?{query}' if query else '/store/products/'
+    return factory.get(path, HTTP_HOST=host, HTTP_X_CACHE_WARMER='1')
+
+
+def is_warm(route: str, host: str, query: str, version) -> bool:
+    """True if a request with this signature would be a fresh cache hit."""
+    key = request_cache_key(route, Request(build_request(host, query)))
+    entry = cache.get(key)
+    return (entry is not None and entry['version'] == version
+            and entry['expires_at'] > time.time())
+
+
+def warm(signatures, workers=None) -> dict:
+    """
+    Render each signature through its view (so it lands in catalog_cache)
+    using a bounded thread pool. Returns a report with the elapsed time and
+    the share of signatures that are fresh cache hits before and after.
+    """
+    workers = workers or warmer_setting('WORKERS')
+    views = route_views()
+    hosts = allowed_hosts()
+    # A host no longer in ALLOWED_HOSTS would raise DisallowedHost
+    signatures = [s for s in dict.fromkeys(signatures)
+                  if s[0] in views and validate_host(split_domain_port(s[1])[0], hosts)]
+    version = catalog_version()
+    before = sum(is_warm(*signature, version) for signature in signatures)
+
+    def render(signature):
+        route, host, query = signature
+        try:
+            response = views[route](build_request(host, query))
+            return response.status_code
+        except Exception:
+            logger.exception('Warming %s failed', signature)
+            return 500
+        finally:
+            # Each worker thread has its own DB connection
+            connection.close()
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        statuses = list(pool.map(render, signatures))
+    elapsed = time.monotonic() - started
+
+    version = catalog_version()
+    after = sum(is_warm(*signature, version) for signature in signatures)
+    total = len(signatures) or 1
+    return {
+        'signatures': len(signatures),
+        'errors': sum(status >= 400 for status in statuses),
+        'seconds': round(elapsed, 3),
+        'hit_rate_before': round(before / total, 3),
+        'hit_rate_after': round(after / total, 3),
+    }
+
+
+def warm_top(limit=None, workers=None, host=None, defaults=True) -> dict:
+    limit = limit or warmer_setting('TOP')
+    host = host or warm_host()
+    signatures = query_stats.top(limit)
+    if defaults:
+        signatures += default_signatures(host)
+    return warm(signatures, workers=workers)
+
+
+# ================================================================================
+# Optional in-process hook
+# ================================================================================
+
+_timer = None
+_timer_lock = threading.Lock()
+
+
+def schedule_warm(delay=2.0) -> None:
+    """
+    Warm in a background thread after `delay` seconds. Calls made while a
+    warm-up is already scheduled are merged into it, so a bulk edit that
+    saves 1000 products triggers one warm-up, not 1000.
+    """
+    global _timer
+    with _timer_lock:
+        if _timer is not None:
+            return
+        _timer = threading.Timer(delay, _run_scheduled)
+        _timer.daemon = True
+        _timer.start()
+
+
+def _run_scheduled():
+    global _timer
+    with _timer_lock:
+        _timer = None
+    try:
+        report = warm_top()
+        logger.info('Catalog cache warmed: %s', report)
+    except Exception:
+        logger.exception('Catalog cache warm-up failed')
+    finally:
+        connection.close()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -84,6 +85,19 @@ DATABASES = {
     }
 }
 
+# Carts sharded over N databases (store.sharding). For local testing,
+# STORE_CART_SHARDS=4 adds 4 SQLite files; create their tables with
+# `python manage.py migrate --database carts_0` (and 1, 2, 3).
+CART_SHARD_COUNT = int(os.environ.get('STORE_CART_SHARDS', 0))
+if CART_SHARD_COUNT:
+    STORE_CART_SHARDS = [f'carts_{index}' for index in range(CART_SHARD_COUNT)]
+    for alias in STORE_CART_SHARDS:
+        DATABASES[alias] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / f'db_{alias}.sqlite3',
+        }
+    DATABASE_ROUTERS = ['store.sharding.CartShardRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators